@@ -5,10 +5,37 @@ Advanced AI Email Assistant with Claude Sonnet 4 and Tool Access
 
 import os
 import json
-import google.generativeai as genai
-from typing import Dict, List, Any, Optional
+import time
+import asyncio
+from typing import Dict, List, Any, Optional, Iterator, AsyncIterator
 from knowledge_base import knowledge_base, tool_system
 from private_knowledge_base import private_kb
+from container import container
+from circuit_breaker import CircuitBreaker, CircuitOpenError, OPEN
+from hedging import HedgedCaller
+from near_duplicate import NearDuplicateIndex, personalize_reply
+from intent_model import load_intent_model
+from body_trim import BodyTrimmer
+from thread_context import ThreadContextCache
+from llm_providers import LLMProvider, GeminiProvider, create_provider
+from prompt_templates import (ReplyPromptBuilder, PromptStats, CLASSIFY_CATEGORIES, CLASSIFY_URGENCIES,
+                              CLASSIFY_INSTRUCTIONS, classification_prompt)
+
+# "llm" classifies backlog emails with Gemini, LLM_CLASSIFY_BATCH_SIZE per call;
+# anything else keeps the keyword analysis
+LLM_CLASSIFICATION = os.environ.get("LLM_CLASSIFICATION", "keyword").lower() == "llm"
+LLM_CLASSIFY_BATCH_SIZE = int(os.environ.get("LLM_CLASSIFY_BATCH_SIZE", 10))
+
+# Local intent model (trained with intent_model.py) that classifies emails before
+# Gemini; only emails it is less than INTENT_MODEL_THRESHOLD sure of escalate
+INTENT_MODEL_FILE = os.environ.get("INTENT_MODEL_FILE", "intent_model.npz")
+INTENT_MODEL_THRESHOLD = float(os.environ.get("INTENT_MODEL_THRESHOLD", 0.8))
+
+# Follow-ups reuse their thread's classification, response info and turn summary
+THREAD_CACHE_ENABLED = os.environ.get("THREAD_CACHE_ENABLED", "True").lower() == "true"
+
+# Reuse the reply to a recently answered near-duplicate email instead of calling Gemini
+NEAR_DUP_ENABLED = os.environ.get("NEAR_DUP_ENABLED", "True").lower() == "true"
 
 class AIEmailAssistant:
     """Advanced AI Email Assistant with Claude Sonnet 4 and tool access."""
@@ -21,143 +48,287 @@ class AIEmailAssistant:
             # Don't raise error here, let the calling code handle the prompt
             self.api_key = None
         
-        # Configure Gemini if API key is available
-        if self.api_key:
-            genai.configure(api_key=self.api_key)
-            # Initialize Gemini model
-            self.model = genai.GenerativeModel('gemini-2.0-flash')
-        else:
-            self.model = None
-        
         # Assistant configuration
         self.assistant_name = "John"
         self.assistant_role = "Executive Assistant"
         self.company_name = "TechCorp Solutions"
+        
+        # Prompt templates are compiled once; the static prefix never changes
+        self.prompts = ReplyPromptBuilder(self.assistant_name, self.assistant_role, self.company_name)
+        self.prompt_stats = PromptStats()
+        # Quoted history, signatures and footers are cut before prompting;
+        # REPLY_/CLASSIFY_BODY_TOKEN_BUDGET cap what is left
+        self.reply_trimmer = BodyTrimmer.from_env("reply", token_budget=1000)
+        self.classify_trimmer = BodyTrimmer.from_env("classify", token_budget=500)
+        # Fail fast to the rule-based fallbacks while Gemini is down or slow
+        self.breaker = CircuitBreaker.from_env("gemini", failure_threshold=5, slow_call_seconds=20.0,
+                                               reset_timeout=30.0, call_timeout=30.0)
+        # Replies hedge past the observed p95 and retry transient errors within a budget
+        self.reply_hedger = HedgedCaller.from_env("gemini", budget=45.0, attempt_timeout=self.breaker.call_timeout)
+        self.reply_reuse = NearDuplicateIndex.from_env() if NEAR_DUP_ENABLED else None
+        self.threads = ThreadContextCache.from_env() if THREAD_CACHE_ENABLED else None
+        self.classify_stats = PromptStats()
+        self.classify_counts = {"emails": 0, "thread": 0, "local": 0, "batch_calls": 0, "single_calls": 0, "unclassified": 0}
+        self.classify_batch_size = max(1, LLM_CLASSIFY_BATCH_SIZE)
+        self.local_model = load_intent_model(INTENT_MODEL_FILE)
+        self.local_threshold = INTENT_MODEL_THRESHOLD
+        
+        # LLM_PROVIDER picks the engine: Gemini once an API key is available, or the local stub
+        self.provider: Optional[LLMProvider] = create_provider(self._instructions(), self.api_key)
     
     def initialize_gemini(self, api_key: str):
         """Initialize Gemini with the provided API key."""
         self.api_key = api_key
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        self.provider = GeminiProvider(api_key, self._instructions())
+    
+    def initialize_provider(self, provider: LLMProvider):
+        """Use another LLM provider, e.g. a StubProvider for benchmarks."""
+        self.provider = provider
+    
+    def _instructions(self) -> Dict[str, str]:
+        """System instruction per kind of request; replies carry the static prompt prefix."""
+        return {
+            "reply": self.prompts.static_prefix,
+            "classify": CLASSIFY_INSTRUCTIONS.render(company_name=self.company_name,
+                                                     categories=", ".join(CLASSIFY_CATEGORIES),
+                                                     urgencies=", ".join(CLASSIFY_URGENCIES))
+        }
+    
+    def _require_provider(self) -> LLMProvider:
+        """The provider, or an error that sends the caller to its fallback reply."""
+        if self.provider is None:
+            raise RuntimeError("No LLM provider configured (set GEMINI_API_KEY or LLM_PROVIDER=stub)")
+        return self.provider
+    
+    def _record_usage(self, build_seconds: float, response=None):
+        """Log and accumulate build time and token counts of one reply request."""
+        entry = self.prompt_stats.record(build_seconds, response)
+        print(f"  -> Prompt: {entry['prompt_tokens']} input tokens ({entry['cached_tokens']} cached), "
+              f"{entry['output_tokens']} output, built in {entry['build_ms']:.2f} ms")
+    
+    def get_prompt_stats(self) -> Dict[str, Any]:
+        """Prompt build time, token usage and body trimming so far."""
+        return dict(self.prompt_stats.get_stats(), body_trim=self.reply_trimmer.get_stats())
+    
+    def get_reply_call_stats(self) -> Dict[str, Any]:
+        """Attempts, hedges, wins and retries of reply requests, and the breaker state."""
+        return dict(self.reply_hedger.get_stats(), breaker=self.breaker.get_stats())
         
     def generate_intelligent_reply(self, sender: str, subject: str, body: str, 
-                                 sender_email: str = "") -> str:
-        """Generate intelligent, contextual reply using Claude Sonnet 4."""
+                                 sender_email: str = "", thread_id: str = "", mailbox: str = "") -> str:
+        """Generate intelligent, contextual reply using Claude Sonnet 4.
         
-        # Get appropriate information for this inquiry
-        inquiry_context = {
-            "sender": sender_email or sender,
-            "subject": subject,
-            "body": body
-        }
+        ``thread_id`` (Gmail threadId) and ``mailbox`` let follow-ups reuse
+        their thread's response info and see a summary of the earlier turns,
+        as long as the sender gets the same disclosure level.
+        """
         
-        response_info = tool_system.execute_tool("get_response_info", {
-            "inquiry_context": inquiry_context
-        })
+        sender_name, response_info, prompt, build_seconds = self._prepare_reply(sender, subject, body, sender_email,
+                                                                              thread_id, mailbox)
         
-        # Extract sender name
-        sender_name = sender.split('<')[0].strip() if '<' in sender else sender.split('@')[0]
+        reused = self._reused_reply(body, sender_name, response_info)
+        if reused is not None:
+            return reused
         
-        # Create system prompt
-        system_prompt = self._create_system_prompt(response_info)
+        try:
+            # Call the LLM; the static prefix travels as the reply system instruction
+            provider = self._require_provider()
+            response = self.reply_hedger.call(
+                lambda timeout: self.breaker.call(provider.generate, prompt, "reply", timeout)
+            )
+            self._record_usage(build_seconds, response)
+            
+            return self._remember_reply(body, response.text.strip(), sender_name, response_info, thread_id, mailbox)
+            
+        except CircuitOpenError as e:
+            print(f"LLM unavailable ({e}), using fallback reply")
+            return self._generate_fallback_reply(sender_name, subject, body, response_info)
+        except Exception as e:
+            print(f"LLM API error: {e}")
+            # Fallback to rule-based response
+            return self._generate_fallback_reply(sender_name, subject, body, response_info)
+    
+    async def generate_intelligent_reply_async(self, sender: str, subject: str, body: str,
+                                             sender_email: str = "", thread_id: str = "", mailbox: str = "") -> str:
+        """Async variant of generate_intelligent_reply for ASGI handlers."""
+        
+        sender_name, response_info, prompt, build_seconds = self._prepare_reply(sender, subject, body, sender_email,
+                                                                              thread_id, mailbox)
         
-        # Create user prompt
-        user_prompt = self._create_user_prompt(sender_name, subject, body, response_info)
+        reused = self._reused_reply(body, sender_name, response_info)
+        if reused is not None:
+            return reused
         
         try:
-            # Call Gemini
-            full_prompt = f"{system_prompt}\n\n{user_prompt}"
-            response = self.model.generate_content(full_prompt)
+            # Call the LLM without blocking the event loop
+            provider = self._require_provider()
+            response = await self.reply_hedger.call_async(
+                lambda timeout: self.breaker.call_async(provider.generate_async, prompt, "reply", timeout)
+            )
+            self._record_usage(build_seconds, response)
             
-            return response.text.strip()
+            return self._remember_reply(body, response.text.strip(), sender_name, response_info, thread_id, mailbox)
             
+        except CircuitOpenError as e:
+            print(f"LLM unavailable ({e}), using fallback reply")
+            return self._generate_fallback_reply(sender_name, subject, body, response_info)
         except Exception as e:
-            print(f"Gemini API error: {e}")
+            print(f"LLM API error: {e}")
             # Fallback to rule-based response
             return self._generate_fallback_reply(sender_name, subject, body, response_info)
     
-    def _create_system_prompt(self, response_info: Dict[str, Any]) -> str:
-        """Create system prompt for Claude with context and tools."""
+    def stream_intelligent_reply(self, sender: str, subject: str, body: str,
+                                 sender_email: str = "", thread_id: str = "", mailbox: str = "") -> Iterator[str]:
+        """Yield the reply as Gemini produces it, for drafting UIs.
         
-        disclosure_level = response_info.get("disclosure_level", "standard")
-        company_info = response_info.get("company_info", {})
-        contacts = response_info.get("contacts", [])
-        services = response_info.get("services", [])
-        policies = response_info.get("policies", {})
+        Streams are not hedged; the circuit breaker judges them on time to
+        first chunk. If Gemini fails before any text arrived, the rule-based
+        fallback reply is yielded instead; a failure mid-stream ends it.
+        """
         
-        system_prompt = f"""You are {self.assistant_name}, an {self.assistant_role} at {company_info.get('name', self.company_name)}. 
-
-Your role is to respond to emails in a professional, helpful, and human-like manner. You have access to company information and tools to provide accurate responses.
-
-COMPANY INFORMATION:
-- Name: {company_info.get('name', 'TechCorp Solutions')}
-- Website: {company_info.get('website', 'https://techcorp.com')}
-- Industry: {company_info.get('industry', 'Technology Solutions')}
-- Mission: {company_info.get('mission', 'Empowering businesses with innovative technology solutions')}
-
-DISCLOSURE LEVEL: {disclosure_level.upper()}
-Based on the inquiry context, you are authorized to share information at the {disclosure_level} level.
-
-AVAILABLE CONTACTS:
-"""
+        sender_name, response_info, prompt, build_seconds = self._prepare_reply(sender, subject, body, sender_email,
+                                                                              thread_id, mailbox)
         
-        for contact in contacts:
-            contact_info = contact["info"]
-            system_prompt += f"- {contact_info['name']} ({contact_info['title']}): {contact_info['email']}\n"
-        
-        if services:
-            system_prompt += "\nAVAILABLE SERVICES:\n"
-            for service in services:
-                system_prompt += f"- {service['name']}: {service['description']}\n"
-                if disclosure_level == "high":
-                    system_prompt += f"  Pricing: {service.get('pricing', 'Contact for pricing')}\n"
-        
-        system_prompt += f"""
-POLICIES:
-- Response Time: {policies.get('response_time', '24 hours')}
-- Emergency Contact: {policies.get('emergency', 'Call +1 (555) 911-HELP')}
-- Privacy: {policies.get('privacy', 'Strict confidentiality maintained')}
-
-INSTRUCTIONS:
-1. Respond in a warm, professional, and human-like tone
-2. Use the sender's name naturally in your response
-3. Provide relevant information based on the inquiry
-4. Respect disclosure levels - only share information appropriate for the {disclosure_level} level
-5. Include appropriate contact information when relevant
-6. Forward to appropriate team members when necessary
-7. Maintain conversation flow and context
-8. Be helpful but not overly verbose
-9. Sign your responses as "{self.assistant_name}"
-
-RESPONSE FORMAT:
-- Use proper email formatting
-- Include appropriate greeting and closing
-- Be conversational but professional
-- Provide clear next steps when applicable
-"""
+        reused = self._reused_reply(body, sender_name, response_info)
+        if reused is not None:
+            yield reused
+            return
         
-        return system_prompt
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError as e:
+            print(f"LLM unavailable ({e}), using fallback reply")
+            yield self._generate_fallback_reply(sender_name, subject, body, response_info)
+            return
+        
+        started = time.monotonic()
+        streamed = False
+        try:
+            response = self._require_provider().stream(prompt, "reply", self.breaker.call_timeout)
+            parts = []
+            for chunk in response:
+                if not streamed:
+                    streamed = True
+                    self.breaker.record_success(time.monotonic() - started)
+                if chunk.text:
+                    parts.append(chunk.text)
+                    yield chunk.text
+            self._record_usage(build_seconds, response)
+            self._remember_reply(body, "".join(parts).strip(), sender_name, response_info, thread_id, mailbox)
+        except GeneratorExit:
+            # The client went away
+            if not streamed:
+                self.breaker.record_abandoned()
+            raise
+        except Exception as e:
+            print(f"LLM API error: {e}")
+            self.breaker.record_failure()
+            if not streamed:
+                yield self._generate_fallback_reply(sender_name, subject, body, response_info)
     
-    def _create_user_prompt(self, sender_name: str, subject: str, body: str, 
-                           response_info: Dict[str, Any]) -> str:
-        """Create user prompt with email context."""
+    async def stream_intelligent_reply_async(self, sender: str, subject: str, body: str,
+                                             sender_email: str = "", thread_id: str = "", mailbox: str = "") -> AsyncIterator[str]:
+        """Async variant of stream_intelligent_reply for ASGI handlers and MCP."""
         
-        return f"""Please respond to this email:
-
-FROM: {sender_name}
-SUBJECT: {subject}
-BODY: {body}
-
-Context: This inquiry has been classified as {response_info.get('disclosure_level', 'standard')} disclosure level.
-
-Please provide a helpful, professional response that:
-1. Addresses their specific request
-2. Provides relevant information based on their inquiry
-3. Includes appropriate contact information if needed
-4. Maintains a warm, human-like tone
-5. Respects the disclosure level for this inquiry
-
-Respond as if you are {self.assistant_name}, the {self.assistant_role} at {self.company_name}."""
+        sender_name, response_info, prompt, build_seconds = self._prepare_reply(sender, subject, body, sender_email,
+                                                                              thread_id, mailbox)
+        
+        reused = self._reused_reply(body, sender_name, response_info)
+        if reused is not None:
+            yield reused
+            return
+        
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError as e:
+            print(f"LLM unavailable ({e}), using fallback reply")
+            yield self._generate_fallback_reply(sender_name, subject, body, response_info)
+            return
+        
+        started = time.monotonic()
+        streamed = False
+        try:
+            response = await asyncio.wait_for(
+                self._require_provider().stream_async(prompt, "reply", self.breaker.call_timeout),
+                self.breaker.call_timeout
+            )
+            parts = []
+            async for chunk in response:
+                if not streamed:
+                    streamed = True
+                    self.breaker.record_success(time.monotonic() - started)
+                if chunk.text:
+                    parts.append(chunk.text)
+                    yield chunk.text
+            self._record_usage(build_seconds, response)
+            self._remember_reply(body, "".join(parts).strip(), sender_name, response_info, thread_id, mailbox)
+        except (GeneratorExit, asyncio.CancelledError):
+            if not streamed:
+                self.breaker.record_abandoned()
+            raise
+        except Exception as e:
+            print(f"LLM API error: {e}")
+            self.breaker.record_failure()
+            if not streamed:
+                yield self._generate_fallback_reply(sender_name, subject, body, response_info)
+    
+    def _reused_reply(self, body: str, sender_name: str, response_info: Dict[str, Any]) -> Optional[str]:
+        """Reply to a recently answered near-duplicate, addressed to this sender."""
+        if self.reply_reuse is None:
+            return None
+        
+        # Only reuse replies written for the same disclosure level
+        entry = self.reply_reuse.lookup(body, scope=response_info.get("disclosure_level", "standard"))
+        if entry is None:
+            return None
+        
+        print("  -> Near-duplicate of a recently answered email, reusing its reply")
+        return personalize_reply(entry.reply, entry.sender_name, sender_name)
+    
+    def _remember_reply(self, body: str, reply: str, sender_name: str, response_info: Dict[str, Any],
+                        thread_id: str = "", mailbox: str = "") -> str:
+        """Keep a generated reply for near-duplicates and the thread's summary; returns the reply."""
+        if self.reply_reuse is not None and reply:
+            self.reply_reuse.add(body, reply, sender_name, scope=response_info.get("disclosure_level", "standard"))
+        if self.threads is not None and reply:
+            self.threads.remember_turn(mailbox, thread_id, sender_name, body, reply, response_info)
+        return reply
+    
+    def _thread(self, mailbox: str, thread_id: str, inquiry_context: Dict[str, Any]):
+        """Cached context of the thread, if it was built for this sender's disclosure level."""
+        if self.threads is None or not thread_id:
+            return None
+        return self.threads.get(mailbox, thread_id, knowledge_base.get_disclosure_level(inquiry_context))
+    
+    def _prepare_reply(self, sender: str, subject: str, body: str, sender_email: str = "", thread_id: str = "",
+                       mailbox: str = ""):
+        """Gather response info and render the per-email part of the prompt."""
+        
+        inquiry_context = {
+            "sender": sender_email or sender,
+            "subject": subject,
+            "body": body
+        }
+        thread = self._thread(mailbox, thread_id, inquiry_context)
+        if thread is not None and thread.response_info is not None:
+            # A follow-up at the same disclosure level keeps the contacts chosen for its thread
+            response_info = thread.response_info
+        else:
+            # Get appropriate information for this inquiry
+            response_info = tool_system.execute_tool("get_response_info", {
+                "inquiry_context": inquiry_context
+            })
+        
+        # Extract sender name
+        sender_name = sender.split('<')[0].strip() if '<' in sender else sender.split('@')[0]
+        
+        # Only the variable sections are rendered; the static prefix is on the model
+        started = time.perf_counter()
+        prompt = self.prompts.variable_prompt(response_info, sender_name, subject, self.reply_trimmer.trim(body),
+                                              thread.summary() if thread is not None else "")
+        build_seconds = time.perf_counter() - started
+        
+        return sender_name, response_info, prompt, build_seconds
     
     def _generate_fallback_reply(self, sender_name: str, subject: str, body: str, 
                                 response_info: Dict[str, Any]) -> str:
@@ -242,6 +413,160 @@ Best regards,
             "response_info": response_info
         }
     
+    @property
+    def llm_classification_enabled(self) -> bool:
+        """Whether backlog emails are classified by Gemini in batches."""
+        return LLM_CLASSIFICATION and self.provider is not None
+    
+    @property
+    def classification_enabled(self) -> bool:
+        """Whether classify_emails can classify anything (thread cache, local model or Gemini)."""
+        return self.threads is not None or self.local_model is not None or self.llm_classification_enabled
+    
+    @staticmethod
+    def _validate_classification(entry: Any) -> Optional[Dict[str, Any]]:
+        """Normalized classification, or None if the model's entry is unusable."""
+        if not isinstance(entry, dict):
+            return None
+        category = str(entry.get("category", "")).lower()
+        urgency = str(entry.get("urgency", "")).lower()
+        requires_reply = entry.get("requires_reply")
+        requires_forwarding = entry.get("requires_forwarding")
+        if category not in CLASSIFY_CATEGORIES or urgency not in CLASSIFY_URGENCIES:
+            return None
+        if not isinstance(requires_reply, bool) or not isinstance(requires_forwarding, bool):
+            return None
+        return {
+            "category": category,
+            "urgency": urgency,
+            "requires_reply": requires_reply,
+            "requires_forwarding": requires_forwarding
+        }
+    
+    def _classify_batch(self, emails: List[Dict[str, str]]) -> List[Optional[Dict[str, Any]]]:
+        """One model call for up to K emails; invalid or missing entries are None."""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(emails)
+        
+        started = time.perf_counter()
+        prompt = classification_prompt([dict(email, body=self.classify_trimmer.trim(email.get("body", "")))
+                                         for email in emails])
+        build_seconds = time.perf_counter() - started
+        
+        try:
+            response = self.breaker.call(self.provider.generate, prompt, "classify", self.breaker.call_timeout)
+            self.classify_stats.record(build_seconds, response)
+            entries = json.loads(response.text)
+        except CircuitOpenError:
+            return results
+        except Exception as e:
+            print(f"  -> LLM classification of {len(emails)} emails failed: {e}")
+            return results
+        
+        if not isinstance(entries, list):
+            return results
+        
+        for position, entry in enumerate(entries):
+            # Match by the index the prompt gave each email, else by position
+            index = entry.get("index") if isinstance(entry, dict) else None
+            slot = index - 1 if isinstance(index, int) and 1 <= index <= len(emails) else position
+            if slot < len(emails) and results[slot] is None:
+                results[slot] = self._validate_classification(entry)
+        return results
+    
+    def classify_emails(self, emails: List[Dict[str, str]]) -> List[Optional[Dict[str, Any]]]:
+        """Analyze many emails, packing up to ``classify_batch_size`` into one model call.
+        
+        ``emails`` are dicts with sender, subject, body and optionally
+        thread_id and mailbox. Follow-ups in a cached thread reuse its
+        classification when their sender gets the same disclosure level;
+        the local intent model scores the rest first, and only emails it is
+        unsure of escalate to one LLM call per chunk. Returns one analysis per email, shaped like
+        analyze_email_intent's, with the category, urgency and reply/forward
+        decisions plus ``source``, an ``action`` and ``reasoning``. Entries the
+        batch call gets wrong are retried with a call of their own; None means
+        that failed too (or nothing could classify the email) and the caller
+        should use its own fallback.
+        """
+        analyses = []
+        for start in range(0, len(emails), self.classify_batch_size):
+            chunk = emails[start:start + self.classify_batch_size]
+            classifications = [None] * len(chunk)
+            sources = ["llm"] * len(chunk)
+            threads = [self._thread(email.get("mailbox", ""), email.get("thread_id", ""), email) for email in chunk]
+            
+            for i, thread in enumerate(threads):
+                if thread is not None and thread.intent is not None:
+                    classifications[i] = thread.intent
+                    sources[i] = "thread"
+                    self.classify_counts["thread"] += 1
+            
+            pending = [i for i, classification in enumerate(classifications) if classification is None]
+            if pending and self.local_model is not None:
+                predictions = self.local_model.classify([chunk[i] for i in pending], self.local_threshold)
+                for i, predicted in zip(pending, predictions):
+                    classification = self._validate_classification(predicted)
+                    if classification is not None:
+                        classification["confidence"] = predicted["confidence"]
+                        classifications[i] = classification
+                        sources[i] = "local"
+                        self.classify_counts["local"] += 1
+            
+            escalated = [i for i, classification in enumerate(classifications) if classification is None]
+            if escalated and self.llm_classification_enabled:
+                for i, classification in zip(escalated, self._classify_batch([chunk[i] for i in escalated])):
+                    classifications[i] = classification
+                self.classify_counts["batch_calls"] += 1
+                
+                for i in escalated:
+                    # No per-email retries while the circuit is open
+                    if classifications[i] is None and len(escalated) > 1 and self.breaker.state != OPEN:
+                        classifications[i] = self._classify_batch([chunk[i]])[0]
+                        self.classify_counts["single_calls"] += 1
+            
+            for email, classification, source, thread in zip(chunk, classifications, sources, threads):
+                if classification is None:
+                    self.classify_counts["unclassified"] += 1
+                    analyses.append(None)
+                    continue
+                
+                if source == "thread":
+                    analyses.append({
+                        "intent": dict(classification, source=source),
+                        "response_info": thread.response_info,
+                        "reasoning": f"Thread: follow-up, keeping the thread's {classification['category']} classification"
+                    })
+                    continue
+                
+                analysis = self.analyze_email_intent(email.get("sender", ""), email.get("subject", ""),
+                                                     email.get("body", ""))
+                intent = analysis["intent"]
+                intent.update(classification)
+                intent["source"] = source
+                label = f"Local model ({classification['confidence']:.0%})" if source == "local" else "LLM"
+                analysis["reasoning"] = (f"{label}: {classification['category']}, {classification['urgency']} urgency "
+                                         f"(keywords suggest {intent['primary_intent']})")
+                
+                if intent["requires_reply"] and intent["requires_forwarding"]:
+                    intent["action"] = "both"
+                elif intent["requires_reply"]:
+                    intent["action"] = "reply"
+                elif intent["requires_forwarding"]:
+                    intent["action"] = "forward"
+                else:
+                    intent["action"] = "none"
+                if self.threads is not None:
+                    self.threads.remember_intent(email.get("mailbox", ""), email.get("thread_id", ""), intent, analysis["response_info"])
+                analyses.append(analysis)
+            
+            self.classify_counts["emails"] += len(chunk)
+        return analyses
+    
+    def get_classify_stats(self) -> Dict[str, Any]:
+        """Local decisions, model calls, fallbacks and token usage of classification."""
+        return dict(self.classify_counts, usage=self.classify_stats.get_stats(),
+                    body_trim=self.classify_trimmer.get_stats(),
+                    threads=self.threads.get_stats() if self.threads is not None else None)
+    
     def should_reply(self, intent_analysis: Dict[str, Any]) -> bool:
         """Determine if the email should receive a reply."""
         
@@ -297,5 +622,5 @@ Best regards,
         
         return "support@techcorp.com"
 
-# Global instance
-ai_assistant = AIEmailAssistant()
+# Global instance (built on first use; holds API clients, so not fork-safe)
+ai_assistant = container.register("ai_assistant", AIEmailAssistant, fork_safe=False)
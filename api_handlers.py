@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Framework-independent request handlers for the Email Assistant API
+Shared by the Flask server (api_server.py) and the ASGI server (asgi_server.py)
+"""
+
+import io
+from contextlib import redirect_stdout
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, Optional, Tuple
+
+from email_assistant import process_emails, get_contacts_version, CONTACTS
+from ai_assistant import ai_assistant
+from knowledge_base import knowledge_base
+from employee_data import employee_db, SecurityLevel
+from serialization import dumps
+
+# Streamed responses must reach the client unbuffered, including through nginx
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+class ApiError(Exception):
+    """Error that maps directly onto an HTTP error response"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+def data_versions() -> Tuple[int, int]:
+    """Current version counters of the data behind the cached endpoints"""
+    return (employee_db.version, get_contacts_version())
+
+def run_process_emails() -> Dict[str, Any]:
+    """Run process_emails and capture its console output as job data"""
+    output_buffer = io.StringIO()
+    with redirect_stdout(output_buffer):
+        process_emails()
+    
+    return {
+        'output': output_buffer.getvalue(),
+        'processed_at': datetime.utcnow().isoformat()
+    }
+
+def parse_security_level(security_level: str) -> SecurityLevel:
+    """Convert a security level string to the enum, defaulting to PUBLIC"""
+    try:
+        return SecurityLevel(security_level)
+    except ValueError:
+        return SecurityLevel.PUBLIC
+
+def prepare_email_analysis(data: Optional[Dict[str, Any]]) -> Tuple[Dict[str, str], Dict[str, Any], bool]:
+    """Validate an analyze request and run intent analysis.
+
+    Returns the email fields, the intent analysis and whether a reply is needed.
+    """
+    if not data or 'email' not in data:
+        raise ApiError('Email data is required', 400)
+
+    email_data = data['email']
+    email = {
+        'sender': email_data.get('sender', ''),
+        'subject': email_data.get('subject', ''),
+        'body': email_data.get('body', '')
+    }
+
+    intent_analysis = ai_assistant.analyze_email_intent(email['sender'], email['subject'], email['body'])
+    return email, intent_analysis, ai_assistant.should_reply(intent_analysis)
+
+def email_analysis_payload(intent_analysis: Dict[str, Any], should_reply: bool, reply_text: str) -> Dict[str, Any]:
+    """Build the analyze response once the optional reply has been generated"""
+    return {
+        'analysis': intent_analysis,
+        'should_reply': should_reply,
+        'reply_text': reply_text,
+        'forward_to': ai_assistant.get_forwarding_recipient(intent_analysis),
+        'timestamp': datetime.utcnow().isoformat()
+    }
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Event with a single-line JSON payload"""
+    return f"event: {event}\ndata: {dumps(data, pretty=False)}\n\n"
+
+def analysis_stream_events(intent_analysis: Dict[str, Any], should_reply: bool,
+                           chunks: Iterable[str]) -> Iterator[str]:
+    """SSE stream of an analysis: the analysis first, reply text as it arrives, then the full payload"""
+    yield sse_event('analysis', {'analysis': intent_analysis, 'should_reply': should_reply})
+    
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield sse_event('token', {'text': chunk})
+    
+    yield sse_event('done', email_analysis_payload(intent_analysis, should_reply, "".join(parts)))
+
+async def analysis_stream_events_async(intent_analysis: Dict[str, Any], should_reply: bool,
+                                       chunks: Optional[AsyncIterator[str]]) -> AsyncIterator[str]:
+    """Async variant of analysis_stream_events"""
+    yield sse_event('analysis', {'analysis': intent_analysis, 'should_reply': should_reply})
+    
+    parts = []
+    if chunks is not None:
+        async for chunk in chunks:
+            parts.append(chunk)
+            yield sse_event('token', {'text': chunk})
+    
+    yield sse_event('done', email_analysis_payload(intent_analysis, should_reply, "".join(parts)))
+
+def validate_send_request(data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Validate a send request"""
+    if not data or not all(k in data for k in ['to', 'subject', 'body']):
+        raise ApiError('to, subject, and body are required', 400)
+    return data
+
+def search_knowledge_payload(data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Search contacts, employees and response info for a query"""
+    if not data or 'query' not in data:
+        raise ApiError('Query is required', 400)
+
+    query = data['query']
+    inquiry_context = data.get('context', {})
+    security_level = data.get('security_level', 'public')
+    sec_level = parse_security_level(security_level)
+
+    # Search contacts with security level filtering
+    contacts = knowledge_base.search_contacts(query, inquiry_context)
+
+    # Search employees directly
+    employees = employee_db.search_employees(query, sec_level, inquiry_context)
+
+    # Get response info
+    response_info = knowledge_base.get_appropriate_response_info(inquiry_context)
+
+    return {
+        'contacts': contacts,
+        'employees': employees,
+        'response_info': response_info,
+        'security_level': security_level,
+        'timestamp': datetime.utcnow().isoformat()
+    }
+
+def config_payload() -> Dict[str, Any]:
+    """Get current configuration (served from the response cache, so static data only)"""
+    return {
+        'contacts': CONTACTS,
+        'llm': ai_assistant.provider.get_info() if ai_assistant.provider else None,
+        'timestamp': datetime.utcnow().isoformat()
+    }
+
+def llm_stats_payload() -> Dict[str, Any]:
+    """Live LLM provider counters; they change on every call, so never cached"""
+    provider = ai_assistant.provider
+    return {
+        'llm': provider.get_info() if provider else None,
+        'stats': provider.get_stats() if provider else None,
+        'timestamp': datetime.utcnow().isoformat()
+    }
+
+def list_employees_payload(security_level: str, department: str) -> Dict[str, Any]:
+    """List employees with security level filtering"""
+    inquiry_context = {}
+    sec_level = parse_security_level(security_level)
+
+    if department:
+        employees = employee_db.get_department_employees(department, sec_level, inquiry_context)
+    else:
+        # Get all employees (limited by security level)
+        employees = []
+        for emp_id, emp in employee_db.employees.items():
+            emp_info = emp.get_info_for_level(sec_level, inquiry_context)
+            emp_info["employee_id"] = emp_id
+            emp_info["security_level"] = sec_level.value
+            employees.append(emp_info)
+
+    return {
+        'employees': employees,
+        'count': len(employees),
+        'security_level': security_level,
+        'department': department,
+        'timestamp': datetime.utcnow().isoformat()
+    }
+
+def employee_payload(employee_id: str, security_level: str) -> Dict[str, Any]:
+    """Get specific employee information"""
+    inquiry_context = {}
+    sec_level = parse_security_level(security_level)
+
+    employee = employee_db.get_employee(employee_id)
+    if not employee:
+        raise ApiError('Employee not found', 404)
+
+    employee_info = employee.get_info_for_level(sec_level, inquiry_context)
+    employee_info["employee_id"] = employee_id
+    employee_info["security_level"] = sec_level.value
+
+    return {
+        'employee': employee_info,
+        'security_level': security_level,
+        'timestamp': datetime.utcnow().isoformat()
+    }
+
+def search_employees_payload(data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Search employees with security level filtering"""
+    if not data or 'query' not in data:
+        raise ApiError('Query is required', 400)
+
+    query = data['query']
+    security_level = data.get('security_level', 'public')
+    inquiry_context = data.get('context', {})
+    sec_level = parse_security_level(security_level)
+
+    employees = employee_db.search_employees(query, sec_level, inquiry_context)
+
+    return {
+        'employees': employees,
+        'count': len(employees),
+        'query': query,
+        'security_level': security_level,
+        'timestamp': datetime.utcnow().isoformat()
+    }
@@ -8,7 +8,7 @@ import os
 import json
 import uuid
 from datetime import datetime
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, stream_with_context
 from flask_cors import CORS
 from functools import wraps
 import threading
@@ -16,16 +16,27 @@ import time
 from typing import Dict, List, Any
 
 # Import the email assistant components
-from email_assistant import process_emails, get_gmail_service, get_message_body, create_message, send_message
+from email_assistant import get_gmail_service, create_message, send_message
 from ai_assistant import ai_assistant
-from knowledge_base import knowledge_base
-from employee_data import employee_db, SecurityLevel
+from api_handlers import (
+    ApiError, data_versions, run_process_emails, prepare_email_analysis, email_analysis_payload, validate_send_request,
+    analysis_stream_events, SSE_HEADERS,
+    search_knowledge_payload, config_payload, llm_stats_payload, list_employees_payload,
+    employee_payload, search_employees_payload
+)
+from response_cache import ResponseCache
+from rate_limiter import rate_limiter, RateLimitExceeded
+from serialization import FastJSONProvider
+from shutdown import shutdown
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)  # Compact orjson-backed jsonify
 CORS(app)  # Enable CORS for web applications
 
 # Configuration
 API_KEY = os.environ.get('EMAIL_ASSISTANT_API_KEY', 'your-secret-api-key-here')
+# Optional per-integrator keys (comma separated), each rate limited separately
+API_KEYS = {API_KEY} | {k.strip() for k in os.environ.get('EMAIL_ASSISTANT_API_KEYS', '').split(',') if k.strip()}
 PORT = int(os.environ.get('PORT', 5000))
 DEBUG = os.environ.get('DEBUG', 'False').lower() == 'true'
 
@@ -33,16 +44,81 @@ DEBUG = os.environ.get('DEBUG', 'False').lower() == 'true'
 jobs = {}
 job_lock = threading.Lock()
 
+# Cache for read-only endpoints, invalidated through data version counters
+response_cache = ResponseCache(max_entries=int(os.environ.get('RESPONSE_CACHE_SIZE', 512)))
+
 def require_api_key(f):
     """Decorator to require API key authentication"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
         api_key = request.headers.get('X-API-Key') or request.args.get('api_key')
-        if not api_key or api_key != API_KEY:
+        if not api_key or api_key not in API_KEYS:
             return jsonify({'error': 'Invalid or missing API key'}), 401
         return f(*args, **kwargs)
     return decorated_function
 
+def rate_limited(route_class: str):
+    """Decorator to apply the per-API-key rate and concurrency limits of a route class"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            api_key = request.headers.get('X-API-Key') or request.args.get('api_key')
+            try:
+                lease = rate_limiter.acquire(api_key, route_class)
+            except RateLimitExceeded as e:
+                response = jsonify({'error': e.reason, 'retry_after': e.retry_after_header})
+                response.status_code = 429
+                response.headers['Retry-After'] = e.retry_after_header
+                return response
+            
+            try:
+                response = f(*args, **kwargs)
+            except BaseException:
+                rate_limiter.release(lease)
+                raise
+            
+            if isinstance(response, app.response_class) and response.is_streamed:
+                # Hold the concurrency slot until the stream has been sent
+                response.call_on_close(lambda: rate_limiter.release(lease))
+            else:
+                rate_limiter.release(lease)
+            return response
+        return decorated_function
+    return decorator
+
+def cached_response(f):
+    """Decorator to cache a read-only endpoint and answer conditional requests.
+    
+    Responses are keyed by route, request arguments and data versions and carry
+    a strong ETag; a matching If-None-Match on GET returns 304 without a body.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        request_args = {
+            'query': {k: v for k, v in request.args.items() if k != 'api_key'},
+            'body': request.get_json(silent=True) if request.method == 'POST' else None,
+            'view_args': kwargs
+        }
+        
+        key = ResponseCache.make_key(request.endpoint, request_args, data_versions())
+        
+        def build():
+            response = app.make_response(f(*args, **kwargs))
+            return response.get_data(), response.status_code
+        
+        entry = response_cache.get_or_build(key, build)
+        
+        if request.method in ('GET', 'HEAD') and entry.matches(request.headers.get('If-None-Match')):
+            response = app.response_class(status=304)
+        else:
+            response = app.response_class(entry.body, status=entry.status, mimetype='application/json')
+        
+        if entry.status == 200:
+            response.headers['ETag'] = entry.etag
+            response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return decorated_function
+
 def create_job_response(job_id: str, status: str, data: Dict = None) -> Dict:
     """Create a standardized job response"""
     response = {
@@ -67,10 +143,12 @@ def root():
         'endpoints': {
             'health': 'GET /health',
             'config': 'GET /api/v1/config (requires API key)',
+            'llm_stats': 'GET /api/v1/llm/stats (requires API key)',
             'employees': 'GET /api/v1/employees (requires API key)',
             'employee': 'GET /api/v1/employees/{id} (requires API key)',
             'search_employees': 'POST /api/v1/employees/search (requires API key)',
             'analyze_email': 'POST /api/v1/emails/analyze (requires API key)',
+            'analyze_email_stream': 'POST /api/v1/emails/analyze/stream (requires API key, Server-Sent Events)',
             'process_emails': 'POST /api/v1/emails/process (requires API key)',
             'send_email': 'POST /api/v1/emails/send (requires API key)',
             'search_knowledge': 'POST /api/v1/knowledge/search (requires API key)',
@@ -93,32 +171,25 @@ def health_check():
 
 @app.route('/api/v1/emails/process', methods=['POST'])
 @require_api_key
+@rate_limited('llm')
 def process_emails_endpoint():
     """Process unread emails"""
+    if shutdown.requested:
+        return jsonify({'error': 'Server is shutting down'}), 503
+    
     try:
         job_id = str(uuid.uuid4())
         
         # Start processing in background thread
         def process_emails_background():
             try:
-                # Capture the output by redirecting print statements
-                import io
-                import sys
-                from contextlib import redirect_stdout
-                
-                output_buffer = io.StringIO()
-                with redirect_stdout(output_buffer):
-                    process_emails()
-                
-                output = output_buffer.getvalue()
+                # Capture the output of process_emails as job data
+                result = run_process_emails()
                 
                 with job_lock:
                     jobs[job_id].update({
                         'status': 'completed',
-                        'data': {
-                            'output': output,
-                            'processed_at': datetime.utcnow().isoformat()
-                        }
+                        'data': result
                     })
                     
             except Exception as e:
@@ -131,10 +202,8 @@ def process_emails_endpoint():
                         }
                     })
         
-        # Start background processing
-        thread = threading.Thread(target=process_emails_background)
-        thread.daemon = True
-        thread.start()
+        # Start background processing; shutdown waits for it instead of killing it
+        shutdown.start_thread(process_emails_background, name=f"process-emails-{job_id[:8]}")
         
         return jsonify(create_job_response(job_id, 'processing'))
         
@@ -143,52 +212,54 @@ def process_emails_endpoint():
 
 @app.route('/api/v1/emails/analyze', methods=['POST'])
 @require_api_key
+@rate_limited('llm')
 def analyze_email():
     """Analyze a single email"""
     try:
-        data = request.get_json()
-        
-        if not data or 'email' not in data:
-            return jsonify({'error': 'Email data is required'}), 400
-        
-        email_data = data['email']
-        sender = email_data.get('sender', '')
-        subject = email_data.get('subject', '')
-        body = email_data.get('body', '')
-        
-        # Use AI assistant to analyze the email
-        intent_analysis = ai_assistant.analyze_email_intent(sender, subject, body)
+        email, intent_analysis, should_reply = prepare_email_analysis(request.get_json())
         
         # Generate reply if needed
         reply_text = ""
-        if ai_assistant.should_reply(intent_analysis):
-            reply_text = ai_assistant.generate_intelligent_reply(sender, subject, body)
+        if should_reply:
+            reply_text = ai_assistant.generate_intelligent_reply(email['sender'], email['subject'], email['body'])
         
-        # Get forwarding recipient
-        recipient = ai_assistant.get_forwarding_recipient(intent_analysis)
+        return jsonify(email_analysis_payload(intent_analysis, should_reply, reply_text))
         
-        response = {
-            'analysis': intent_analysis,
-            'should_reply': ai_assistant.should_reply(intent_analysis),
-            'reply_text': reply_text,
-            'forward_to': recipient,
-            'timestamp': datetime.utcnow().isoformat()
-        }
+    except ApiError as e:
+        return jsonify({'error': e.message}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/v1/emails/analyze/stream', methods=['POST'])
+@require_api_key
+@rate_limited('llm')
+def analyze_email_stream():
+    """Analyze a single email and stream the reply as Server-Sent Events"""
+    try:
+        email, intent_analysis, should_reply = prepare_email_analysis(request.get_json())
         
-        return jsonify(response)
+        chunks = ()
+        if should_reply:
+            chunks = ai_assistant.stream_intelligent_reply(email['sender'], email['subject'], email['body'])
         
+        return app.response_class(
+            stream_with_context(analysis_stream_events(intent_analysis, should_reply, chunks)),
+            mimetype='text/event-stream',
+            headers=SSE_HEADERS
+        )
+        
+    except ApiError as e:
+        return jsonify({'error': e.message}), e.status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/v1/emails/send', methods=['POST'])
 @require_api_key
+@rate_limited('action')
 def send_email():
     """Send an email"""
     try:
-        data = request.get_json()
-        
-        if not data or not all(k in data for k in ['to', 'subject', 'body']):
-            return jsonify({'error': 'to, subject, and body are required'}), 400
+        data = validate_send_request(request.get_json())
         
         # Get Gmail service
         service = get_gmail_service()
@@ -198,7 +269,7 @@ def send_email():
             sender='me',
             to=data['to'],
             subject=data['subject'],
-            message_text=data['body']
+            body=data['body']
         )
         
         result = send_message(service, 'me', message)
@@ -212,51 +283,28 @@ def send_email():
         else:
             return jsonify({'error': 'Failed to send email'}), 500
             
+    except ApiError as e:
+        return jsonify({'error': e.message}), e.status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/v1/knowledge/search', methods=['POST'])
 @require_api_key
+@rate_limited('read')
+@cached_response
 def search_knowledge():
     """Search the knowledge base"""
     try:
-        data = request.get_json()
-        
-        if not data or 'query' not in data:
-            return jsonify({'error': 'Query is required'}), 400
-        
-        query = data['query']
-        inquiry_context = data.get('context', {})
-        security_level = data.get('security_level', 'public')
-        
-        # Convert string to SecurityLevel enum
-        try:
-            sec_level = SecurityLevel(security_level)
-        except ValueError:
-            sec_level = SecurityLevel.PUBLIC
-        
-        # Search contacts with security level filtering
-        contacts = knowledge_base.search_contacts(query, inquiry_context)
-        
-        # Search employees directly
-        employees = employee_db.search_employees(query, sec_level, inquiry_context)
-        
-        # Get response info
-        response_info = knowledge_base.get_appropriate_response_info(inquiry_context)
-        
-        return jsonify({
-            'contacts': contacts,
-            'employees': employees,
-            'response_info': response_info,
-            'security_level': security_level,
-            'timestamp': datetime.utcnow().isoformat()
-        })
+        return jsonify(search_knowledge_payload(request.get_json()))
         
+    except ApiError as e:
+        return jsonify({'error': e.message}), e.status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/v1/jobs/<job_id>', methods=['GET'])
 @require_api_key
+@rate_limited('read')
 def get_job_status(job_id):
     """Get job status"""
     with job_lock:
@@ -267,6 +315,7 @@ def get_job_status(job_id):
 
 @app.route('/api/v1/jobs', methods=['GET'])
 @require_api_key
+@rate_limited('read')
 def list_jobs():
     """List all jobs"""
     with job_lock:
@@ -278,19 +327,22 @@ def list_jobs():
 
 @app.route('/api/v1/config', methods=['GET'])
 @require_api_key
+@rate_limited('read')
+@cached_response
 def get_config():
     """Get current configuration"""
-    from email_assistant import CONTACTS
-    
-    return jsonify({
-        'contacts': CONTACTS,
-        'aws_region': 'us-east-1',
-        'bedrock_model': 'anthropic.claude-sonnet-4-5-20250929-v1:0',
-        'timestamp': datetime.utcnow().isoformat()
-    })
+    return jsonify(config_payload())
+
+@app.route('/api/v1/llm/stats', methods=['GET'])
+@require_api_key
+@rate_limited('read')
+def get_llm_stats():
+    """Get live LLM provider statistics (not cached)"""
+    return jsonify(llm_stats_payload())
 
 @app.route('/api/v1/config', methods=['PUT'])
 @require_api_key
+@rate_limited('action')
 def update_config():
     """Update configuration"""
     try:
@@ -313,102 +365,45 @@ def update_config():
 
 @app.route('/api/v1/employees', methods=['GET'])
 @require_api_key
+@rate_limited('read')
+@cached_response
 def list_employees():
     """List employees with security level filtering"""
     try:
         security_level = request.args.get('security_level', 'public')
         department = request.args.get('department', '')
-        inquiry_context = {}
-        
-        # Convert string to SecurityLevel enum
-        try:
-            sec_level = SecurityLevel(security_level)
-        except ValueError:
-            sec_level = SecurityLevel.PUBLIC
-        
-        if department:
-            employees = employee_db.get_department_employees(department, sec_level, inquiry_context)
-        else:
-            # Get all employees (limited by security level)
-            employees = []
-            for emp_id, emp in employee_db.employees.items():
-                emp_info = emp.get_info_for_level(sec_level, inquiry_context)
-                emp_info["employee_id"] = emp_id
-                emp_info["security_level"] = sec_level.value
-                employees.append(emp_info)
         
-        return jsonify({
-            'employees': employees,
-            'count': len(employees),
-            'security_level': security_level,
-            'department': department,
-            'timestamp': datetime.utcnow().isoformat()
-        })
+        return jsonify(list_employees_payload(security_level, department))
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/v1/employees/<employee_id>', methods=['GET'])
 @require_api_key
+@rate_limited('read')
+@cached_response
 def get_employee(employee_id):
     """Get specific employee information"""
     try:
         security_level = request.args.get('security_level', 'public')
-        inquiry_context = {}
-        
-        # Convert string to SecurityLevel enum
-        try:
-            sec_level = SecurityLevel(security_level)
-        except ValueError:
-            sec_level = SecurityLevel.PUBLIC
-        
-        employee = employee_db.get_employee(employee_id)
-        if not employee:
-            return jsonify({'error': 'Employee not found'}), 404
         
-        employee_info = employee.get_info_for_level(sec_level, inquiry_context)
-        employee_info["employee_id"] = employee_id
-        employee_info["security_level"] = sec_level.value
-        
-        return jsonify({
-            'employee': employee_info,
-            'security_level': security_level,
-            'timestamp': datetime.utcnow().isoformat()
-        })
+        return jsonify(employee_payload(employee_id, security_level))
         
+    except ApiError as e:
+        return jsonify({'error': e.message}), e.status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/v1/employees/search', methods=['POST'])
 @require_api_key
+@rate_limited('read')
 def search_employees():
     """Search employees with security level filtering"""
     try:
-        data = request.get_json()
-        
-        if not data or 'query' not in data:
-            return jsonify({'error': 'Query is required'}), 400
-        
-        query = data['query']
-        security_level = data.get('security_level', 'public')
-        inquiry_context = data.get('context', {})
-        
-        # Convert string to SecurityLevel enum
-        try:
-            sec_level = SecurityLevel(security_level)
-        except ValueError:
-            sec_level = SecurityLevel.PUBLIC
-        
-        employees = employee_db.search_employees(query, sec_level, inquiry_context)
-        
-        return jsonify({
-            'employees': employees,
-            'count': len(employees),
-            'query': query,
-            'security_level': security_level,
-            'timestamp': datetime.utcnow().isoformat()
-        })
+        return jsonify(search_employees_payload(request.get_json()))
         
+    except ApiError as e:
+        return jsonify({'error': e.message}), e.status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -427,4 +422,8 @@ if __name__ == '__main__':
     print(f"   API Key: {API_KEY[:10]}...")
     print("=" * 60)
     
-    app.run(host='0.0.0.0', port=PORT, debug=DEBUG)
+    try:
+        app.run(host='0.0.0.0', port=PORT, debug=DEBUG)
+    finally:
+        # Let running jobs finish their current email before exiting
+        shutdown.finish()
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Email Assistant ASGI API Server
+Serves the same /api/v1 routes and authentication as api_server.py on an
+event loop, so slow Gemini and Gmail calls do not tie up a worker each.
+
+Run with: uvicorn asgi_server:app --host 0.0.0.0 --port 5000
+"""
+
+import os
+import uuid
+import asyncio
+import contextlib
+from datetime import datetime
+from functools import wraps
+from typing import Any, Dict
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.background import BackgroundTask
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from email_assistant import get_gmail_service, create_message, send_message
+from ai_assistant import ai_assistant
+from api_handlers import (
+    ApiError, data_versions, run_process_emails, prepare_email_analysis, email_analysis_payload,
+    analysis_stream_events_async, SSE_HEADERS,
+    validate_send_request, search_knowledge_payload, config_payload, llm_stats_payload, list_employees_payload,
+    employee_payload, search_employees_payload
+)
+from response_cache import ResponseCache
+from rate_limiter import rate_limiter, RateLimitExceeded
+from serialization import dumps_bytes
+from shutdown import shutdown
+
+# Configuration
+API_KEY = os.environ.get('EMAIL_ASSISTANT_API_KEY', 'your-secret-api-key-here')
+# Optional per-integrator keys (comma separated), each rate limited separately
+API_KEYS = {API_KEY} | {k.strip() for k in os.environ.get('EMAIL_ASSISTANT_API_KEYS', '').split(',') if k.strip()}
+PORT = int(os.environ.get('PORT', 5000))
+DEBUG = os.environ.get('DEBUG', 'False').lower() == 'true'
+
+# In-memory storage for job tracking (single event loop, no lock needed)
+jobs: Dict[str, Dict[str, Any]] = {}
+# Running process_emails jobs, awaited on shutdown
+background_tasks = set()
+
+# Cache for read-only endpoints, invalidated through data version counters
+response_cache = ResponseCache(max_entries=int(os.environ.get('RESPONSE_CACHE_SIZE', 512)))
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered through the serialization layer"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
+
+async def _json_body(request: Request):
+    """Parse the request body as JSON, returning None when it is not JSON"""
+    try:
+        return await request.json()
+    except Exception:
+        return None
+
+def require_api_key(handler):
+    """Decorator to require API key authentication"""
+    @wraps(handler)
+    async def decorated_handler(request: Request):
+        api_key = request.headers.get('X-API-Key') or request.query_params.get('api_key')
+        if not api_key or api_key not in API_KEYS:
+            return FastJSONResponse({'error': 'Invalid or missing API key'}, status_code=401)
+        return await handler(request)
+    return decorated_handler
+
+def rate_limited(route_class: str):
+    """Decorator to apply the per-API-key rate and concurrency limits of a route class"""
+    def decorator(handler):
+        @wraps(handler)
+        async def decorated_handler(request: Request):
+            api_key = request.headers.get('X-API-Key') or request.query_params.get('api_key')
+            try:
+                # SQLite may wait on another worker's lock, so keep it off the event loop
+                lease = await run_in_threadpool(rate_limiter.acquire, api_key, route_class)
+            except RateLimitExceeded as e:
+                return FastJSONResponse(
+                    {'error': e.reason, 'retry_after': e.retry_after_header},
+                    status_code=429,
+                    headers={'Retry-After': e.retry_after_header}
+                )
+
+            try:
+                response = await handler(request)
+            except BaseException:
+                await run_in_threadpool(rate_limiter.release, lease)
+                raise
+
+            if isinstance(response, StreamingResponse):
+                # Hold the concurrency slot until the stream has been sent
+                response.background = BackgroundTask(run_in_threadpool, rate_limiter.release, lease)
+            else:
+                await run_in_threadpool(rate_limiter.release, lease)
+            return response
+        return decorated_handler
+    return decorator
+
+def cached_response(handler):
+    """Decorator to cache a read-only endpoint and answer conditional requests"""
+    @wraps(handler)
+    async def decorated_handler(request: Request):
+        request_args = {
+            'query': {k: v for k, v in request.query_params.items() if k != 'api_key'},
+            'body': await _json_body(request) if request.method == 'POST' else None,
+            'view_args': dict(request.path_params)
+        }
+
+        key = ResponseCache.make_key(handler.__name__, request_args, data_versions())
+        entry = response_cache.lookup(key)
+        if entry is None:
+            response = await handler(request)
+            entry = response_cache.store(key, response.body, response.status_code)
+
+        if request.method in ('GET', 'HEAD') and entry.matches(request.headers.get('If-None-Match')):
+            response = Response(status_code=304)
+        else:
+            response = Response(entry.body, status_code=entry.status, media_type='application/json')
+
+        if entry.status == 200:
+            response.headers['ETag'] = entry.etag
+            response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return decorated_handler
+
+def _error_response(e: Exception) -> FastJSONResponse:
+    """Map an exception onto the standard error response"""
+    if isinstance(e, ApiError):
+        return FastJSONResponse({'error': e.message}, status_code=e.status)
+    return FastJSONResponse({'error': str(e)}, status_code=500)
+
+async def root(request: Request):
+    """Root endpoint with API information"""
+    return FastJSONResponse({
+        'message': 'Email Assistant API Server',
+        'version': '1.0.0',
+        'status': 'running',
+        'server': 'asgi',
+        'endpoints': {
+            'health': 'GET /health',
+            'config': 'GET /api/v1/config (requires API key)',
+            'llm_stats': 'GET /api/v1/llm/stats (requires API key)',
+            'employees': 'GET /api/v1/employees (requires API key)',
+            'employee': 'GET /api/v1/employees/{id} (requires API key)',
+            'search_employees': 'POST /api/v1/employees/search (requires API key)',
+            'analyze_email': 'POST /api/v1/emails/analyze (requires API key)',
+            'analyze_email_stream': 'POST /api/v1/emails/analyze/stream (requires API key, Server-Sent Events)',
+            'process_emails': 'POST /api/v1/emails/process (requires API key)',
+            'send_email': 'POST /api/v1/emails/send (requires API key)',
+            'search_knowledge': 'POST /api/v1/knowledge/search (requires API key)',
+            'jobs': 'GET /api/v1/jobs (requires API key)',
+            'job_status': 'GET /api/v1/jobs/{id} (requires API key)'
+        },
+        'authentication': 'Include X-API-Key header or api_key query parameter',
+        'documentation': 'See API_DOCUMENTATION.md for detailed usage',
+        'timestamp': datetime.utcnow().isoformat()
+    })
+
+async def health_check(request: Request):
+    """Health check endpoint"""
+    return FastJSONResponse({
+        'status': 'healthy',
+        'timestamp': datetime.utcnow().isoformat(),
+        'version': '1.0.0'
+    })
+
+async def _process_emails_job(job_id: str):
+    """Run process_emails in the thread pool and record the job outcome"""
+    try:
+        result = await run_in_threadpool(run_process_emails)
+        jobs[job_id].update({'status': 'completed', 'data': result})
+    except Exception as e:
+        jobs[job_id].update({
+            'status': 'failed',
+            'data': {
+                'error': str(e),
+                'failed_at': datetime.utcnow().isoformat()
+            }
+        })
+
+@require_api_key
+@rate_limited('llm')
+async def process_emails_endpoint(request: Request):
+    """Process unread emails"""
+    if shutdown.requested:
+        return FastJSONResponse({'error': 'Server is shutting down'}, status_code=503)
+
+    try:
+        job_id = str(uuid.uuid4())
+        jobs[job_id] = {
+            'job_id': job_id,
+            'status': 'processing',
+            'timestamp': datetime.utcnow().isoformat(),
+            'data': {}
+        }
+
+        task = asyncio.get_running_loop().create_task(_process_emails_job(job_id))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+        return FastJSONResponse(jobs[job_id])
+    except Exception as e:
+        return _error_response(e)
+
+@require_api_key
+@rate_limited('llm')
+async def analyze_email(request: Request):
+    """Analyze a single email"""
+    try:
+        email, intent_analysis, should_reply = prepare_email_analysis(await _json_body(request))
+
+        # Generate reply if needed, awaiting Gemini instead of blocking a worker
+        reply_text = ""
+        if should_reply:
+            reply_text = await ai_assistant.generate_intelligent_reply_async(
+                email['sender'], email['subject'], email['body']
+            )
+
+        return FastJSONResponse(email_analysis_payload(intent_analysis, should_reply, reply_text))
+    except Exception as e:
+        return _error_response(e)
+
+@require_api_key
+@rate_limited('llm')
+async def analyze_email_stream(request: Request):
+    """Analyze a single email and stream the reply as Server-Sent Events"""
+    try:
+        email, intent_analysis, should_reply = prepare_email_analysis(await _json_body(request))
+
+        chunks = None
+        if should_reply:
+            chunks = ai_assistant.stream_intelligent_reply_async(email['sender'], email['subject'], email['body'])
+
+        return StreamingResponse(
+            analysis_stream_events_async(intent_analysis, should_reply, chunks),
+            media_type='text/event-stream',
+            headers=SSE_HEADERS
+        )
+    except Exception as e:
+        return _error_response(e)
+
+@require_api_key
+@rate_limited('action')
+async def send_email(request: Request):
+    """Send an email"""
+    try:
+        data = validate_send_request(await _json_body(request))
+
+        # The Gmail client is blocking, so run it in the thread pool
+        service = await run_in_threadpool(get_gmail_service)
+        message = create_message(
+            sender='me',
+            to=data['to'],
+            subject=data['subject'],
+            body=data['body']
+        )
+        result = await run_in_threadpool(send_message, service, 'me', message)
+
+        if result:
+            return FastJSONResponse({
+                'success': True,
+                'message_id': result['id'],
+                'timestamp': datetime.utcnow().isoformat()
+            })
+        return FastJSONResponse({'error': 'Failed to send email'}, status_code=500)
+    except Exception as e:
+        return _error_response(e)
+
+@require_api_key
+@rate_limited('read')
+@cached_response
+async def search_knowledge(request: Request):
+    """Search the knowledge base"""
+    try:
+        return FastJSONResponse(search_knowledge_payload(await _json_body(request)))
+    except Exception as e:
+        return _error_response(e)
+
+@require_api_key
+@rate_limited('read')
+async def get_job_status(request: Request):
+    """Get job status"""
+    job_id = request.path_params['job_id']
+    if job_id not in jobs:
+        return FastJSONResponse({'error': 'Job not found'}, status_code=404)
+    return FastJSONResponse(jobs[job_id])
+
+@require_api_key
+@rate_limited('read')
+async def list_jobs(request: Request):
+    """List all jobs"""
+    return FastJSONResponse({
+        'jobs': list(jobs.values()),
+        'count': len(jobs),
+        'timestamp': datetime.utcnow().isoformat()
+    })
+
+@require_api_key
+@rate_limited('read')
+@cached_response
+async def get_config(request: Request):
+    """Get current configuration"""
+    return FastJSONResponse(config_payload())
+
+@require_api_key
+@rate_limited('read')
+async def get_llm_stats(request: Request):
+    """Get live LLM provider statistics (not cached)"""
+    return FastJSONResponse(llm_stats_payload())
+
+@require_api_key
+@rate_limited('action')
+async def update_config(request: Request):
+    """Update configuration"""
+    data = await _json_body(request)
+    if not data:
+        return FastJSONResponse({'error': 'Configuration data is required'}, status_code=400)
+
+    return FastJSONResponse({
+        'success': True,
+        'message': 'Configuration updated (not persisted in this demo)',
+        'timestamp': datetime.utcnow().isoformat()
+    })
+
+@require_api_key
+@rate_limited('read')
+@cached_response
+async def list_employees(request: Request):
+    """List employees with security level filtering"""
+    try:
+        security_level = request.query_params.get('security_level', 'public')
+        department = request.query_params.get('department', '')
+        return FastJSONResponse(list_employees_payload(security_level, department))
+    except Exception as e:
+        return _error_response(e)
+
+@require_api_key
+@rate_limited('read')
+@cached_response
+async def get_employee(request: Request):
+    """Get specific employee information"""
+    try:
+        security_level = request.query_params.get('security_level', 'public')
+        return FastJSONResponse(employee_payload(request.path_params['employee_id'], security_level))
+    except Exception as e:
+        return _error_response(e)
+
+@require_api_key
+@rate_limited('read')
+async def search_employees(request: Request):
+    """Search employees with security level filtering"""
+    try:
+        return FastJSONResponse(search_employees_payload(await _json_body(request)))
+    except Exception as e:
+        return _error_response(e)
+
+async def not_found(request: Request, exc: Exception):
+    return FastJSONResponse({'error': 'Endpoint not found'}, status_code=404)
+
+async def internal_error(request: Request, exc: Exception):
+    return FastJSONResponse({'error': 'Internal server error'}, status_code=500)
+
+routes = [
+    Route('/', root, methods=['GET']),
+    Route('/health', health_check, methods=['GET']),
+    Route('/api/v1/emails/process', process_emails_endpoint, methods=['POST']),
+    Route('/api/v1/emails/analyze', analyze_email, methods=['POST']),
+    Route('/api/v1/emails/analyze/stream', analyze_email_stream, methods=['POST']),
+    Route('/api/v1/emails/send', send_email, methods=['POST']),
+    Route('/api/v1/knowledge/search', search_knowledge, methods=['POST']),
+    Route('/api/v1/jobs/{job_id}', get_job_status, methods=['GET']),
+    Route('/api/v1/jobs', list_jobs, methods=['GET']),
+    Route('/api/v1/config', get_config, methods=['GET']),
+    Route('/api/v1/config', update_config, methods=['PUT']),
+    Route('/api/v1/llm/stats', get_llm_stats, methods=['GET']),
+    Route('/api/v1/employees/search', search_employees, methods=['POST']),
+    Route('/api/v1/employees/{employee_id}', get_employee, methods=['GET']),
+    Route('/api/v1/employees', list_employees, methods=['GET']),
+]
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    # Stop intake in running jobs and give them until the deadline to finish
+    shutdown.request("server shutdown")
+    if background_tasks:
+        await asyncio.wait(background_tasks, timeout=shutdown.deadline)
+    # Drain and stop the shared send queue once no job uses it any more
+    await run_in_threadpool(shutdown.finish)
+
+app = Starlette(
+    debug=DEBUG,
+    lifespan=lifespan,
+    routes=routes,
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    exception_handlers={404: not_found, 500: internal_error}
+)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("🚀 Starting Email Assistant ASGI Server...")
+    print(f"   Port: {PORT}")
+    print(f"   Debug: {DEBUG}")
+    print(f"   API Key: {API_KEY[:10]}...")
+    print("=" * 60)
+
+    uvicorn.run(app, host='0.0.0.0', port=PORT)
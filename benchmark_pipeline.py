@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Pipeline Benchmark
+Runs synthetic emails through classification and reply generation against
+the deterministic StubProvider, so throughput and latency of the whole
+pipeline (prompt building, trimming, breaker, hedging, retries) can be
+measured and load-tested offline. Stub latency, slow-call share and error
+rate are configurable to see how the pipeline behaves when the LLM degrades.
+
+Usage:
+    python benchmark_pipeline.py --emails 500 --concurrency 16 --latency 0.2 --error-rate 0.05
+    python benchmark_pipeline.py --async --emails 2000 --concurrency 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+# Classification goes through the provider too; must be set before ai_assistant is imported
+os.environ.setdefault("LLM_CLASSIFICATION", "llm")
+
+from ai_assistant import ai_assistant
+from llm_providers import StubProvider
+
+SENDERS = ["Alice Martin <alice@example.com>", "Bob Chen <bob@example.org>", "Carla Diaz <carla@example.net>",
+           "Dev Patel <dev@example.com>", "Erin Walsh <erin@example.io>"]
+TOPICS = [
+    ("Pricing for {n} seats", "Hi, could you send a quote for {n} seats of the enterprise plan? We plan to buy this quarter."),
+    ("Login problem", "Hello, since this morning {n} of our users get an error when they log in. Can you help?"),
+    ("API integration", "We are integrating your API and the endpoint returns 500 for about {n} requests an hour. Any idea?"),
+    ("Open position", "I saw the job posting and would like to apply; my resume is attached. I have {n} years of experience."),
+    ("Thank you", "Thanks a lot for the quick turnaround on ticket {n}, everything works now."),
+    ("Board meeting", "The CEO asked for the figures before the board meeting on the {n}th, can you confirm?")
+]
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+def build_emails(count: int, seed: int, quoted_lines: int) -> List[Dict[str, str]]:
+    """Deterministic synthetic emails, optionally with quoted thread history"""
+    rng = random.Random(seed)
+    emails = []
+    for i in range(count):
+        subject, body = rng.choice(TOPICS)
+        n = rng.randint(2, 500)
+        history = "".join(f"> earlier message {i}, line {line}\n" for line in range(quoted_lines))
+        emails.append({
+            "sender": rng.choice(SENDERS),
+            "subject": subject.format(n=n),
+            "body": body.format(n=n) + "\n\nBest regards,\nThe customer\n"
+                    + (f"\nOn Monday, Support wrote:\n{history}" if history else "")
+        })
+    return emails
+
+def summarize(name: str, latencies: List[float], elapsed: float) -> Dict[str, float]:
+    return {
+        "stage": name,
+        "count": len(latencies),
+        "throughput_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 1)
+    }
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+def classify_stage(emails: List[Dict[str, str]], concurrency: int):
+    """Classify in batches of classify_batch_size, batches running concurrently"""
+    size = ai_assistant.classify_batch_size
+    batches = [emails[i:i + size] for i in range(0, len(emails), size)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda batch: timed(ai_assistant.classify_emails, batch), batches))
+    elapsed = time.perf_counter() - started
+
+    analyses = [analysis for batch_analyses, _ in results for analysis in batch_analyses]
+    # Per-email latency is the latency of the batch it was in
+    latencies = [latency for (batch_analyses, latency) in results for _ in batch_analyses]
+    return analyses, summarize("classify", latencies, elapsed)
+
+def reply_stage(emails: List[Dict[str, str]], concurrency: int):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(
+            lambda email: timed(ai_assistant.generate_intelligent_reply, email["sender"], email["subject"],
+                                email["body"]), emails))
+    elapsed = time.perf_counter() - started
+    return [reply for reply, _ in results], summarize("reply", [latency for _, latency in results], elapsed)
+
+async def reply_stage_async(emails: List[Dict[str, str]], concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(email):
+        async with semaphore:
+            started = time.perf_counter()
+            reply = await ai_assistant.generate_intelligent_reply_async(email["sender"], email["subject"],
+                                                                        email["body"])
+            return reply, time.perf_counter() - started
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(email) for email in emails))
+    elapsed = time.perf_counter() - started
+    return [reply for reply, _ in results], summarize("reply_async", [latency for _, latency in results], elapsed)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the email pipeline against the local stub LLM")
+    parser.add_argument("--emails", type=int, default=200, help="Number of synthetic emails")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent batches / replies in flight")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub latency per call in seconds")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Latency variation as a fraction")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Share of calls that are slow")
+    parser.add_argument("--slow-latency", type=float, default=1.0, help="Latency of slow calls in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls that fail")
+    parser.add_argument("--quoted-lines", type=int, default=0, help="Quoted history lines per email")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Generate replies with the async path")
+    parser.add_argument("--reuse", action="store_true", help="Keep near-duplicate reply reuse on")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    ai_assistant.initialize_provider(StubProvider(
+        ai_assistant._instructions(), latency=args.latency, jitter=args.jitter, slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency, error_rate=args.error_rate, seed=args.seed
+    ))
+    if not args.reuse:
+        # Synthetic emails repeat a few templates; measure generation, not reuse
+        ai_assistant.reply_reuse = None
+
+    emails = build_emails(args.emails, args.seed, args.quoted_lines)
+    print(f"🏁 {len(emails)} emails, concurrency {args.concurrency}, stub latency {args.latency * 1000:.0f} ms, "
+          f"error rate {args.error_rate:.0%}")
+
+    started = time.perf_counter()
+    analyses, classify_report = classify_stage(emails, args.concurrency)
+    to_reply = [email for email, analysis in zip(emails, analyses)
+                if analysis is not None and analysis["intent"].get("requires_reply")]
+    if args.use_async:
+        _, reply_report = asyncio.run(reply_stage_async(to_reply, args.concurrency))
+    else:
+        _, reply_report = reply_stage(to_reply, args.concurrency)
+    total = time.perf_counter() - started
+
+    report = {
+        "stages": [classify_report, reply_report],
+        "total_seconds": round(total, 2),
+        "emails_per_s": round(len(emails) / total, 1),
+        "unclassified": sum(analysis is None for analysis in analyses),
+        "provider": dict(ai_assistant.provider.get_info(), stats=ai_assistant.provider.get_stats()),
+        "reply_calls": ai_assistant.get_reply_call_stats(),
+        "classify": ai_assistant.get_classify_stats(),
+        "prompts": ai_assistant.get_prompt_stats()
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2, default=str))
+        return
+
+    print(f"{'stage':<12} {'count':>6} {'per s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for stage in report["stages"]:
+        print(f"{stage['stage']:<12} {stage['count']:>6} {stage['throughput_per_s']:>8} {stage['p50_ms']:>8} "
+              f"{stage['p95_ms']:>8} {stage['p99_ms']:>8} {stage['max_ms']:>8}")
+    print(f"\n📊 {report['emails_per_s']} emails/s overall in {report['total_seconds']}s, "
+          f"{report['unclassified']} unclassified")
+    calls = report["reply_calls"]
+    print(f"   Reply calls: {calls['attempts']} attempts, {calls['hedges']} hedges, {calls['retries']} retries, "
+          f"{calls['failures'] + calls['budget_exhausted']} fell back; breaker {calls['breaker']['state']}")
+    print(f"   Stub: {report['provider']['stats']}")
+    print(f"   Body tokens saved: {report['prompts']['body_trim']['tokens_saved']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Serialization Benchmark
+Compares the previous response encoding (json.dumps with indent=2 and
+sort_keys=True) against the serialization layer on representative payloads
+"""
+
+import argparse
+import json
+import timeit
+from datetime import datetime
+
+import serialization
+from employee_data import employee_db, SecurityLevel
+
+def build_payloads(scale: int):
+    """Build payloads shaped like the API and MCP responses."""
+    employees = []
+    for _ in range(scale):
+        for emp_id, emp in employee_db.employees.items():
+            info = emp.get_info_for_level(SecurityLevel.PUBLIC, {})
+            info["employee_id"] = emp_id
+            info["security_level"] = SecurityLevel.PUBLIC.value
+            employees.append(info)
+
+    full_records = [emp.to_dict() for emp in employee_db.employees.values()] * scale
+
+    return {
+        "list_employees": {
+            "employees": employees,
+            "count": len(employees),
+            "security_level": "public",
+            "department": "",
+            "timestamp": datetime.utcnow().isoformat()
+        },
+        "get_all_employees (mcp)": {
+            "status": "success",
+            "disclosure_level": "private",
+            "count": len(full_records),
+            "employees": full_records
+        },
+        "analyze_email": {
+            "analysis": {
+                "intent": {
+                    "primary_intent": "sales_inquiry",
+                    "urgency": "normal",
+                    "category": "sales",
+                    "requires_reply": True,
+                    "requires_forwarding": True,
+                    "disclosure_level": "standard"
+                }
+            },
+            "should_reply": True,
+            "reply_text": "Hi there,\n\nThank you for reaching out. " * 20,
+            "forward_to": "sales@techcorp.com",
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    }
+
+def legacy_dumps(obj):
+    """Encoding used before the serialization layer."""
+    return json.dumps(obj, indent=2, sort_keys=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON response serialization")
+    parser.add_argument("--scale", type=int, default=20, help="Replicate employee data this many times")
+    parser.add_argument("--number", type=int, default=200, help="Iterations per measurement")
+    args = parser.parse_args()
+
+    print(f"Encoder: {serialization.ENCODER}")
+    print(f"{'payload':<26}{'bytes before':>14}{'bytes after':>13}{'before (us)':>13}{'after (us)':>12}{'speedup':>9}")
+    print("-" * 87)
+
+    for name, payload in build_payloads(args.scale).items():
+        # Both encoders must describe the same document
+        assert json.loads(legacy_dumps(payload)) == serialization.loads(serialization.dumps_bytes(payload))
+
+        before = timeit.timeit(lambda: legacy_dumps(payload), number=args.number) / args.number
+        after = timeit.timeit(lambda: serialization.dumps_bytes(payload), number=args.number) / args.number
+        size_before = len(legacy_dumps(payload).encode("utf-8"))
+        size_after = len(serialization.dumps_bytes(payload))
+
+        print(f"{name:<26}{size_before:>14}{size_after:>13}{before * 1e6:>13.1f}{after * 1e6:>12.1f}{before / after:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
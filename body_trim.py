@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Email Body Trimming before prompting
+Cuts quoted reply history, signatures and legal footers out of an email body
+and caps what is left to a token budget, so long threads do not carry every
+earlier message into each prompt. Tokens are estimated locally from the
+character count; bytes and tokens saved are recorded per email
+"""
+
+import math
+import os
+import re
+import threading
+from typing import Any, Dict
+
+# Gemini averages about four characters per token on English text
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARKER = "\n[... message truncated]"
+
+# A closing only marks a signature when at most this many short name/contact
+# lines follow it
+MAX_SIGNATURE_LINES = 8
+MAX_SIGNATURE_LINE_WORDS = 6
+
+_REPLY_HEADER_RE = re.compile(
+    r"^(On\b[^\n]{0,200}(\n[^\n]{0,100})?\bwrote:\s*$|"
+    r"-{2,}\s*Original Message\s*-{2,}|"
+    r"_{10,}\s*\nFrom:|"
+    r"From:\s[^\n]+\n(Sent|Date):\s)",
+    re.IGNORECASE | re.MULTILINE
+)
+_QUOTED_LINE_RE = re.compile(r"^[ \t]*>[^\n]*\n?", re.MULTILINE)
+_SIGNATURE_RE = re.compile(r"^(--[ \t]*$|Sent from my\b|Get Outlook for\b)", re.IGNORECASE | re.MULTILINE)
+_CLOSING_RE = re.compile(
+    r"^[ \t]*((best|kind|warm|many)[ \t]+)?(regards|wishes|thanks|thank you|cheers|sincerely|best)\b[ \t,.!]*$",
+    re.IGNORECASE | re.MULTILINE
+)
+_FOOTER_RE = re.compile(
+    r"^[^\n]{0,20}(confidentiality notice|disclaimer:|this (e-?mail|message)( and any attachments)? "
+    r"(is|are|may be|contains?) (confidential|privileged|intended))",
+    re.IGNORECASE | re.MULTILINE
+)
+_GREETING_ONLY_RE = re.compile(r"^\s*(hi|hello|hey|dear|good (morning|afternoon|evening))\b[^\n]{0,60}\s*$",
+                               re.IGNORECASE)
+# Words that make a line prose rather than a name, title or contact detail
+_PROSE_WORDS = {"i", "we", "you", "please", "can", "could", "would", "need", "want", "the", "to", "for",
+                "and", "is", "are", "will", "this", "that", "it", "me", "us", "our", "your"}
+_BLANK_LINES_RE = re.compile(r"\n[ \t]*(\n[ \t]*)+")
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count, without a tokenizer round trip"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def strip_quoted_history(text: str) -> str:
+    """Drop everything from the first reply header on, and ">" quoted lines"""
+    match = _REPLY_HEADER_RE.search(text)
+    if match and text[:match.start()].strip():
+        text = text[:match.start()]
+    unquoted = _QUOTED_LINE_RE.sub("", text)
+    return unquoted if unquoted.strip() else text
+
+def _has_message(text: str) -> bool:
+    """Whether ``text`` says more than a greeting"""
+    return bool(text.strip()) and not _GREETING_ONLY_RE.match(text)
+
+def _is_name_block(lines) -> bool:
+    """Short lines of names, titles and contact details, with no prose"""
+    if len(lines) > MAX_SIGNATURE_LINES:
+        return False
+    for line in lines:
+        words = line.split()
+        if len(words) > MAX_SIGNATURE_LINE_WORDS or re.search(r"[?!]|\.$", line.strip()):
+            return False
+        if _PROSE_WORDS & {word.strip(",;:").lower() for word in words}:
+            return False
+    return True
+
+def strip_signature(text: str) -> str:
+    """Cut at a signature delimiter or legal footer, then at a closing that ends the message.
+
+    Only the last closing counts, and only when all that follows it is a
+    short name/contact block; nothing is cut if just a greeting would be left.
+    """
+    cuts = [match.start() for match in (_SIGNATURE_RE.search(text), _FOOTER_RE.search(text))
+            if match and _has_message(text[:match.start()])]
+    if cuts:
+        text = text[:min(cuts)]
+
+    closing = None
+    for closing in _CLOSING_RE.finditer(text):
+        pass
+    if closing is not None and _has_message(text[:closing.start()]):
+        tail = [line for line in text[closing.end():].splitlines() if line.strip()]
+        if _is_name_block(tail):
+            text = text[:closing.start()]
+    return text
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """Keep the start of ``text`` within ``budget`` estimated tokens, cut at a line or word"""
+    if budget <= 0 or estimate_tokens(text) <= budget:
+        return text
+    limit = budget * CHARS_PER_TOKEN - len(TRUNCATION_MARKER)
+    cut = text.rfind("\n", limit // 2, limit)
+    if cut < 0:
+        cut = text.rfind(" ", limit // 2, limit)
+    return text[:cut if cut > 0 else limit].rstrip() + TRUNCATION_MARKER
+
+class BodyTrimmer:
+    """Trims bodies for prompts and keeps what that saved.
+
+    ``token_budget`` caps each trimmed body (0 means no cap). Stats hold
+    totals plus the last email's entry.
+    """
+
+    def __init__(self, token_budget: int = 1000):
+        self.token_budget = token_budget
+        self._lock = threading.Lock()
+        self.emails = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.truncated = 0
+        self.last: Dict[str, Any] = {}
+
+    @classmethod
+    def from_env(cls, name: str, token_budget: int) -> "BodyTrimmer":
+        """Build a trimmer, allowing a <NAME>_BODY_TOKEN_BUDGET override"""
+        return cls(int(os.environ.get(f"{name.upper()}_BODY_TOKEN_BUDGET", token_budget)))
+
+    def trim(self, body: str) -> str:
+        body = body or ""
+        text = strip_signature(strip_quoted_history(body.replace("\r\n", "\n")))
+        text = _BLANK_LINES_RE.sub("\n\n", text).strip()
+        trimmed = truncate_to_tokens(text, self.token_budget)
+
+        entry = {
+            "bytes_in": len(body.encode("utf-8")),
+            "bytes_out": len(trimmed.encode("utf-8")),
+            "tokens_in": estimate_tokens(body),
+            "tokens_out": estimate_tokens(trimmed)
+        }
+        entry["bytes_saved"] = entry["bytes_in"] - entry["bytes_out"]
+        entry["tokens_saved"] = entry["tokens_in"] - entry["tokens_out"]
+        with self._lock:
+            self.emails += 1
+            self.bytes_in += entry["bytes_in"]
+            self.bytes_out += entry["bytes_out"]
+            self.tokens_in += entry["tokens_in"]
+            self.tokens_out += entry["tokens_out"]
+            self.truncated += trimmed is not text
+            self.last = entry
+        return trimmed
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "emails": self.emails,
+                "token_budget": self.token_budget,
+                "bytes_saved": self.bytes_in - self.bytes_out,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+                "tokens_saved": self.tokens_in - self.tokens_out,
+                "truncated": self.truncated,
+                "last": dict(self.last)
+            }
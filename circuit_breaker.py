@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Circuit Breaker for calls to external services
+Opens after consecutive failures or calls slower than a latency SLO, fails
+fast while open so callers go straight to their fallback, and lets a probe
+call through after a cool-down to decide whether to close again
+"""
+
+import asyncio
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Dict
+
+# Breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit is open")
+        self.name = name
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        """Retry-After value in whole seconds"""
+        return str(max(1, math.ceil(self.retry_after)))
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a latency SLO and per-call deadline.
+
+    A failure, or a success slower than ``slow_call_seconds``, counts toward
+    ``failure_threshold``; any fast success resets the count. Once open, calls
+    raise CircuitOpenError for ``reset_timeout`` seconds, after which
+    ``half_open_calls`` probes are let through: a good probe closes the
+    circuit, a bad one opens it again. ``call_timeout`` is the per-call
+    deadline: callers pass it to the client library as its request timeout,
+    and async calls are also cut off at it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, slow_call_seconds: float = 20.0,
+                 reset_timeout: float = 30.0, half_open_calls: int = 1, call_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.call_timeout = call_timeout
+
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self.stats = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0}
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> "CircuitBreaker":
+        """Build a breaker, allowing BREAKER_<NAME>_* overrides"""
+        prefix = f"BREAKER_{name.upper()}_"
+        breaker = cls(name, **defaults)
+        breaker.failure_threshold = int(os.environ.get(prefix + "FAILURES", breaker.failure_threshold))
+        breaker.slow_call_seconds = float(os.environ.get(prefix + "SLOW_SECONDS", breaker.slow_call_seconds))
+        breaker.reset_timeout = float(os.environ.get(prefix + "RESET_TIMEOUT", breaker.reset_timeout))
+        breaker.call_timeout = float(os.environ.get(prefix + "CALL_TIMEOUT", breaker.call_timeout))
+        return breaker
+
+    def before_call(self):
+        """Claim permission to call; raises CircuitOpenError when the circuit is open"""
+        with self._lock:
+            if self.state == OPEN:
+                waited = time.monotonic() - self._opened_at
+                if waited < self.reset_timeout:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpenError(self.name, self.reset_timeout - waited)
+                self.state = HALF_OPEN
+                self._probes = 0
+
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpenError(self.name, self.reset_timeout)
+                self._probes += 1
+
+            self.stats["calls"] += 1
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self.stats["opened"] += 1
+        print(f"⚠️  {self.name} circuit opened after {self.consecutive_failures} bad calls; "
+              f"using fallbacks for {self.reset_timeout:.0f}s")
+
+    def record_success(self, latency: float):
+        with self._lock:
+            if latency > self.slow_call_seconds:
+                self.stats["slow_calls"] += 1
+                self._record_bad()
+                return
+
+            if self.state != CLOSED:
+                print(f"✅ {self.name} circuit closed again")
+            self.state = CLOSED
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.stats["failures"] += 1
+            self._record_bad()
+
+    def _record_bad(self):
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.consecutive_failures >= self.failure_threshold):
+            self._open()
+
+    def record_abandoned(self):
+        """A call was cancelled before it finished; it proves nothing either way"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run ``func`` through the breaker.
+
+        The deadline is the caller's to pass on (e.g. as the client library's
+        request timeout); use ``call_timeout``.
+        """
+        self.before_call()
+        started = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            self.record_abandoned()
+            raise
+        self.record_success(time.monotonic() - started)
+        return result
+
+    async def call_async(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Await ``func(*args, **kwargs)`` through the breaker, within ``call_timeout``"""
+        self.before_call()
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(func(*args, **kwargs), self.call_timeout)
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            self.record_abandoned()
+            raise
+        self.record_success(time.monotonic() - started)
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, state=self.state, consecutive_failures=self.consecutive_failures)
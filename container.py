@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Dependency Container with lazy module-level singletons
+Importing a module that registers a singleton has no side effects; the object
+is built on first use, or ahead of time in the gunicorn master with --preload
+so forked workers share it copy-on-write
+"""
+
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+class LazyProxy:
+    """Stand-in for a registered singleton that resolves it on first access"""
+
+    __slots__ = ("_container", "_name")
+
+    def __init__(self, container: "Container", name: str):
+        object.__setattr__(self, "_container", container)
+        object.__setattr__(self, "_name", name)
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._container.get(self._name), attr)
+
+    def __setattr__(self, attr: str, value: Any):
+        setattr(self._container.get(self._name), attr, value)
+
+    def __repr__(self) -> str:
+        state = "initialized" if self._container.is_initialized(self._name) else "lazy"
+        return f"<LazyProxy {self._name} ({state})>"
+
+class Container:
+    """Registry of named singleton factories"""
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._fork_safe: Dict[str, bool] = {}
+        # Re-entrant so factories can resolve their own dependencies
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory: Callable[[], Any], fork_safe: bool = True) -> LazyProxy:
+        """Register a factory and return a lazy proxy for its singleton.
+
+        fork_safe marks objects that hold no sockets, threads or file handles
+        and can therefore be built in the master before workers fork.
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._fork_safe[name] = fork_safe
+        return LazyProxy(self, name)
+
+    def get(self, name: str) -> Any:
+        """Get a singleton, building it on first use"""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                instance = self._factories[name]()
+                self._instances[name] = instance
+            return instance
+
+    def is_initialized(self, name: str) -> bool:
+        """Check whether a singleton has been built"""
+        return name in self._instances
+
+    def override(self, name: str, instance: Any):
+        """Replace a singleton with a prebuilt instance"""
+        with self._lock:
+            self._instances[name] = instance
+
+    def reset(self, name: str):
+        """Drop a singleton so the next access rebuilds it"""
+        with self._lock:
+            self._instances.pop(name, None)
+
+    def warm(self, names: Optional[Iterable[str]] = None) -> Dict[str, bool]:
+        """Build singletons ahead of time.
+
+        By default only fork-safe singletons are built, which is what the
+        gunicorn master should do before forking workers.
+        """
+        if names is None:
+            names = [name for name, safe in self._fork_safe.items() if safe]
+
+        for name in names:
+            self.get(name)
+
+        return {name: self.is_initialized(name) for name in self._factories}
+
+# Global container
+container = Container()
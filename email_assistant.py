@@ -4,23 +4,43 @@ AI Email Assistant - Intelligent email processing with Gemini AI
 """
 
 import os
+import sys
 import json
+import threading
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
-import google.generativeai as genai
 import base64
 from email.mime.text import MIMEText
 
 # Import the new AI assistant system
 from ai_assistant import ai_assistant
+from message_ledger import message_ledger, STEP_REPLIED, STEP_FORWARDED
+from mark_read_buffer import MarkReadBuffer
+from send_queue import send_queue
+from forward_digest import forward_digest
+from shutdown import shutdown, install_pipeline_hooks
+from mime_utils import extract_body
+from message_fetch import fetch_message, describe_attachments
+from intent_model import decision_log
 
 # Gemini API key prompt if not found
-def get_gemini_api_key():
-    """Prompt user for Gemini API key if not found in environment."""
+def get_gemini_api_key(interactive=None):
+    """Prompt user for Gemini API key if not found in environment.
+    
+    The prompt is only shown on an interactive terminal; headless processes
+    (gunicorn workers, MCP over stdio) get None and use rule-based replies.
+    """
     api_key = os.environ.get("GEMINI_API_KEY")
     
+    if interactive is None:
+        interactive = sys.stdin is not None and sys.stdin.isatty()
+    
+    if not api_key and not interactive:
+        print("⚠️  GEMINI_API_KEY not set; AI replies will use the rule-based fallback")
+        return None
+    
     if not api_key:
         print("🔑 Gemini API Key Required")
         print("=" * 50)
@@ -44,11 +64,12 @@ def get_gemini_api_key():
     
     return api_key
 
-# Get Gemini API key
-GEMINI_API_KEY = get_gemini_api_key()
-
-# Initialize AI assistant with API key
-ai_assistant.initialize_gemini(GEMINI_API_KEY)
+def ensure_gemini():
+    """Configure the AI assistant with a Gemini API key on first use."""
+    if ai_assistant.provider is None:
+        api_key = get_gemini_api_key()
+        if api_key:
+            ai_assistant.initialize_gemini(api_key)
 
 # --- CONFIGURATION ---
 CONTACTS = {
@@ -57,21 +78,35 @@ CONTACTS = {
     "technical": "idris.houiralami@berkeley.edu",
 }
 
-# Gemini Configuration
-GEMINI_MODEL = 'gemini-2.0-flash'  # Gemini Flash model
+# Incremented whenever CONTACTS changes so caches can detect stale config
+_contacts_version = 0
+
+def update_contacts(new_contacts):
+    """Merge new entries into CONTACTS and bump the contacts version."""
+    global _contacts_version
+    CONTACTS.update(new_contacts)
+    _contacts_version += 1
+    return CONTACTS
+
+def get_contacts_version():
+    """Get the current contacts configuration version."""
+    return _contacts_version
+
+# Address replies and forwards are sent from
+ASSISTANT_ADDRESS = "johnweakagent@gmail.com"
 
 # Gmail API scopes
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly', 
           'https://www.googleapis.com/auth/gmail.send',
           'https://www.googleapis.com/auth/gmail.modify']
 
-def get_gmail_service():
+def get_gmail_service(token_file='token.json'):
     """Get authenticated Gmail service."""
     creds = None
     
-    # Check if token.json exists
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
+    # Check if the token file exists
+    if os.path.exists(token_file):
+        creds = Credentials.from_authorized_user_file(token_file, SCOPES)
     
     # If there are no valid credentials, request authorization
     if not creds or not creds.valid:
@@ -82,7 +117,7 @@ def get_gmail_service():
             creds = flow.run_local_server(port=0)
         
         # Save credentials for next run
-        with open('token.json', 'w') as token:
+        with open(token_file, 'w') as token:
             token.write(creds.to_json())
     
     return build('gmail', 'v1', credentials=creds)
@@ -134,6 +169,25 @@ def generate_smart_reply(sender_name, subject, body, classification):
     # Default response
     return f"Hi {sender_name},\n\nThank you for your email. I've received your message and will ensure it gets the appropriate attention.\n\nBest regards,\nJohn"
 
+_pipeline_lock = threading.Lock()
+_pipeline_started = False
+
+def start_pipeline():
+    """Start the outbound send queue once for the life of the process.
+    
+    API jobs run process_emails concurrently on the shared queue, so no run
+    stops it; the shutdown hooks drain and stop it when the process exits.
+    """
+    global _pipeline_started
+    with _pipeline_lock:
+        if _pipeline_started:
+            return
+        send_queue.register_mailbox('me', get_gmail_service)
+        send_queue.compact()
+        send_queue.start()
+        install_pipeline_hooks()
+        _pipeline_started = True
+
 def process_emails():
     """Main function to fetch, analyze, and process emails."""
     
@@ -143,57 +197,137 @@ def process_emails():
         print(f"ERROR: Failed to authenticate with Gmail. Check credentials.json and ensure it's a 'Desktop App'. Details: {e}")
         return
 
+    ensure_gemini()
+
     # Initialize Gemini AI
     print("Connected to Gmail and Gemini AI. Starting email processing...")
     
-    # --- MAIN LOGIC ---
-    user_id = 'me'
+    start_pipeline()
     
     try:
-        # Get unread messages
-        results = service.users().messages().list(userId=user_id, labelIds=['UNREAD']).execute()
-        messages = results.get('messages', [])
+        process_mailbox(service)
+    except Exception as e:
+        print(f"Error processing emails: {e}")
+    
+    # Similar forwards from this run go out as digests
+    forward_digest.flush(force=True)
+    
+    # Give queued replies and forwards a chance to go out before returning;
+    # the queue keeps running and retries whatever is still backing off
+    if not send_queue.drain(float(os.environ.get("SEND_QUEUE_DRAIN_TIMEOUT", 120))):
+        print(f"{send_queue.pending_count()} outbound messages still queued for retry")
+
+def fetch_email(service, msg_id, user_id='me'):
+    """Fetch one message and extract the fields the pipeline works with."""
+    # Attachments are described, not downloaded
+    msg = fetch_message(service, msg_id, user_id)
+    
+    # Extract headers
+    headers = msg['payload'].get('headers', [])
+    sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown')
+    
+    return {
+        'id': msg_id,
+        'message': msg,
+        'sender': sender,
+        'subject': next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject'),
+        'message_id': next((h['value'] for h in headers if h['name'] == 'Message-ID'), ''),
+        'thread_id': msg.get('threadId', ''),
+        # Extract sender email
+        'sender_email': sender.split('<')[-1].split('>')[0] if '<' in sender else sender,
+        # Extract body (nested parts, HTML fallback, capped at MAX_BODY_BYTES)
+        'body': extract_body(msg)
+    }
+
+def iter_classified_emails(service, messages, mailbox, mark_read, user_id='me'):
+    """Yield (email, analysis) for each message that still needs processing.
+    
+    With the thread cache, the local intent model or LLM classification on,
+    emails are fetched and classified ``ai_assistant.classify_batch_size``
+    at a time, with at most one model call per batch.
+    Otherwise (and for emails the model could not classify) the analysis is
+    None and the caller analyzes the email itself.
+    """
+    batch_size = ai_assistant.classify_batch_size if ai_assistant.classification_enabled else 1
+    batch = []
+    
+    for message in messages:
+        if shutdown.requested:
+            break
         
-        if not messages:
-            print("No unread messages found.")
-            return
+        msg_id = message['id']
         
-        print(f"Found {len(messages)} unread messages to process.")
+        # Skip messages a previous run already finished or that only wait to be marked read
+        if message_ledger.is_processed(msg_id, mailbox) or msg_id in mark_read:
+            continue
         
-        for message in messages:
-            msg_id = message['id']
-            
-            # Get message details
-            msg = service.users().messages().get(userId=user_id, id=msg_id).execute()
-            
-            # Extract headers
-            headers = msg['payload'].get('headers', [])
-            sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown')
-            subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-            message_id = next((h['value'] for h in headers if h['name'] == 'Message-ID'), '')
+        email = fetch_email(service, msg_id, user_id)
+        # Thread ids are only unique within a mailbox
+        email['mailbox'] = mailbox
+        batch.append(email)
+        if len(batch) >= batch_size:
+            yield from _with_analyses(batch)
+            batch = []
+    
+    if batch and not shutdown.requested:
+        yield from _with_analyses(batch)
+
+def _with_analyses(batch):
+    if ai_assistant.classification_enabled:
+        return zip(batch, ai_assistant.classify_emails(batch))
+    return ((email, None) for email in batch)
+
+def process_mailbox(service, mailbox='me', sender_address=ASSISTANT_ADDRESS, max_messages=None):
+    """Process the unread messages of one mailbox.
+    
+    ``mailbox`` keys the message ledger, so several mailboxes can share it.
+    ``max_messages`` caps the work done per call, which keeps a busy mailbox
+    from monopolizing a shared worker. Replies go through the outbound send
+    queue, which must have the mailbox registered and be started; forwards go
+    through the forward digest aggregator in front of it. Processed messages are marked read in one batch at the end of
+    the call. Returns the number of messages handled;
+    Gmail API errors propagate to the caller.
+    """
+    user_id = 'me'
+    handled = 0
+    
+    # Get unread messages
+    results = service.users().messages().list(userId=user_id, labelIds=['UNREAD'], maxResults=max_messages).execute()
+    messages = results.get('messages', [])
+    
+    if not messages:
+        print("No unread messages found.")
+        return 0
+    
+    print(f"Found {len(messages)} unread messages to process.")
+    
+    mark_read = MarkReadBuffer(service, message_ledger, mailbox)
+    mark_read.recover()
+    
+    try:
+        for email, intent_analysis in iter_classified_emails(service, messages, mailbox, mark_read, user_id):
+            # Stop taking new emails once shutdown is requested
+            if shutdown.requested:
+                break
             
-            # Extract sender email
-            sender_email = sender.split('<')[-1].split('>')[0] if '<' in sender else sender
+            msg_id = email['id']
+            msg = email['message']
+            sender = email['sender']
+            subject = email['subject']
+            message_id = email['message_id']
+            sender_email = email['sender_email']
+            body = email['body']
+            thread_id = email['thread_id']
             
-            # Extract body
-            body = ""
-            if 'parts' in msg['payload']:
-                for part in msg['payload']['parts']:
-                    if part['mimeType'] == 'text/plain':
-                        data = part['body'].get('data', '')
-                        if data:
-                            body = base64.urlsafe_b64decode(data).decode('utf-8')
-            else:
-                data = msg['payload']['body'].get('data', '')
-                if data:
-                    body = base64.urlsafe_b64decode(data).decode('utf-8')
+            done_steps = message_ledger.get_steps(msg_id, mailbox)
             
             print(f"\nProcessing email (ID: {msg_id}) from {sender} with Subject: '{subject[:50]}...'")
 
             # AI Analysis
             try:
-                # Use the AI assistant for intelligent analysis
-                intent_analysis = ai_assistant.analyze_email_intent(sender, subject, body, sender_email)
+                # Use the AI assistant for intelligent analysis, unless the batch already did
+                if intent_analysis is None:
+                    intent_analysis = ai_assistant.analyze_email_intent(sender, subject, body, sender_email)
                 
                 # Extract analysis results
                 classification = intent_analysis["intent"]["category"]
@@ -201,6 +335,7 @@ def process_emails():
                 reply_needed = intent_analysis["intent"]["requires_reply"]
                 urgency = intent_analysis["intent"]["urgency"]
                 reasoning = intent_analysis["reasoning"]
+                source = intent_analysis["intent"].get("source", "llm")
                 
                 print(f"  -> AI Analysis: {classification} | Action: {action} | Urgency: {urgency}")
                 print(f"  -> Reasoning: {reasoning}")
@@ -256,19 +391,27 @@ def process_emails():
                     reply_needed = False
                     urgency = 'low'
                     reasoning = 'Rule-based: Default classification to support'
+                source = 'rules'
                 
                 print(f"  -> Fallback Analysis: {classification} | Action: {action} | Urgency: {urgency}")
                 print(f"  -> Reasoning: {reasoning}")
+            
+            # Training data for the local intent model
+            decision_log.record(subject, body, classification, urgency, reply_needed,
+                                action in ('forward', 'both'), source)
 
             # Process based on analysis
-            if reply_needed:
+            if reply_needed and done_steps & STEP_REPLIED:
+                print("  -> Reply already sent before restart, skipping")
+            elif reply_needed:
                 try:
                     # Generate intelligent reply
-                    reply_text = ai_assistant.generate_intelligent_reply(sender, subject, body, sender_email)
+                    reply_text = ai_assistant.generate_intelligent_reply(sender, subject, body, sender_email,
+                                                                         thread_id, mailbox)
                     
                     # Send reply
                     reply_message = create_message(
-                        sender="johnweakagent@gmail.com",
+                        sender=sender_address,
                         to=sender_email,
                         subject=f"Re: {subject}",
                         body=reply_text,
@@ -276,31 +419,38 @@ def process_emails():
                         references=message_id
                     )
                     
-                    send_message(service, user_id, reply_message)
-                    print(f"  -> ✅ Reply sent successfully")
+                    send_queue.enqueue(mailbox, msg_id, 'reply', reply_message)
+                    message_ledger.record(msg_id, STEP_REPLIED, mailbox)
+                    print(f"  -> ✅ Reply queued for sending")
                     
                 except Exception as e:
-                    print(f"  -> ❌ Failed to send reply: {e}")
+                    print(f"  -> ❌ Failed to prepare reply: {e}")
                     # Fallback to rule-based reply
                     reply_text = generate_smart_reply(sender.split('<')[0].strip(), subject, body, classification)
                     reply_message = create_message(
-                        sender="johnweakagent@gmail.com",
+                        sender=sender_address,
                         to=sender_email,
                         subject=f"Re: {subject}",
                         body=reply_text,
                         in_reply_to=message_id,
                         references=message_id
                     )
-                    send_message(service, user_id, reply_message)
-                    print(f"  -> ✅ Fallback reply sent successfully")
+                    send_queue.enqueue(mailbox, msg_id, 'reply', reply_message)
+                    message_ledger.record(msg_id, STEP_REPLIED, mailbox)
+                    print(f"  -> ✅ Fallback reply queued for sending")
 
             # Forward if needed
-            if action in ['forward', 'both']:
+            if action in ['forward', 'both'] and done_steps & STEP_FORWARDED:
+                print("  -> Already forwarded before restart, skipping")
+            elif action in ['forward', 'both']:
                 try:
                     # Get forwarding recipient
                     forward_to = ai_assistant.get_forwarding_recipient(intent_analysis if 'intent_analysis' in locals() else None)
                     
                     if forward_to:
+                        attachments = msg.get('attachments') or []
+                        attachment_line = f"Attachments: {describe_attachments(attachments)}\n" if attachments else ""
+                        
                         # Create forwarded message
                         forward_body = f"""
 --- FORWARDED EMAIL ---
@@ -310,7 +460,7 @@ AI Analysis: {reasoning}
 Original Email:
 From: {sender}
 Subject: {subject}
-
+{attachment_line}
 {body}
 
 ---
@@ -318,31 +468,36 @@ Forwarded by AI Email Assistant
 """
                         
                         forward_message = create_message(
-                            sender="johnweakagent@gmail.com",
+                            sender=sender_address,
                             to=forward_to,
                             subject=f"FWD: {subject}",
                             body=forward_body
                         )
                         
-                        send_message(service, user_id, forward_message)
-                        print(f"  -> ✅ Email forwarded to {forward_to}")
+                        forward_digest.add(mailbox, msg_id, forward_to, forward_message, sender_address,
+                                           sender, subject, body, urgency)
+                        message_ledger.record(msg_id, STEP_FORWARDED, mailbox)
+                        print(f"  -> ✅ Forward to {forward_to} queued for sending")
                     else:
                         print(f"  -> ⚠️ No forwarding recipient determined")
                         
                 except Exception as e:
                     print(f"  -> ❌ Failed to forward email: {e}")
 
-            # Mark as read
-            service.users().messages().modify(
-                userId=user_id, 
-                id=msg_id, 
-                body={'removeLabelIds': ['UNREAD']}
-            ).execute()
+            # Mark as read in the next batch; the ledger completes it after the flush
+            mark_read.add(msg_id)
             
-            print(f"  -> ✅ Email marked as read")
-
-    except Exception as e:
-        print(f"Error processing emails: {e}")
+            print(f"  -> ✅ Email queued to be marked read")
+            
+            handled += 1
+    finally:
+        # One batchModify for the whole poll
+        mark_read.flush()
+    
+    return handled
 
 if __name__ == "__main__":
+    shutdown.install_signal_handlers()
     process_emails()
+    # Runs the pipeline hooks, which drain and stop the send queue
+    shutdown.finish()
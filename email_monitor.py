@@ -6,48 +6,22 @@ Real-time Email Monitor - Automatically processes new emails
 import os
 import time
 import json
+import argparse
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
-import google.generativeai as genai
 import base64
 from email.mime.text import MIMEText
-
-# Gemini API key prompt if not found
-def get_gemini_api_key():
-    """Prompt user for Gemini API key if not found in environment."""
-    api_key = os.environ.get("GEMINI_API_KEY")
-    
-    if not api_key:
-        print("🔑 Gemini API Key Required")
-        print("=" * 50)
-        print("To use the AI email assistant, you need a Gemini API key.")
-        print("Get your key from: https://aistudio.google.com/")
-        print()
-        
-        while True:
-            api_key = input("Enter your Gemini API key: ").strip()
-            
-            if api_key and api_key.startswith("AIza"):
-                # Set for current session
-                os.environ["GEMINI_API_KEY"] = api_key
-                print("✅ API key set successfully!")
-                print()
-                return api_key
-            else:
-                print("❌ Invalid API key format. Gemini keys start with 'AIza'")
-                print("Please try again or visit https://aistudio.google.com/ to get your key.")
-                print()
-    
-    return api_key
-
-# Get Gemini API key
-GEMINI_API_KEY = get_gemini_api_key()
-
-# Configure Gemini
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel(GEMINI_MODEL)
+from message_ledger import message_ledger, STEP_REPLIED, STEP_FORWARDED
+from poll_scheduler import AdaptivePollScheduler
+from mark_read_buffer import MarkReadBuffer
+from send_queue import send_queue
+from forward_digest import forward_digest
+from shutdown import shutdown, install_pipeline_hooks
+from mime_utils import extract_body
+from message_fetch import fetch_message, describe_attachments
+from push_receiver import PushReceiver
 
 # Configuration
 CONTACTS = {
@@ -56,19 +30,16 @@ CONTACTS = {
     "technical": "idris.houiralami@berkeley.edu",
 }
 
-# Gemini Configuration
-GEMINI_MODEL = 'gemini-2.0-flash'
-
 # Gmail API setup
 SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
 CREDENTIALS_FILE = 'credentials.json'
 TOKEN_FILE = 'token.json'
 
-def get_gmail_service():
+def get_gmail_service(token_file=TOKEN_FILE):
     """Handles authentication and returns the Gmail service object."""
     creds = None
-    if os.path.exists(TOKEN_FILE):
-        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+    if os.path.exists(token_file):
+        creds = Credentials.from_authorized_user_file(token_file, SCOPES)
     
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
@@ -78,26 +49,14 @@ def get_gmail_service():
                 CREDENTIALS_FILE, SCOPES)
             creds = flow.run_local_server(port=0)
         
-        with open(TOKEN_FILE, 'w') as token:
+        with open(token_file, 'w') as token:
             token.write(creds.to_json())
 
     return build('gmail', 'v1', credentials=creds)
 
 def get_message_body(message):
     """Parses a Gmail message object to extract the plain text body."""
-    msg_parts = message.get('payload', {}).get('parts', [])
-    
-    for part in msg_parts:
-        if part['mimeType'] == 'text/plain':
-            data = part['body'].get('data')
-            if data:
-                return base64.urlsafe_b64decode(data).decode('utf-8')
-
-    data = message.get('payload', {}).get('body', {}).get('data')
-    if data:
-        return base64.urlsafe_b64decode(data).decode('utf-8')
-    
-    return ""
+    return extract_body(message)
 
 def create_message(sender, to, subject, message_text, in_reply_to=None, references=None):
     """Creates an email message to be sent via the Gmail API."""
@@ -255,120 +214,193 @@ If you have any questions in the meantime, feel free to reach out!
 Best regards,
 John"""
 
-def process_new_emails(service, processed_ids):
-    """Process new unread emails."""
+def list_unread_message_ids(service, user_id='me', max_messages=None):
+    """IDs of the unread inbox messages, following nextPageToken.
+    
+    Returns (message_ids, complete); complete is False when ``max_messages``
+    cut the listing short.
+    """
+    message_ids = []
+    page_token = None
+    
+    while True:
+        page_size = 500 if max_messages is None else min(500, max_messages - len(message_ids))
+        response = service.users().messages().list(userId=user_id, labelIds=['INBOX', 'UNREAD'],
+                                                   maxResults=page_size, pageToken=page_token).execute()
+        message_ids.extend(message['id'] for message in response.get('messages', []))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return message_ids, True
+        if max_messages is not None and len(message_ids) >= max_messages:
+            return message_ids[:max_messages], False
+
+def process_new_emails(service, ledger=message_ledger, mailbox='me', max_messages=None):
+    """Process new unread emails.
+    
+    ``mailbox`` keys the message ledger and ``max_messages`` caps the work
+    done per call (see mailbox_monitor.py). Returns the number of messages
+    handled; Gmail API errors are re-raised so the scheduler can back off.
+    """
+    return scan_unread_emails(service, ledger, mailbox, max_messages)[0]
+
+def scan_unread_emails(service, ledger=message_ledger, mailbox='me', max_messages=None):
+    """Process every unread inbox message, or the first ``max_messages``.
+    
+    Returns (handled, complete). complete is False when the listing was
+    capped or shutdown stopped the scan, so the inbox is not caught up.
+    """
     user_id = 'me'
+    handled = 0
+    mark_read = MarkReadBuffer(service, ledger, mailbox)
+    mark_read.recover()
     
     try:
-        # Get unread emails
-        results = service.users().messages().list(userId=user_id, labelIds=['INBOX', 'UNREAD']).execute()
-        messages = results.get('messages', [])
+        # List every page first; marking messages read would shift the pages
+        message_ids, complete = list_unread_message_ids(service, user_id, max_messages)
         
-        if not messages:
-            return processed_ids
+        if not message_ids:
+            return handled, complete
         
-        print(f"📧 Found {len(messages)} unread messages")
+        print(f"📧 Found {len(message_ids)} unread messages")
         
-        for message_stub in messages:
-            msg_id = message_stub['id']
-            
-            # Skip if already processed
-            if msg_id in processed_ids:
-                continue
-                
-            full_message = service.users().messages().get(userId=user_id, id=msg_id).execute()
-            
-            # Extract email details
-            headers = full_message['payload']['headers']
-            subject = next((header['value'] for header in headers if header['name'] == 'Subject'), 'No Subject')
-            sender = next((header['value'] for header in headers if header['name'] == 'From'), 'Unknown Sender')
-            body = get_message_body(full_message)
-            
-            print(f"\n🔄 Processing NEW email (ID: {msg_id}) from {sender}")
-            print(f"   Subject: '{subject[:50]}...'")
-            print(f"   Body: '{body[:100]}...'")
-            
-            # Rule-based classification with reply detection
-            subject_lower = subject.lower()
-            body_lower = body.lower()
+        for msg_id in message_ids:
+            if shutdown.requested:
+                return handled, False
+            if process_message(service, msg_id, ledger, mailbox=mailbox, mark_read=mark_read):
+                handled += 1
+        
+        return handled, complete
+        
+    except Exception as e:
+        print(f"❌ Error processing emails: {e}")
+        raise
+    finally:
+        # One batchModify for the whole poll
+        mark_read.flush()
+
+def process_message(service, msg_id, ledger=message_ledger, require_unread=False, mailbox='me', mark_read=None):
+    """Classify, reply to, forward and mark read a single message.
+    
+    Each completed step is recorded in the message ledger, so after a crash or
+    restart a message resumes at the first step that did not happen yet.
+    Replies are handed to the outbound send queue and forwards to the forward
+    digest aggregator. Marking read goes through ``mark_read`` (a MarkReadBuffer) when given,
+    otherwise it happens immediately. Returns True when the message was handled.
+    """
+    user_id = 'me'
+    
+    # Skip if already processed or only waiting to be marked read
+    if ledger.is_processed(msg_id, mailbox) or (mark_read is not None and msg_id in mark_read):
+        return False
+    
+    done_steps = ledger.get_steps(msg_id, mailbox)
+    
+    # Attachment payloads are never downloaded here, only described
+    full_message = fetch_message(service, msg_id, user_id)
+    
+    # Push notifications also report sent mail and messages already read
+    labels = full_message.get('labelIds', [])
+    if require_unread and ('UNREAD' not in labels or 'INBOX' not in labels):
+        return False
+    
+    # Extract email details
+    headers = full_message['payload']['headers']
+    subject = next((header['value'] for header in headers if header['name'] == 'Subject'), 'No Subject')
+    sender = next((header['value'] for header in headers if header['name'] == 'From'), 'Unknown Sender')
+    body = get_message_body(full_message)
+    
+    print(f"\n🔄 Processing NEW email (ID: {msg_id}) from {sender}")
+    print(f"   Subject: '{subject[:50]}...'")
+    print(f"   Body: '{body[:100]}...'")
+    
+    # Rule-based classification with reply detection
+    subject_lower = subject.lower()
+    body_lower = body.lower()
+    
+    # Check if this is a direct question/request that needs a reply
+    question_keywords = ['can you', 'please', 'send me', 'email', 'address', 'contact', 'manager', 'help', '?']
+    is_question = any(word in body_lower for word in question_keywords) or '?' in body
+    
+    if is_question:
+        classification = 'support'
+        action = 'reply'
+        reply_needed = True
+        reply_text = generate_smart_reply(sender, subject, body)
+        urgency = 'medium'
+        reasoning = "Rule-based: Direct question detected, sending smart reply"
+    elif any(word in subject_lower + body_lower for word in ['sales', 'buy', 'purchase', 'price', 'cost', 'quote', 'order']):
+        classification = 'sales'
+        action = 'forward'
+        reply_needed = False
+        reply_text = ""
+        urgency = 'medium'
+        reasoning = "Rule-based: Contains sales-related keywords"
+    elif any(word in subject_lower + body_lower for word in ['support', 'help', 'issue', 'problem', 'bug', 'error', 'fix']):
+        classification = 'support'
+        action = 'forward'
+        reply_needed = False
+        reply_text = ""
+        urgency = 'medium'
+        reasoning = "Rule-based: Contains support-related keywords"
+    elif any(word in subject_lower + body_lower for word in ['technical', 'api', 'integration', 'code', 'development']):
+        classification = 'technical'
+        action = 'forward'
+        reply_needed = False
+        reply_text = ""
+        urgency = 'medium'
+        reasoning = "Rule-based: Contains technical-related keywords"
+    else:
+        classification = 'support'
+        action = 'forward'
+        reply_needed = False
+        reply_text = ""
+        urgency = 'low'
+        reasoning = "Rule-based: Default classification to support"
+    
+    print(f"  -> Analysis: {classification} | Action: {action} | Urgency: {urgency}")
+    print(f"  -> Reasoning: {reasoning}")
+    
+    # Process the email
+    if classification in CONTACTS:
+        recipient = CONTACTS[classification]
+        
+        # Send reply if needed
+        if action == "reply" and reply_needed and done_steps & STEP_REPLIED:
+            print("  -> Reply already sent before restart, skipping")
+        elif action == "reply" and reply_needed:
+            print(f"  -> Sending reply to {sender}")
             
-            # Check if this is a direct question/request that needs a reply
-            question_keywords = ['can you', 'please', 'send me', 'email', 'address', 'contact', 'manager', 'help', '?']
-            is_question = any(word in body_lower for word in question_keywords) or '?' in body
+            reply_subject = f"Re: {subject}" if not subject.startswith("Re:") else subject
             
-            if is_question:
-                classification = 'support'
-                action = 'reply'
-                reply_needed = True
-                reply_text = generate_smart_reply(sender, subject, body)
-                urgency = 'medium'
-                reasoning = "Rule-based: Direct question detected, sending smart reply"
-            elif any(word in subject_lower + body_lower for word in ['sales', 'buy', 'purchase', 'price', 'cost', 'quote', 'order']):
-                classification = 'sales'
-                action = 'forward'
-                reply_needed = False
-                reply_text = ""
-                urgency = 'medium'
-                reasoning = "Rule-based: Contains sales-related keywords"
-            elif any(word in subject_lower + body_lower for word in ['support', 'help', 'issue', 'problem', 'bug', 'error', 'fix']):
-                classification = 'support'
-                action = 'forward'
-                reply_needed = False
-                reply_text = ""
-                urgency = 'medium'
-                reasoning = "Rule-based: Contains support-related keywords"
-            elif any(word in subject_lower + body_lower for word in ['technical', 'api', 'integration', 'code', 'development']):
-                classification = 'technical'
-                action = 'forward'
-                reply_needed = False
-                reply_text = ""
-                urgency = 'medium'
-                reasoning = "Rule-based: Contains technical-related keywords"
-            else:
-                classification = 'support'
-                action = 'forward'
-                reply_needed = False
-                reply_text = ""
-                urgency = 'low'
-                reasoning = "Rule-based: Default classification to support"
+            # Extract Message-ID for threading
+            message_id = None
+            for header in full_message['payload'].get('headers', []):
+                if header['name'] == 'Message-ID':
+                    message_id = header['value']
+                    break
             
-            print(f"  -> Analysis: {classification} | Action: {action} | Urgency: {urgency}")
-            print(f"  -> Reasoning: {reasoning}")
+            reply_message = create_message(
+                sender=user_id, 
+                to=sender, 
+                subject=reply_subject, 
+                message_text=reply_text,
+                in_reply_to=message_id,
+                references=message_id
+            )
+            send_queue.enqueue(mailbox, msg_id, 'reply', reply_message)
+            ledger.record(msg_id, STEP_REPLIED, mailbox)
+        
+        # Forward to stakeholder
+        if (action == "forward" or action == "reply") and done_steps & STEP_FORWARDED:
+            print("  -> Already forwarded before restart, skipping")
+        elif action == "forward" or action == "reply":
+            print(f"  -> Forwarding to {recipient}")
             
-            # Process the email
-            if classification in CONTACTS:
-                recipient = CONTACTS[classification]
-                
-                # Send reply if needed
-                if action == "reply" and reply_needed:
-                    print(f"  -> Sending reply to {sender}")
-                    
-                    reply_subject = f"Re: {subject}" if not subject.startswith("Re:") else subject
-                    
-                    # Extract Message-ID for threading
-                    message_id = None
-                    for header in full_message['payload'].get('headers', []):
-                        if header['name'] == 'Message-ID':
-                            message_id = header['value']
-                            break
-                    
-                    reply_message = create_message(
-                        sender=user_id, 
-                        to=sender, 
-                        subject=reply_subject, 
-                        message_text=reply_text,
-                        in_reply_to=message_id,
-                        references=message_id
-                    )
-                    send_message(service, user_id, reply_message)
-                
-                # Forward to stakeholder
-                if action == "forward" or action == "reply":
-                    print(f"  -> Forwarding to {recipient}")
-                    
-                    urgency_prefix = f"[{urgency.upper()}] " if urgency != "low" else ""
-                    forward_subject = f"FW: {urgency_prefix}[Auto-Routed] {subject}"
-                    forward_body = f"""--- AUTOMATICALLY FORWARDED TO {classification.upper()} ---
+            urgency_prefix = f"[{urgency.upper()}] " if urgency != "low" else ""
+            forward_subject = f"FW: {urgency_prefix}[Auto-Routed] {subject}"
+            attachments = full_message.get('attachments') or []
+            attachment_line = f"- Attachments: {describe_attachments(attachments)}\n" if attachments else ""
+            forward_body = f"""--- AUTOMATICALLY FORWARDED TO {classification.upper()} ---
 Urgency: {urgency.upper()}
 AI Analysis: {reasoning}
 Reply Sent: {'Yes' if reply_needed else 'No'}
@@ -376,41 +408,223 @@ Reply Sent: {'Yes' if reply_needed else 'No'}
 Original Email Details:
 - From: {sender}
 - Subject: {subject}
-
+{attachment_line}
 Original Message:
 {body}
 
 ---
 This email was automatically classified and forwarded by the AI Email Assistant.
 {'An automated reply was sent to the original sender.' if reply_needed else ''}"""
-                    
-                    forward_message = create_message(sender=user_id, to=recipient, subject=forward_subject, message_text=forward_body)
-                    send_message(service, user_id, forward_message)
-                
-                # Mark original message as READ
-                service.users().messages().modify(
-                    userId=user_id, 
-                    id=msg_id, 
-                    body={'removeLabelIds': ['UNREAD']}
-                ).execute()
-                print("  -> Original email marked as read.")
-                
-                # Add to processed list
-                processed_ids.add(msg_id)
-                
-            else:
-                print(f"  -> Classification failed: {classification}. Skipping this email.")
+            
+            forward_message = create_message(sender=user_id, to=recipient, subject=forward_subject, message_text=forward_body)
+            forward_digest.add(mailbox, msg_id, recipient, forward_message, user_id,
+                               sender, subject, body, urgency)
+            ledger.record(msg_id, STEP_FORWARDED, mailbox)
+        
+        # Mark original message as READ; the ledger completes it once the batch is flushed
+        if mark_read is None:
+            mark_read = MarkReadBuffer(service, ledger, mailbox)
+            mark_read.add(msg_id)
+            mark_read.flush()
+        else:
+            mark_read.add(msg_id)
+        print("  -> Original email queued to be marked read.")
+        return True
+        
+    else:
+        print(f"  -> Classification failed: {classification}. Skipping this email.")
+        return False
+
+def get_current_history_id(service, user_id='me'):
+    """Current historyId of the mailbox, used as the baseline for push mode."""
+    return int(service.users().getProfile(userId=user_id).execute()['historyId'])
+
+def fetch_history_message_ids(service, start_history_id, user_id='me'):
+    """List messages added to the inbox since a historyId.
+    
+    Returns (message_ids, latest_history_id). Gmail answers 404 once the
+    start id is too old to be served; callers fall back to a full scan.
+    """
+    message_ids = []
+    latest_history_id = start_history_id
+    page_token = None
+    
+    while True:
+        response = service.users().history().list(
+            userId=user_id,
+            startHistoryId=start_history_id,
+            historyTypes=['messageAdded'],
+            labelId='INBOX',
+            pageToken=page_token
+        ).execute()
         
-        return processed_ids
+        for record in response.get('history', []):
+            for added in record.get('messagesAdded', []):
+                message_ids.append(added['message']['id'])
         
+        latest_history_id = max(latest_history_id, int(response.get('historyId', latest_history_id)))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+    
+    # A message shows up once per history record that touched it
+    return list(dict.fromkeys(message_ids)), latest_history_id
+
+def full_sync(service, ledger=message_ledger):
+    """Scan the whole unread inbox and set the history cursor if the scan finished.
+    
+    The cursor is read before the scan, so mail arriving during it is
+    replayed from history next time instead of being skipped. Returns the
+    number of messages handled.
+    """
+    history_id = get_current_history_id(service)
+    handled, complete = scan_unread_emails(service, ledger)
+    if complete:
+        ledger.set_history_id(history_id)
+    else:
+        # Keep the old cursor (or none) so the next start scans again
+        print("⏸️  Inbox scan interrupted, history cursor not advanced")
+    return handled
+
+def sync_history(service, ledger=message_ledger):
+    """Process the messages added since the stored history cursor.
+    
+    Without a cursor, or once it expired, falls back to a full_sync.
+    Returns the number of messages handled.
+    """
+    start_history_id = ledger.get_history_id()
+    if start_history_id is None:
+        return full_sync(service, ledger)
+    
+    try:
+        message_ids, latest_history_id = fetch_history_message_ids(service, start_history_id)
     except Exception as e:
-        print(f"❌ Error processing emails: {e}")
-        return processed_ids
+        if getattr(getattr(e, 'resp', None), 'status', None) != 404:
+            raise
+        print("⚠️  History cursor expired, falling back to a full inbox scan")
+        return full_sync(service, ledger)
+    
+    handled = 0
+    mark_read = MarkReadBuffer(service, ledger)
+    mark_read.recover()
+    try:
+        for msg_id in message_ids:
+            if shutdown.requested:
+                # Leave the cursor behind so the rest is fetched again next start
+                return handled
+            if process_message(service, msg_id, ledger, require_unread=True, mark_read=mark_read):
+                handled += 1
+    finally:
+        mark_read.flush()
+    
+    ledger.set_history_id(latest_history_id)
+    return handled
+
+def start_watch(service, topic_name):
+    """Ask Gmail to publish inbox changes to a Pub/Sub topic.
+    
+    The watch expires after 7 days, so it has to be renewed periodically.
+    """
+    response = service.users().watch(
+        userId='me',
+        body={'topicName': topic_name, 'labelIds': ['INBOX'], 'labelFilterAction': 'include'}
+    ).execute()
+    print(f"📡 Gmail watch active on {topic_name} (historyId {response['historyId']})")
+    return response
+
+def run_push_mode(service, port, topic_name=None):
+    """Process mail as Gmail push notifications arrive.
+    
+    A slow fallback poll still runs in case a notification is lost.
+    """
+    fallback_interval = float(os.environ.get("PUSH_FALLBACK_INTERVAL", 900))
+    watch_renew_interval = float(os.environ.get("PUSH_WATCH_RENEW_INTERVAL", 86400))
+    email_address = service.users().getProfile(userId='me').execute()['emailAddress'].lower()
+    
+    receiver = PushReceiver(
+        port=port,
+        path=os.environ.get("PUSH_PATH", "/gmail/push"),
+        verification_token=os.environ.get("PUSH_VERIFICATION_TOKEN")
+    ).start()
+    shutdown.on_request(receiver.interrupt)
+    print(f"📬 Listening for push notifications on port {receiver.port}{receiver.path}")
+    
+    last_watch = 0.0
+    if topic_name:
+        start_watch(service, topic_name)
+        last_watch = time.time()
+    
+    # Catch up on whatever arrived while the monitor was down
+    handled = sync_history(service)
+    print(f"✅ Catch-up complete ({handled} emails processed)")
+    
+    try:
+        while not shutdown.requested:
+            if topic_name and time.time() - last_watch > watch_renew_interval:
+                try:
+                    start_watch(service, topic_name)
+                    last_watch = time.time()
+                except Exception as e:
+                    print(f"⚠️  Failed to renew Gmail watch: {e}")
+            
+            notifications = receiver.drain(timeout=fallback_interval)
+            if shutdown.requested:
+                break
+            if notifications and email_address not in notifications:
+                print(f"⚠️  Ignoring notifications for other mailboxes: {', '.join(notifications)}")
+                continue
+            
+            if notifications:
+                print(f"🔔 Push notification (historyId {notifications[email_address]})")
+            else:
+                print("⏰ No notifications, running fallback poll")
+            
+            try:
+                handled = sync_history(service)
+                if handled:
+                    print(f"✅ Processed {handled} emails (Total: {message_ledger.count()})")
+            except Exception as e:
+                print(f"❌ Error syncing history: {e}")
+    finally:
+        receiver.stop()
+
+def run_poll_mode(service):
+    """Poll the inbox on an adaptive schedule until shutdown is requested."""
+    scheduler = AdaptivePollScheduler.from_env()
+    scheduler.install_signal_trigger()
+    scheduler.start_socket_trigger(os.environ.get("POLL_WAKE_SOCKET", "/tmp/email_monitor.sock"))
+    shutdown.on_request(scheduler.wake)
+    
+    while not shutdown.requested:
+        try:
+            scheduler.record_tick(process_new_emails(service))
+        except Exception as e:
+            print(f"❌ Error in main loop: {e}")
+            scheduler.record_error(e)
+        
+        if shutdown.requested:
+            break
+        
+        delay = scheduler.next_delay()
+        print(f"⏰ Waiting {delay:.0f} seconds... (Processed: {message_ledger.count()} emails)")
+        if scheduler.wait(delay) and not shutdown.requested:
+            print("🔔 Woken up by trigger")
 
 def main():
     """Main monitoring loop."""
+    parser = argparse.ArgumentParser(description="Real-time Email Monitor")
+    parser.add_argument("--push", action="store_true", help="Process Gmail push notifications instead of polling")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PUSH_PORT", 8085)), help="Push receiver port")
+    parser.add_argument("--topic", default=os.environ.get("GMAIL_PUBSUB_TOPIC"),
+                        help="Pub/Sub topic for users.watch (projects/<project>/topics/<topic>)")
+    args = parser.parse_args()
+    
     print("🤖 Starting Email Monitor...")
-    print("   - Monitoring for new emails every 30 seconds")
+    if args.push:
+        print("   - Push mode: processing Gmail notifications as they arrive")
+    else:
+        print("   - Adaptive polling: fast during bursts, backing off when idle")
+        print("   - Send SIGUSR1 or run 'python poll_scheduler.py' to poll immediately")
     print("   - Press Ctrl+C to stop")
     print("=" * 60)
     
@@ -418,31 +632,38 @@ def main():
         service = get_gmail_service()
         print("✅ Connected to Gmail")
         
-        # Initialize Bedrock client
-        try:
-            ai_client = boto3.client(
-                service_name='bedrock-runtime', 
-                region_name=AWS_REGION
-            )
-            print("✅ Connected to AWS Bedrock")
-        except Exception as e:
-            print(f"⚠️  Bedrock connection failed: {e}")
-            print("   Using rule-based fallback only")
+        # The monitor classifies and replies with its own rules; no LLM client is needed
+        print("ℹ️  Using rule-based classification and replies")
         
-        processed_ids = set()
+        # Replies and forwards are sent in the background by the outbound queue
+        send_queue.register_mailbox('me', get_gmail_service)
+        send_queue.start()
+        forward_digest.start()
         
-        while True:
-            try:
-                processed_ids = process_new_emails(service, processed_ids)
-                print(f"⏰ Waiting 30 seconds... (Processed: {len(processed_ids)} emails)")
-                time.sleep(30)
-                
-            except KeyboardInterrupt:
-                print("\n🛑 Stopping Email Monitor...")
-                break
-            except Exception as e:
-                print(f"❌ Error in main loop: {e}")
-                time.sleep(30)
+        # SIGTERM/SIGINT finish the current email, flush the buffers and exit
+        shutdown.install_signal_handlers()
+        install_pipeline_hooks()
+        
+        # Drop old ledger entries once per start; they can never be unread again
+        removed = message_ledger.compact()
+        if removed:
+            print(f"🧹 Compacted message ledger ({removed} old entries removed)")
+        removed = send_queue.compact()
+        if removed:
+            print(f"🧹 Compacted send queue ({removed} old messages removed)")
+        
+        try:
+            if args.push:
+                run_push_mode(service, args.port, args.topic)
+            else:
+                run_poll_mode(service)
+        except KeyboardInterrupt:
+            print("\n🛑 Forced stop, skipping drain")
+            return
+        
+        print("\n🛑 Stopping Email Monitor...")
+        if shutdown.finish():
+            print("✅ Drained cleanly")
                 
     except Exception as e:
         print(f"❌ Failed to start Email Monitor: {e}")
@@ -8,6 +8,7 @@ from enum import Enum
 import json
 import os
 from datetime import datetime
+from container import container
 
 class SecurityLevel(Enum):
     """Three levels of information security"""
@@ -158,11 +159,18 @@ class EmployeeDatabase:
     
     def __init__(self):
         self.employees: Dict[str, Employee] = {}
+        # Incremented on every mutation so caches can detect stale data
+        self.version = 0
         self._load_sample_data()
     
     def add_employee(self, employee: Employee):
         """Add employee to database"""
         self.employees[employee.employee_id] = employee
+        self.mark_changed()
+    
+    def mark_changed(self):
+        """Record that employee data changed (call after in-place edits)"""
+        self.version += 1
     
     def get_employee(self, employee_id: str) -> Optional[Employee]:
         """Get employee by ID"""
@@ -402,6 +410,8 @@ class EmployeeDatabase:
                 emp.confidential_info = emp_data["confidential_info"]
                 
                 self.employees[emp_id] = emp
+            
+            self.mark_changed()
 
-# Global instance
-employee_db = EmployeeDatabase()
+# Global instance (built on first use)
+employee_db = container.register("employee_db", EmployeeDatabase)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Forward Digests for high-volume routes
+Holds forwards back for a short window and sends one digest per recipient
+and subject cluster instead of one message per email, so an incident that
+produces hundreds of near-identical emails produces a handful of forwards.
+Urgent forwards bypass the window
+"""
+
+import base64
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from email.mime.text import MIMEText
+from typing import Dict, Optional
+from container import container
+from send_queue import send_queue
+
+URGENT_LEVELS = {"high", "urgent", "critical"}
+
+_PREFIX_RE = re.compile(r"^\s*((re|fw|fwd|aw|tr)\s*(\[\d+\])?\s*:\s*|\[[^\]]*\]\s*)+", re.IGNORECASE)
+_VOLATILE_RE = re.compile(r"(#?\b\d[\d\-:/.]*\b|\b[0-9a-f]{8,}\b)", re.IGNORECASE)
+
+def subject_cluster(subject: str) -> str:
+    """Normalize a subject so replies, forwards and ticket numbers cluster together"""
+    subject = _PREFIX_RE.sub("", subject or "")
+    subject = _VOLATILE_RE.sub("#", subject.lower())
+    return " ".join(subject.split()) or "(no subject)"
+
+def is_urgent(urgency: Optional[str]) -> bool:
+    return (urgency or "").lower() in URGENT_LEVELS
+
+class ForwardAggregator:
+    """Groups forwards per (mailbox, recipient, subject cluster).
+
+    Items are stored in SQLite until their group is flushed, so a restart does
+    not lose a forward the ledger already counts as done. A group is flushed
+    ``window`` seconds after its first item, or as soon as it holds
+    ``max_items``. A group of one is sent as the original forward; larger
+    groups become a single digest. Flushing hands messages to the outbound
+    send queue with keys derived from the grouped ids, so a flush repeated
+    after a crash does not send twice.
+    """
+
+    def __init__(self, db_path: str = "forward_digest.db", window: float = 300.0, max_items: int = 50,
+                 queue=send_queue):
+        self.db_path = db_path
+        self.window = window
+        self.max_items = max_items
+        self.queue = queue
+        self._lock = threading.Lock()
+        # Only one flush at a time, so a group is never sent by two flushes
+        self._flush_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.forwards_in = 0
+        self.messages_out = 0
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS digest_items (
+                mailbox TEXT NOT NULL,
+                msg_id TEXT NOT NULL,
+                recipient TEXT NOT NULL,
+                cluster TEXT NOT NULL,
+                sender_address TEXT NOT NULL,
+                sender TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                urgency TEXT NOT NULL,
+                excerpt TEXT NOT NULL,
+                raw TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (mailbox, msg_id)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS digest_groups ON digest_items (mailbox, recipient, cluster, created)")
+
+    def add(self, mailbox: str, msg_id: str, recipient: str, forward_message: Dict, sender_address: str,
+            sender: str, subject: str, body: str, urgency: str = "normal"):
+        """Route a forward through the aggregator"""
+        self.forwards_in += 1
+        if self.window <= 0 or is_urgent(urgency):
+            self.queue.enqueue(mailbox, msg_id, 'forward', forward_message)
+            self.messages_out += 1
+            return
+
+        cluster = subject_cluster(subject)
+        with self._lock:
+            self._conn.execute("""
+                INSERT OR IGNORE INTO digest_items
+                    (mailbox, msg_id, recipient, cluster, sender_address, sender, subject, urgency, excerpt, raw, created)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (mailbox, msg_id, recipient, cluster, sender_address, sender, subject, urgency,
+                  (body or "")[:500], forward_message["raw"], time.time()))
+            size = self._conn.execute(
+                "SELECT COUNT(*) FROM digest_items WHERE mailbox = ? AND recipient = ? AND cluster = ?",
+                (mailbox, recipient, cluster)
+            ).fetchone()[0]
+
+        if size >= self.max_items:
+            self.flush(force=True, group=(mailbox, recipient, cluster))
+
+    def _build_digest(self, recipient: str, items) -> Dict:
+        first, last = items[0], items[-1]
+        minutes = max(1, round((last["created"] - first["created"]) / 60))
+        lines = [
+            f"--- DIGEST: {len(items)} SIMILAR EMAILS ---",
+            f"Subject cluster: {first['cluster']}",
+            f"Received over {minutes} minute(s)",
+            ""
+        ]
+        for number, item in enumerate(items, 1):
+            lines += [
+                f"[{number}] From: {item['sender']}",
+                f"    Subject: {item['subject']}",
+                f"    Urgency: {item['urgency']}",
+                "    " + item["excerpt"].strip().replace("\n", "\n    "),
+                ""
+            ]
+        lines += ["---", "Grouped and forwarded by AI Email Assistant"]
+
+        message = MIMEText("\n".join(lines))
+        message['to'] = recipient
+        message['from'] = first["sender_address"]
+        message['subject'] = f"FWD: [Digest x{len(items)}] {first['subject']}"
+        return {'raw': base64.urlsafe_b64encode(message.as_bytes()).decode()}
+
+    def flush(self, force: bool = False, group=None) -> int:
+        """Send every group whose window has closed (or all, when forced).
+
+        Returns the number of messages handed to the send queue.
+        """
+        columns = ["mailbox", "msg_id", "recipient", "cluster", "sender_address", "sender",
+                   "subject", "urgency", "excerpt", "raw", "created"]
+        query = f"SELECT {', '.join(columns)} FROM digest_items"
+        params = []
+        if group is not None:
+            query += " WHERE mailbox = ? AND recipient = ? AND cluster = ?"
+            params = list(group)
+        query += " ORDER BY created"
+
+        with self._flush_lock:
+            return self._flush(query, params, columns, force)
+
+    def _flush(self, query, params, columns, force: bool) -> int:
+        with self._lock:
+            rows = [dict(zip(columns, row)) for row in self._conn.execute(query, params).fetchall()]
+
+        groups = {}
+        for row in rows:
+            groups.setdefault((row["mailbox"], row["recipient"], row["cluster"]), []).append(row)
+
+        sent = 0
+        cutoff = time.time() - self.window
+        for (mailbox, recipient, _), items in groups.items():
+            if not force and items[0]["created"] > cutoff:
+                continue
+
+            for start in range(0, len(items), self.max_items):
+                chunk = items[start:start + self.max_items]
+                if len(chunk) == 1:
+                    self.queue.enqueue(mailbox, chunk[0]["msg_id"], 'forward', {'raw': chunk[0]["raw"]})
+                else:
+                    ids = sorted(item["msg_id"] for item in chunk)
+                    digest_id = hashlib.sha256("/".join(ids).encode("utf-8")).hexdigest()[:24]
+                    self.queue.enqueue(mailbox, f"digest-{digest_id}", 'digest', self._build_digest(recipient, chunk))
+
+                with self._lock:
+                    self._conn.executemany("DELETE FROM digest_items WHERE mailbox = ? AND msg_id = ?",
+                                           [(mailbox, item["msg_id"]) for item in chunk])
+                sent += 1
+
+        self.messages_out += sent
+        return sent
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM digest_items").fetchone()[0]
+
+    def _run(self, interval: float):
+        while not self._stopping.wait(interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️  Forward digest flush failed: {e}")
+
+    def start(self, interval: Optional[float] = None) -> "ForwardAggregator":
+        """Flush closed windows in the background"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            interval = interval or max(1.0, min(30.0, self.window / 10))
+            self._thread = threading.Thread(target=self._run, args=(interval,), name="forward-digest", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, flush: bool = True):
+        """Stop the background flusher, optionally sending everything held back"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(5.0)
+            self._thread = None
+        if flush:
+            self.flush(force=True)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "forwards_in": self.forwards_in,
+            "messages_out": self.messages_out,
+            "pending": self.pending_count()
+        }
+
+# Shared aggregator; holds a database handle and a thread, so it is built per process
+forward_digest = container.register(
+    "forward_digest",
+    lambda: ForwardAggregator(
+        os.environ.get("FORWARD_DIGEST_DB", "forward_digest.db"),
+        window=float(os.environ.get("FORWARD_DIGEST_WINDOW", 300)),
+        max_items=int(os.environ.get("FORWARD_DIGEST_MAX_ITEMS", 50))
+    ),
+    fork_safe=False
+)
@@ -0,0 +1,33 @@
+"""
+Gunicorn configuration for the Email Assistant API
+Loads the app once in the master (preload) and builds the fork-safe singletons
+there, so workers share them copy-on-write instead of rebuilding them each
+"""
+
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+preload_app = True
+# Time a worker gets after SIGTERM to finish requests and background jobs
+graceful_timeout = int(os.environ.get('SHUTDOWN_DEADLINE', 30)) + 10
+
+def when_ready(server):
+    """Warm shared data in the master before the first worker is forked"""
+    from container import container
+
+    state = container.warm()
+    server.log.info("Preloaded singletons: %s", ", ".join(name for name, ready in state.items() if ready))
+
+    # Move everything allocated so far out of the GC's reach, so collections
+    # in the workers do not touch (and copy) the shared pages
+    gc.freeze()
+
+def worker_exit(server, worker):
+    """Let background jobs finish their current email before the worker exits"""
+    from shutdown import shutdown
+
+    if not shutdown.finish():
+        server.log.warning("Worker %s exited with background jobs still running", worker.pid)
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Hedged and Retried Requests within a latency budget
+Starts a second copy of a slow request once the first has run longer than
+the recent p95 latency, takes whichever finishes first, and retries
+transient failures with jittered backoff, all inside one overall deadline.
+The hedge clock starts when the first copy begins executing, hedges are
+capped at a small share of calls and none are started while the worker pool
+has a backlog, so request volume barely grows under load
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Optional
+from circuit_breaker import CircuitOpenError
+
+# Below this much remaining budget, starting another attempt is pointless
+MIN_ATTEMPT_SECONDS = 0.5
+# Unused hedge allowance carried over between calls, so quiet periods do not bank a burst
+MAX_HEDGE_CREDIT = 2.0
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RETRYABLE_NAMES = {"DeadlineExceeded", "ServiceUnavailable", "InternalServerError", "TooManyRequests",
+                   "ResourceExhausted", "GatewayTimeout", "BadGateway", "RetryError"}
+
+class LatencyBudgetExceeded(TimeoutError):
+    """The overall deadline passed before any attempt succeeded"""
+
+def is_transient(error: Exception) -> bool:
+    """Timeouts, connection errors, throttling and 5xx from the Google client libraries"""
+    if isinstance(error, (CircuitOpenError, LatencyBudgetExceeded)):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and code in RETRYABLE_STATUS:
+        return True
+    return type(error).__name__ in RETRYABLE_NAMES
+
+class HedgedCaller:
+    """Runs one logical request as up to two concurrent attempts, with retries.
+
+    ``attempt(timeout)`` performs a single request and must give up after
+    ``timeout`` seconds. The hedge delay is ``hedge_after`` when set, else
+    the p95 of recent successful attempts (``initial_hedge_after`` until
+    ``min_samples`` are known), counted from when the primary starts running
+    rather than from when it was queued. Each call earns ``max_hedge_rate``
+    of a hedge, so at most that share of calls is hedged, and synchronous
+    hedges are skipped while the pool has queued work or no idle worker.
+    Synchronous losers cannot be interrupted and are left to finish in the
+    background with their result discarded; async losers are cancelled.
+    """
+
+    def __init__(self, name: str, budget: float = 45.0, attempt_timeout: float = 30.0,
+                 hedge_after: Optional[float] = None, initial_hedge_after: float = 8.0,
+                 max_retries: int = 2, base_backoff: float = 0.5, max_backoff: float = 4.0,
+                 window: int = 200, min_samples: int = 20, workers: int = 8, max_hedge_rate: float = 0.05,
+                 is_retryable: Callable[[Exception], bool] = is_transient):
+        self.name = name
+        self.budget = budget
+        self.attempt_timeout = attempt_timeout
+        self.hedge_after = hedge_after
+        self.initial_hedge_after = initial_hedge_after
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.min_samples = min_samples
+        self.workers = workers
+        self.max_hedge_rate = max_hedge_rate
+        self.is_retryable = is_retryable
+
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._executor = None
+        # Attempts submitted to the pool but not started yet, and those running
+        self._queued = 0
+        self._running = 0
+        self._hedge_credit = 1.0
+        self.stats = {"calls": 0, "attempts": 0, "hedges": 0, "hedges_skipped": 0, "primary_wins": 0,
+                      "hedge_wins": 0, "retries": 0, "failures": 0, "budget_exhausted": 0}
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> "HedgedCaller":
+        """Build a caller, allowing HEDGE_<NAME>_* overrides"""
+        prefix = f"HEDGE_{name.upper()}_"
+        caller = cls(name, **defaults)
+        caller.budget = float(os.environ.get(prefix + "BUDGET", caller.budget))
+        caller.max_retries = int(os.environ.get(prefix + "MAX_RETRIES", caller.max_retries))
+        caller.max_hedge_rate = float(os.environ.get(prefix + "MAX_RATE", caller.max_hedge_rate))
+        hedge_after = os.environ.get(prefix + "AFTER")
+        if hedge_after:
+            # A fixed threshold instead of the observed p95; 0 turns hedging off
+            caller.hedge_after = float(hedge_after) if float(hedge_after) > 0 else float("inf")
+        return caller
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def current_hedge_after(self) -> float:
+        """Seconds to wait for an attempt before starting its hedge"""
+        if self.hedge_after is not None:
+            return self.hedge_after
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < self.min_samples:
+            return self.initial_hedge_after
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def _earn_hedge(self):
+        with self._lock:
+            self.stats["calls"] += 1
+            self._hedge_credit = min(MAX_HEDGE_CREDIT, self._hedge_credit + self.max_hedge_rate)
+
+    def _may_hedge(self, pooled: bool) -> bool:
+        """Spend a hedge, unless the rate cap is reached or the pool is backed up"""
+        with self._lock:
+            backlogged = pooled and (self._queued > 0 or self._running >= self.workers)
+            if backlogged or self._hedge_credit < 1.0:
+                self.stats["hedges_skipped"] += 1
+                return False
+            self._hedge_credit -= 1.0
+            self.stats["hedges"] += 1
+            self.stats["attempts"] += 1
+            return True
+
+    def _record_latency(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def _backoff(self, retry: int) -> float:
+        """Full jitter: uniform between zero and the exponential cap"""
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** retry))
+
+    def _attempt_timeout(self, deadline: float) -> float:
+        return max(MIN_ATTEMPT_SECONDS, min(self.attempt_timeout, deadline - time.monotonic()))
+
+    def _timed(self, attempt: Callable[[float], Any], timeout: float, running: threading.Event):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        running.set()
+        started = time.monotonic()
+        try:
+            result = attempt(timeout)
+        finally:
+            with self._lock:
+                self._running -= 1
+        return result, time.monotonic() - started
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"hedge-{self.name}")
+            return self._executor
+
+    def _submit(self, attempt: Callable[[float], Any], deadline: float):
+        running = threading.Event()
+        with self._lock:
+            self._queued += 1
+        return self._get_executor().submit(self._timed, attempt, self._attempt_timeout(deadline), running), running
+
+    def _cancel(self, futures):
+        for future in futures:
+            if future.cancel():
+                with self._lock:
+                    self._queued -= 1
+
+    def _budget_exceeded(self) -> LatencyBudgetExceeded:
+        return LatencyBudgetExceeded(f"{self.name} latency budget of {self.budget:.0f}s exhausted")
+
+    def _round(self, attempt: Callable[[float], Any], deadline: float) -> Any:
+        """One primary attempt plus at most one hedge"""
+        self._count("attempts")
+        primary, running = self._submit(attempt, deadline)
+        pending = {primary: "primary"}
+        # Time spent queued behind other calls is not the model being slow
+        if not running.wait(max(0.0, deadline - time.monotonic())):
+            self._cancel(pending)
+            raise self._budget_exceeded()
+        started = time.monotonic()
+        hedge_decided = False
+        last_error = None
+
+        while pending:
+            now = time.monotonic()
+            remaining = deadline - now
+            if remaining <= 0:
+                self._cancel(pending)
+                raise self._budget_exceeded()
+
+            timeout = remaining
+            if not hedge_decided:
+                timeout = min(remaining, max(0.0, started + self.current_hedge_after() - now))
+
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if not hedge_decided and remaining > MIN_ATTEMPT_SECONDS and time.monotonic() - started >= self.current_hedge_after():
+                    hedge_decided = True
+                    if self._may_hedge(pooled=True):
+                        pending[self._submit(attempt, deadline)[0]] = "hedge"
+                continue
+
+            for future in done:
+                kind = pending.pop(future)
+                try:
+                    result, latency = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                self._record_latency(latency)
+                self._count(f"{kind}_wins")
+                self._cancel(pending)
+                return result
+
+        raise last_error
+
+    def call(self, attempt: Callable[[float], Any]) -> Any:
+        """Run ``attempt`` hedged and retried; raises the last error on failure"""
+        self._earn_hedge()
+        deadline = time.monotonic() + self.budget
+        retries = 0
+        while True:
+            try:
+                return self._round(attempt, deadline)
+            except Exception as e:
+                delay = self._backoff(retries)
+                if not self.is_retryable(e) or retries >= self.max_retries:
+                    self._count("budget_exhausted" if isinstance(e, LatencyBudgetExceeded) else "failures")
+                    raise
+                if time.monotonic() + delay + MIN_ATTEMPT_SECONDS > deadline:
+                    self._count("budget_exhausted")
+                    raise
+                retries += 1
+                self._count("retries")
+                time.sleep(delay)
+
+    async def _timed_async(self, attempt: Callable[[float], Awaitable], timeout: float, running: asyncio.Event):
+        running.set()
+        started = time.monotonic()
+        result = await attempt(timeout)
+        return result, time.monotonic() - started
+
+    async def _round_async(self, attempt: Callable[[float], Awaitable], deadline: float) -> Any:
+        self._count("attempts")
+        running = asyncio.Event()
+        pending = {asyncio.ensure_future(self._timed_async(attempt, self._attempt_timeout(deadline), running)): "primary"}
+        hedge_decided = False
+        last_error = None
+
+        try:
+            # A busy event loop delays the start; the hedge clock starts when the primary runs
+            try:
+                await asyncio.wait_for(running.wait(), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                raise self._budget_exceeded() from None
+            started = time.monotonic()
+
+            while pending:
+                now = time.monotonic()
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise self._budget_exceeded()
+
+                timeout = remaining
+                if not hedge_decided:
+                    timeout = min(remaining, max(0.0, started + self.current_hedge_after() - now))
+
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if not hedge_decided and remaining > MIN_ATTEMPT_SECONDS and time.monotonic() - started >= self.current_hedge_after():
+                        hedge_decided = True
+                        if self._may_hedge(pooled=False):
+                            task = asyncio.ensure_future(self._timed_async(attempt, self._attempt_timeout(deadline),
+                                                                           asyncio.Event()))
+                            pending[task] = "hedge"
+                    continue
+
+                for task in done:
+                    kind = pending.pop(task)
+                    try:
+                        result, latency = task.result()
+                    except Exception as e:
+                        last_error = e
+                        continue
+                    self._record_latency(latency)
+                    self._count(f"{kind}_wins")
+                    return result
+
+            raise last_error
+        finally:
+            # Cancel the loser (or everything, on error or cancellation)
+            for task in pending:
+                task.cancel()
+
+    async def call_async(self, attempt: Callable[[float], Awaitable]) -> Any:
+        """Async version of call(); losing attempts are cancelled"""
+        self._earn_hedge()
+        deadline = time.monotonic() + self.budget
+        retries = 0
+        while True:
+            try:
+                return await self._round_async(attempt, deadline)
+            except Exception as e:
+                delay = self._backoff(retries)
+                if not self.is_retryable(e) or retries >= self.max_retries:
+                    self._count("budget_exhausted" if isinstance(e, LatencyBudgetExceeded) else "failures")
+                    raise
+                if time.monotonic() + delay + MIN_ATTEMPT_SECONDS > deadline:
+                    self._count("budget_exhausted")
+                    raise
+                retries += 1
+                self._count("retries")
+                await asyncio.sleep(delay)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats["hedge_after"] = round(self.current_hedge_after(), 3)
+        return stats
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Local Intent Classifier
+A CPU-only first classification tier: hashed word and word-pair features
+feed one multinomial logistic regression per decision (category, urgency,
+reply needed, forwarding needed), scored for a whole batch with a few NumPy
+operations. Confident predictions are used directly; the rest escalate to
+the LLM. The model is trained offline from the decision log and stored as
+an uncompressed .npz file, which loads in milliseconds.
+
+Usage:
+    python intent_model.py train --log decisions.jsonl --out intent_model.npz
+    python intent_model.py evaluate --log decisions.jsonl --model intent_model.npz
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; without it the local tier is off
+    np = None
+
+HEADS = ("category", "urgency", "requires_reply", "requires_forwarding")
+BOOLEAN_HEADS = ("requires_reply", "requires_forwarding")
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+# Only the start of a body is featurized; it carries the intent
+MAX_BODY_CHARS = 4000
+MAX_TOKENS = 400
+
+def hashed_features(subject: str, body: str, dim: int) -> List[int]:
+    """Feature indices of an email: subject words, body words and word pairs.
+
+    ``dim`` must be a power of two. crc32 is used because it is fast and,
+    unlike hash(), the same in every process.
+    """
+    tokens = ["s:" + token for token in _TOKEN_RE.findall((subject or "").lower())]
+    tokens += _TOKEN_RE.findall((body or "")[:MAX_BODY_CHARS].lower())[:MAX_TOKENS]
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    # A bias feature keeps every row non-empty
+    grams.append("__bias__")
+    mask = dim - 1
+    return [zlib.crc32(gram.encode("utf-8")) & mask for gram in grams]
+
+def vectorize(emails: List[Dict[str, str]], dim: int):
+    """Sparse batch as (offsets, columns, values), rows L2-normalized"""
+    offsets, columns, values = [], [], []
+    position = 0
+    for email in emails:
+        indices, counts = np.unique(np.array(hashed_features(email.get("subject", ""), email.get("body", ""), dim)),
+                                    return_counts=True)
+        offsets.append(position)
+        columns.append(indices)
+        values.append(counts / np.sqrt(np.dot(counts, counts)))
+        position += len(indices)
+    return (np.array(offsets, dtype=np.int64), np.concatenate(columns).astype(np.int64),
+            np.concatenate(values).astype(np.float32))
+
+def _scores(batch, weights, bias):
+    offsets, columns, values = batch
+    return np.add.reduceat(weights[columns] * values[:, None], offsets, axis=0) + bias
+
+def _softmax(scores):
+    scores = scores - scores.max(axis=1, keepdims=True)
+    exp = np.exp(scores)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+class IntentModel:
+    """Linear softmax heads over hashed n-gram features"""
+
+    def __init__(self, dim: int, heads: Dict[str, Tuple]):
+        self.dim = dim
+        # head -> (labels, weights [dim x classes], bias [classes])
+        self.heads = heads
+
+    @classmethod
+    def load(cls, path: str) -> "IntentModel":
+        with np.load(path, allow_pickle=False) as data:
+            dim = int(data["dim"])
+            heads = {head: (data[f"{head}_labels"].tolist(), data[f"{head}_weights"], data[f"{head}_bias"])
+                     for head in HEADS if f"{head}_labels" in data}
+        return cls(dim, heads)
+
+    def save(self, path: str):
+        arrays = {"dim": np.array(self.dim)}
+        for head, (labels, weights, bias) in self.heads.items():
+            arrays[f"{head}_labels"] = np.array(labels)
+            arrays[f"{head}_weights"] = weights.astype(np.float32)
+            arrays[f"{head}_bias"] = bias.astype(np.float32)
+        # Uncompressed, so loading is a straight read
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+    def predict(self, emails: List[Dict[str, str]]) -> List[Dict[str, Tuple[str, float]]]:
+        """Best label and its probability per head, for each email"""
+        if not emails:
+            return []
+        batch = vectorize(emails, self.dim)
+        predictions = [{} for _ in emails]
+        for head, (labels, weights, bias) in self.heads.items():
+            probabilities = _softmax(_scores(batch, weights, bias))
+            best = probabilities.argmax(axis=1)
+            for row, index in enumerate(best):
+                predictions[row][head] = (labels[index], float(probabilities[row, index]))
+        return predictions
+
+    def classify(self, emails: List[Dict[str, str]], threshold: float) -> List[Optional[Dict]]:
+        """Classifications for emails every head is confident about, None for the rest"""
+        results = []
+        for prediction in self.predict(emails):
+            if len(prediction) < len(HEADS) or min(p for _, p in prediction.values()) < threshold:
+                results.append(None)
+                continue
+            classification = {head: label for head, (label, _) in prediction.items()}
+            for head in BOOLEAN_HEADS:
+                classification[head] = classification[head] == "true"
+            classification["confidence"] = round(min(p for _, p in prediction.values()), 3)
+            results.append(classification)
+        return results
+
+    @classmethod
+    def train(cls, records: List[Dict], dim: int = 1 << 16, epochs: int = 60, learning_rate: float = 0.5,
+              l2: float = 1e-5) -> "IntentModel":
+        """Fit every head with full-batch Adagrad on softmax cross-entropy"""
+        batch = vectorize(records, dim)
+        offsets, columns, values = batch
+        rows = np.repeat(np.arange(len(records)), np.diff(np.append(offsets, len(columns))))
+
+        heads = {}
+        for head in HEADS:
+            labels = sorted({str(record[head]).lower() for record in records})
+            targets = np.array([labels.index(str(record[head]).lower()) for record in records])
+            weights = np.zeros((dim, len(labels)), dtype=np.float32)
+            bias = np.zeros(len(labels), dtype=np.float32)
+            weight_cache = np.full_like(weights, 1e-8)
+            bias_cache = np.full_like(bias, 1e-8)
+
+            for _ in range(epochs):
+                gradient = _softmax(_scores(batch, weights, bias))
+                gradient[np.arange(len(records)), targets] -= 1
+                gradient /= len(records)
+
+                weight_gradient = np.zeros_like(weights)
+                np.add.at(weight_gradient, columns, values[:, None] * gradient[rows])
+                weight_gradient += l2 * weights
+                bias_gradient = gradient.sum(axis=0)
+
+                weight_cache += weight_gradient ** 2
+                bias_cache += bias_gradient ** 2
+                weights -= learning_rate * weight_gradient / np.sqrt(weight_cache)
+                bias -= learning_rate * bias_gradient / np.sqrt(bias_cache)
+
+            heads[head] = (labels, weights, bias)
+        return cls(dim, heads)
+
+def load_intent_model(path: str) -> Optional[IntentModel]:
+    """The trained model at ``path``, or None when there is none (or no numpy)"""
+    if np is None or not path or not os.path.exists(path):
+        return None
+    try:
+        return IntentModel.load(path)
+    except Exception as e:
+        print(f"⚠️  Could not load intent model {path}: {e}")
+        return None
+
+class DecisionLog:
+    """Append-only JSONL log of classification decisions, the training data.
+
+    Holds email subjects and the start of bodies, so it is off unless a path
+    is configured.
+    """
+
+    def __init__(self, path: str = "", max_body_chars: int = 2000):
+        self.path = path
+        self.max_body_chars = max_body_chars
+        self._lock = threading.Lock()
+
+    def record(self, subject: str, body: str, category: str, urgency: str, requires_reply: bool,
+               requires_forwarding: bool, source: str):
+        if not self.path:
+            return
+        line = json.dumps({
+            "time": time.time(),
+            "source": source,
+            "subject": subject,
+            "body": (body or "")[:self.max_body_chars],
+            "category": category,
+            # The rule-based fallback says "medium" where the LLM says "normal"
+            "urgency": "normal" if urgency == "medium" else urgency,
+            "requires_reply": bool(requires_reply),
+            "requires_forwarding": bool(requires_forwarding)
+        }, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+def read_decisions(path: str, sources: Optional[Iterable[str]] = None) -> List[Dict]:
+    """Records from a decision log, optionally only from some sources"""
+    sources = set(sources) if sources else None
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if sources is None or record.get("source") in sources:
+                records.append(record)
+    return records
+
+def evaluate(model: IntentModel, records: List[Dict], threshold: float) -> Dict[str, float]:
+    """Per-head accuracy, plus how many emails would stay local and how often those are right"""
+    predictions = model.predict(records)
+    classified = model.classify(records, threshold)
+    report = {}
+    for head in HEADS:
+        correct = sum(prediction[head][0] == str(record[head]).lower()
+                      for prediction, record in zip(predictions, records))
+        report[f"{head}_accuracy"] = round(correct / max(1, len(records)), 3)
+
+    local = [(c, r) for c, r in zip(classified, records) if c is not None]
+    report["local_share"] = round(len(local) / max(1, len(records)), 3)
+    report["local_category_accuracy"] = round(
+        sum(c["category"] == r["category"] for c, r in local) / max(1, len(local)), 3)
+    return report
+
+# Decision log shared by the pipelines (DECISION_LOG_FILE; empty disables it)
+decision_log = DecisionLog(os.environ.get("DECISION_LOG_FILE", ""))
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or evaluate the local intent classifier")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = subcommands.add_parser("train", help="Train a model from a decision log")
+    train_parser.add_argument("--log", default=os.environ.get("DECISION_LOG_FILE", "decisions.jsonl"))
+    train_parser.add_argument("--out", default=os.environ.get("INTENT_MODEL_FILE", "intent_model.npz"))
+    train_parser.add_argument("--sources", default="llm,rules",
+                              help="Comma-separated decision sources to learn from (never 'local')")
+    train_parser.add_argument("--dim-bits", type=int, default=16, help="Feature space size as a power of two")
+    train_parser.add_argument("--epochs", type=int, default=60)
+    train_parser.add_argument("--holdout", type=float, default=0.1, help="Share of records kept for evaluation")
+    train_parser.add_argument("--threshold", type=float, default=float(os.environ.get("INTENT_MODEL_THRESHOLD", 0.8)))
+
+    eval_parser = subcommands.add_parser("evaluate", help="Evaluate a model on a decision log")
+    eval_parser.add_argument("--log", default=os.environ.get("DECISION_LOG_FILE", "decisions.jsonl"))
+    eval_parser.add_argument("--model", default=os.environ.get("INTENT_MODEL_FILE", "intent_model.npz"))
+    eval_parser.add_argument("--sources", default="llm,rules")
+    eval_parser.add_argument("--threshold", type=float, default=float(os.environ.get("INTENT_MODEL_THRESHOLD", 0.8)))
+    args = parser.parse_args()
+
+    if np is None:
+        parser.error("numpy is required: pip install numpy")
+
+    records = read_decisions(args.log, [s.strip() for s in args.sources.split(",") if s.strip()])
+    if not records:
+        parser.error(f"No usable decisions in {args.log}")
+
+    if args.command == "evaluate":
+        model = IntentModel.load(args.model)
+        print(f"📊 {len(records)} decisions: {json.dumps(evaluate(model, records, args.threshold))}")
+        return
+
+    random.Random(0).shuffle(records)
+    holdout = int(len(records) * args.holdout)
+    test, train = records[:holdout], records[holdout:]
+
+    started = time.perf_counter()
+    model = IntentModel.train(train, dim=1 << args.dim_bits, epochs=args.epochs)
+    print(f"🧠 Trained on {len(train)} decisions in {time.perf_counter() - started:.1f}s")
+    if test:
+        print(f"📊 Holdout ({len(test)}): {json.dumps(evaluate(model, test, args.threshold))}")
+
+    model.save(args.out)
+    print(f"💾 Saved {args.out}")
+
+if __name__ == "__main__":
+    main()
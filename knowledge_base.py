@@ -8,6 +8,7 @@ import os
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from employee_data import employee_db, SecurityLevel
+from container import container
 
 class KnowledgeBase:
     """Company knowledge base with controlled information disclosure."""
@@ -197,6 +198,10 @@ class KnowledgeBase:
                 "mission": self.company_info["mission"]
             }
 
+    def get_disclosure_level(self, inquiry_context: Dict[str, Any]) -> str:
+        """Disclosure level ("high" or "standard") an inquiry would be answered at."""
+        return self._determine_disclosure_level(inquiry_context)
+
     def _determine_disclosure_level(self, inquiry_context: Dict[str, Any]) -> str:
         """Determine appropriate disclosure level based on inquiry context."""
         
@@ -398,6 +403,6 @@ class ToolSystem:
         else:
             return {"error": f"Unknown tool: {tool_name}"}
 
-# Global instances
-knowledge_base = KnowledgeBase()
-tool_system = ToolSystem(knowledge_base)
+# Global instances (built on first use)
+knowledge_base = container.register("knowledge_base", KnowledgeBase)
+tool_system = container.register("tool_system", lambda: ToolSystem(container.get("knowledge_base")))
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+LLM Providers
+The assistant talks to its language model through one small interface:
+generate, generate_async, stream, stream_async and generate_batch, each
+taking a prompt and a ``kind`` ("reply", "classify" or "general") that
+selects the system instruction. GeminiProvider wraps google.generativeai;
+StubProvider is a deterministic local engine with configurable latency and
+error injection, for benchmarks and load tests without network or API key.
+Responses expose ``text`` and Gemini-style ``usage_metadata``
+"""
+
+import asyncio
+import datetime
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+from body_trim import estimate_tokens
+
+try:
+    import google.generativeai as genai
+except ImportError:  # only GeminiProvider needs it
+    genai = None
+
+# "gemini" (needs GEMINI_API_KEY) or "stub"
+LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "gemini").lower()
+
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash")
+
+# Explicit context caching of the static prompt prefix. Gemini only caches
+# content above a minimum token count and needs a versioned model name;
+# when cache creation fails the prefix is sent as a plain system instruction
+GEMINI_CONTEXT_CACHE = os.environ.get("GEMINI_CONTEXT_CACHE", "False").lower() == "true"
+GEMINI_CACHE_MODEL = os.environ.get("GEMINI_CACHE_MODEL", "models/gemini-2.0-flash-001")
+GEMINI_CACHE_TTL = int(os.environ.get("GEMINI_CACHE_TTL", 3600))
+
+# Kinds whose output must be JSON
+JSON_KINDS = {"classify"}
+
+class LLMResponse:
+    """Text plus usage, shaped like a Gemini response (and its stream chunks)"""
+
+    def __init__(self, text: str, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+class LLMProvider:
+    """Interface every provider implements.
+
+    ``timeout`` is the per-request deadline in seconds. ``stream`` returns an
+    iterable of chunks with ``text`` whose ``usage_metadata`` is set once it
+    is exhausted; ``stream_async`` returns the async equivalent.
+    """
+
+    name = "base"
+    model_name = ""
+
+    def __init__(self, instructions: Dict[str, str], batch_workers: int = 8):
+        self.instructions = instructions
+        self.batch_workers = batch_workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def generate(self, prompt: str, kind: str = "general", timeout: float = 30.0):
+        raise NotImplementedError
+
+    async def generate_async(self, prompt: str, kind: str = "general", timeout: float = 30.0):
+        raise NotImplementedError
+
+    def stream(self, prompt: str, kind: str = "general", timeout: float = 30.0):
+        raise NotImplementedError
+
+    async def stream_async(self, prompt: str, kind: str = "general", timeout: float = 30.0):
+        raise NotImplementedError
+
+    def generate_batch(self, prompts: List[str], kind: str = "general", timeout: float = 30.0) -> List[Any]:
+        """Run prompts concurrently; each slot holds a response or the exception it raised"""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.batch_workers,
+                                                    thread_name_prefix=f"llm-{self.name}")
+        futures = [self._executor.submit(self.generate, prompt, kind, timeout) for prompt in prompts]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    async def generate_batch_async(self, prompts: List[str], kind: str = "general",
+                                   timeout: float = 30.0) -> List[Any]:
+        return await asyncio.gather(*(self.generate_async(prompt, kind, timeout) for prompt in prompts),
+                                    return_exceptions=True)
+
+    def get_info(self) -> Dict[str, Any]:
+        """Static description of the provider; safe to cache"""
+        return {"provider": self.name, "model": self.model_name}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Live call counters, if the provider keeps any"""
+        return {}
+
+class GeminiProvider(LLMProvider):
+    """google.generativeai models, one per kind, with optional context caching of the reply prefix"""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str, instructions: Dict[str, str], model_name: str = GEMINI_MODEL,
+                 context_cache: bool = GEMINI_CONTEXT_CACHE):
+        if genai is None:
+            raise RuntimeError("google-generativeai is not installed")
+        super().__init__(instructions)
+        self.model_name = model_name
+        self.context_cache = context_cache
+        genai.configure(api_key=api_key)
+
+        self._models = {kind: self._build_model(kind) for kind in ["general", *instructions]}
+        self._cache_lock = threading.Lock()
+        self._cache_expires = 0.0
+
+    def _build_model(self, kind: str):
+        config = {"response_mime_type": "application/json", "temperature": 0} if kind in JSON_KINDS else None
+        return genai.GenerativeModel(self.model_name, system_instruction=self.instructions.get(kind),
+                                     generation_config=config)
+
+    def _model(self, kind: str):
+        if kind == "reply" and self.context_cache:
+            return self._cached_reply_model()
+        return self._models.get(kind, self._models["general"])
+
+    def _cached_reply_model(self):
+        """Reply model, switched to (or refreshed on) a context cache."""
+        if time.time() < self._cache_expires:
+            return self._models["reply"]
+
+        with self._cache_lock:
+            if time.time() >= self._cache_expires:
+                try:
+                    cache = genai.caching.CachedContent.create(
+                        model=GEMINI_CACHE_MODEL,
+                        display_name="email-assistant-reply-prefix",
+                        system_instruction=self.instructions["reply"],
+                        ttl=datetime.timedelta(seconds=GEMINI_CACHE_TTL)
+                    )
+                    self._models["reply"] = genai.GenerativeModel.from_cached_content(cached_content=cache)
+                except Exception as e:
+                    print(f"⚠️  Gemini context cache unavailable, sending the prompt prefix uncached: {e}")
+                # Refresh shortly before the cache expires; retry failures after a TTL too
+                self._cache_expires = time.time() + max(60, GEMINI_CACHE_TTL - 60)
+        return self._models["reply"]
+
+    def generate(self, prompt: str, kind: str = "general", timeout: float = 30.0):
+        return self._model(kind).generate_content(prompt, request_options={"timeout": timeout})
+
+    async def generate_async(self, prompt: str, kind: str = "general", timeout: float = 30.0):
+        return await self._model(kind).generate_content_async(prompt, request_options={"timeout": timeout})
+
+    def stream(self, prompt: str, kind: str = "general", timeout: float = 30.0):
+        return self._model(kind).generate_content(prompt, stream=True, request_options={"timeout": timeout})
+
+    async def stream_async(self, prompt: str, kind: str = "general", timeout: float = 30.0):
+        return await self._model(kind).generate_content_async(prompt, stream=True,
+                                                              request_options={"timeout": timeout})
+
+class StubProviderError(ConnectionError):
+    """Injected failure; a ConnectionError so callers treat it as transient"""
+
+class _StubStream:
+    """A stub reply delivered in chunks after the simulated time to first chunk.
+
+    With ``error`` set the stream fails instead of its first chunk, like a
+    dropped connection.
+    """
+
+    def __init__(self, chunks: List[str], delay: float, usage, error: Optional[Exception] = None):
+        self._chunks = chunks
+        self._delay = delay
+        self._usage = usage
+        self._error = error
+        self.usage_metadata = None
+
+    def __iter__(self):
+        time.sleep(self._delay)
+        if self._error:
+            raise self._error
+        for chunk in self._chunks:
+            yield LLMResponse(chunk)
+        self.usage_metadata = self._usage
+
+    async def __aiter__(self):
+        await asyncio.sleep(self._delay)
+        if self._error:
+            raise self._error
+        for chunk in self._chunks:
+            yield LLMResponse(chunk)
+        self.usage_metadata = self._usage
+
+class StubProvider(LLMProvider):
+    """Deterministic local engine.
+
+    Replies and classifications are derived from the prompt alone, so the
+    same input always gives the same output. Each call takes ``latency``
+    seconds, varied by up to ``jitter`` (a fraction) and, for a
+    ``slow_rate`` share of calls, ``slow_latency`` instead; an
+    ``error_rate`` share fails with StubProviderError. Calls slower than
+    their timeout raise TimeoutError at the deadline. Latency and failures
+    come from a generator seeded with ``seed``.
+    """
+
+    name = "stub"
+    model_name = "stub"
+
+    CATEGORY_KEYWORDS = (
+        ("executive", ("ceo", "cto", "executive", "board", "director")),
+        ("hr", ("job", "career", "resume", "hiring", "position")),
+        ("technical", ("api", "integration", "sdk", "endpoint", "code")),
+        ("sales", ("price", "pricing", "quote", "buy", "purchase", "order", "seats")),
+        ("support", ("help", "issue", "problem", "error", "broken", "bug"))
+    )
+    URGENT_WORDS = ("urgent", "asap", "emergency", "critical", "immediately")
+
+    def __init__(self, instructions: Dict[str, str], latency: float = 0.05, jitter: float = 0.2,
+                 slow_rate: float = 0.0, slow_latency: float = 1.0, error_rate: float = 0.0, seed: int = 0):
+        super().__init__(instructions)
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "errors": 0, "timeouts": 0}
+
+        signature = re.search(r'Sign your responses as "([^"]+)"', instructions.get("reply", ""))
+        self.signature = signature.group(1) if signature else "Assistant"
+
+    @classmethod
+    def from_env(cls, instructions: Dict[str, str]) -> "StubProvider":
+        """Build a stub from STUB_* environment variables"""
+        return cls(
+            instructions,
+            latency=float(os.environ.get("STUB_LATENCY", 0.05)),
+            jitter=float(os.environ.get("STUB_JITTER", 0.2)),
+            slow_rate=float(os.environ.get("STUB_SLOW_RATE", 0.0)),
+            slow_latency=float(os.environ.get("STUB_SLOW_LATENCY", 1.0)),
+            error_rate=float(os.environ.get("STUB_ERROR_RATE", 0.0)),
+            seed=int(os.environ.get("STUB_SEED", 0))
+        )
+
+    def _plan(self, timeout: float):
+        """Draw this call's latency and outcome; returns (delay, error or None)"""
+        with self._lock:
+            self.stats["calls"] += 1
+            slow = self._random.random() < self.slow_rate
+            failed = self._random.random() < self.error_rate
+            latency = self.slow_latency if slow else self.latency * (1 + self.jitter * (2 * self._random.random() - 1))
+
+            if latency > timeout:
+                self.stats["timeouts"] += 1
+                return timeout, TimeoutError(f"stub call exceeded its {timeout:.1f}s timeout")
+            if failed:
+                self.stats["errors"] += 1
+                return latency, StubProviderError("injected stub failure")
+        return latency, None
+
+    def _usage(self, prompt: str, kind: str, text: str):
+        return SimpleNamespace(prompt_token_count=estimate_tokens(self.instructions.get(kind, "") + prompt),
+                               cached_content_token_count=0,
+                               candidates_token_count=estimate_tokens(text))
+
+    def _classify_one(self, text: str) -> Dict[str, Any]:
+        lowered = text.lower()
+        category = next((name for name, words in self.CATEGORY_KEYWORDS if any(w in lowered for w in words)), "other")
+        return {
+            "category": category,
+            "urgency": "high" if any(w in lowered for w in self.URGENT_WORDS) else "normal",
+            "requires_reply": "?" in text,
+            "requires_forwarding": category != "other"
+        }
+
+    def _respond(self, prompt: str, kind: str) -> str:
+        if kind == "classify":
+            items = re.split(r"^EMAIL (\d+)$", prompt, flags=re.MULTILINE)[1:]
+            entries = [dict(self._classify_one(body), index=int(index)) for index, body in zip(items[::2], items[1::2])]
+            return json.dumps(entries)
+
+        sender = re.search(r"^FROM: (.*)$", prompt, re.MULTILINE)
+        subject = re.search(r"^SUBJECT: (.*)$", prompt, re.MULTILINE)
+        name = (sender.group(1).split() or ["there"])[0] if sender else "there"
+        topic = subject.group(1).strip() if subject else "your message"
+        reference = zlib.crc32(prompt.encode("utf-8")) % 10000
+        return (f"Hi {name},\n\nThank you for your email about \"{topic}\". I have looked into it and "
+                f"will follow up with the details shortly (ref {reference:04d}).\n\n"
+                f"Best regards,\n{self.signature}")
+
+    def generate(self, prompt: str, kind: str = "general", timeout: float = 30.0):
+        delay, error = self._plan(timeout)
+        time.sleep(delay)
+        if error:
+            raise error
+        text = self._respond(prompt, kind)
+        return LLMResponse(text, self._usage(prompt, kind, text))
+
+    async def generate_async(self, prompt: str, kind: str = "general", timeout: float = 30.0):
+        delay, error = self._plan(timeout)
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        text = self._respond(prompt, kind)
+        return LLMResponse(text, self._usage(prompt, kind, text))
+
+    def _stream(self, prompt: str, kind: str, timeout: float) -> _StubStream:
+        delay, error = self._plan(timeout)
+        if error:
+            return _StubStream([], delay, None, error)
+        text = self._respond(prompt, kind)
+        words = text.split(" ")
+        chunks = [" ".join(words[i:i + 8]) + (" " if i + 8 < len(words) else "") for i in range(0, len(words), 8)]
+        return _StubStream(chunks, delay, self._usage(prompt, kind, text))
+
+    def stream(self, prompt: str, kind: str = "general", timeout: float = 30.0):
+        return self._stream(prompt, kind, timeout)
+
+    async def stream_async(self, prompt: str, kind: str = "general", timeout: float = 30.0):
+        return self._stream(prompt, kind, timeout)
+
+    def get_info(self) -> Dict[str, Any]:
+        return dict(super().get_info(), latency=self.latency, error_rate=self.error_rate)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats)
+
+def create_provider(instructions: Dict[str, str], api_key: Optional[str] = None,
+                    name: str = LLM_PROVIDER) -> Optional[LLMProvider]:
+    """The configured provider, or None when Gemini has no API key (or no SDK)"""
+    if name == "stub":
+        return StubProvider.from_env(instructions)
+    if name != "gemini":
+        raise ValueError(f"Unknown LLM provider: {name}")
+    if not api_key:
+        return None
+    try:
+        return GeminiProvider(api_key, instructions)
+    except RuntimeError as e:
+        print(f"⚠️  Gemini unavailable: {e}")
+        return None
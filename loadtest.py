@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Load Test for the Email Assistant API
+Drives many concurrent requests against one endpoint and reports throughput,
+latency percentiles and status codes. Run it once against the Flask
+deployment (gunicorn api_server:app) and once against the ASGI deployment
+(uvicorn asgi_server:app) to compare them.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import List
+
+import httpx
+
+DEFAULT_EMAIL = {
+    "email": {
+        "sender": "customer@example.com",
+        "subject": "Pricing question",
+        "body": "Hi, can you send me a quote for your cloud migration services? Thanks!"
+    }
+}
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+async def run_load(url: str, method: str, payload, api_key: str, concurrency: int,
+                   total: int, timeout: float):
+    """Issue total requests with at most concurrency in flight"""
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def one_request():
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.request(
+                        method, url, headers={"X-API-Key": api_key},
+                        json=payload if method != "GET" else None
+                    )
+                    statuses[response.status_code] += 1
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one_request() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+
+    return elapsed, latencies, statuses
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test an Email Assistant API deployment")
+    parser.add_argument("--base-url", default="http://localhost:5000")
+    parser.add_argument("--path", default="/api/v1/emails/analyze")
+    parser.add_argument("--method", default="POST")
+    parser.add_argument("--payload", help="JSON request body (defaults to a sample analyze request)")
+    parser.add_argument("--api-key", default="your-secret-api-key-here")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--timeout", type=float, default=180.0)
+    args = parser.parse_args()
+
+    payload = json.loads(args.payload) if args.payload else DEFAULT_EMAIL
+    url = args.base_url.rstrip("/") + args.path
+
+    print(f"🔥 {args.method} {url}")
+    print(f"   Concurrency: {args.concurrency}, Requests: {args.requests}")
+
+    elapsed, latencies, statuses = asyncio.run(run_load(
+        url, args.method.upper(), payload, args.api_key,
+        args.concurrency, args.requests, args.timeout
+    ))
+
+    print("=" * 60)
+    print(f"Elapsed:     {elapsed:.2f}s")
+    print(f"Throughput:  {len(latencies) / elapsed:.1f} req/s")
+    print(f"Latency p50: {percentile(latencies, 50) * 1000:.0f} ms")
+    print(f"Latency p95: {percentile(latencies, 95) * 1000:.0f} ms")
+    print(f"Latency p99: {percentile(latencies, 99) * 1000:.0f} ms")
+    print(f"Statuses:    {dict(statuses)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Multi-Mailbox Email Monitor
+Watches many Gmail mailboxes from one process. Each mailbox has its own
+credentials and poll schedule, while the knowledge base, employee data, AI
+classifier and message ledger are shared. Polls run on a shared worker pool,
+and mailboxes can be sharded across several monitor processes with
+consistent hashing
+"""
+
+import argparse
+import bisect
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+from poll_scheduler import AdaptivePollScheduler
+from shutdown import shutdown, install_pipeline_hooks
+
+class MailboxConfig:
+    """Credentials and identity of one monitored mailbox"""
+
+    def __init__(self, name: str, token_file: str, address: Optional[str] = None):
+        self.name = name
+        self.token_file = token_file
+        self.address = address or name
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "MailboxConfig":
+        return cls(data["name"], data["token_file"], data.get("address"))
+
+    def __repr__(self) -> str:
+        return f"<MailboxConfig {self.name}>"
+
+def load_mailboxes(path: str) -> List[MailboxConfig]:
+    """Load mailbox definitions from a JSON list of {name, token_file, address}"""
+    with open(path, "r") as f:
+        entries = json.load(f)
+
+    mailboxes = [MailboxConfig.from_dict(entry) for entry in entries]
+    names = [mailbox.name for mailbox in mailboxes]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate mailbox names in {path}")
+    return mailboxes
+
+class ConsistentHashRing:
+    """Maps keys to nodes so that resizing the ring moves few keys.
+
+    Each node is placed on the ring at many virtual points; a key belongs to
+    the first node point clockwise from its hash.
+    """
+
+    def __init__(self, nodes: List[str], replicas: int = 128):
+        if not nodes:
+            raise ValueError("A hash ring needs at least one node")
+
+        self.replicas = replicas
+        points = []
+        for node in nodes:
+            for i in range(replicas):
+                points.append((self._hash(f"{node}#{i}"), node))
+        points.sort()
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def node_for(self, key: str) -> str:
+        index = bisect.bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+def select_shard(mailboxes: List[MailboxConfig], shard_index: int, shard_count: int) -> List[MailboxConfig]:
+    """Mailboxes owned by one monitor process out of ``shard_count``"""
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"Shard index {shard_index} out of range for {shard_count} shards")
+    if shard_count == 1:
+        return list(mailboxes)
+
+    ring = ConsistentHashRing([f"shard-{i}" for i in range(shard_count)])
+    own = f"shard-{shard_index}"
+    return [mailbox for mailbox in mailboxes if ring.node_for(mailbox.name) == own]
+
+def ai_pipeline(service, mailbox: MailboxConfig, max_messages: int) -> int:
+    """Knowledge-base and Gemini pipeline from email_assistant"""
+    from email_assistant import process_mailbox
+    return process_mailbox(service, mailbox=mailbox.name, sender_address=mailbox.address,
+                           max_messages=max_messages)
+
+def rules_pipeline(service, mailbox: MailboxConfig, max_messages: int) -> int:
+    """Rule-based pipeline from email_monitor"""
+    from email_monitor import process_new_emails
+    return process_new_emails(service, mailbox=mailbox.name, max_messages=max_messages)
+
+PIPELINES = {
+    "ai": ai_pipeline,
+    "rules": rules_pipeline,
+}
+
+class MailboxMonitor:
+    """Polls many mailboxes fairly on a shared worker pool.
+
+    Every mailbox has its own adaptive schedule and at most one poll in
+    flight, and each poll handles at most ``max_messages_per_poll`` messages,
+    so a busy mailbox gets polled again soon but cannot hold more than one
+    worker or delay the others for long. Gmail service objects are not
+    thread-safe; the one-poll-per-mailbox rule also keeps each service on a
+    single thread at a time.
+    """
+
+    def __init__(self, mailboxes: List[MailboxConfig], pipeline: Callable = ai_pipeline,
+                 workers: int = 4, max_messages_per_poll: int = 20,
+                 service_factory: Optional[Callable] = None):
+        self.mailboxes = {mailbox.name: mailbox for mailbox in mailboxes}
+        self.pipeline = pipeline
+        self.workers = workers
+        self.max_messages_per_poll = max_messages_per_poll
+        self.service_factory = service_factory or self._default_service_factory
+        self.schedulers = {name: AdaptivePollScheduler.from_env() for name in self.mailboxes}
+        self.stats = {name: {"polls": 0, "handled": 0, "errors": 0} for name in self.mailboxes}
+        self._services = {}
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def _default_service_factory(mailbox: MailboxConfig):
+        from email_assistant import get_gmail_service
+        return get_gmail_service(mailbox.token_file)
+
+    def _poll(self, name: str) -> int:
+        """Run one poll of a mailbox (executes on a worker thread)"""
+        mailbox = self.mailboxes[name]
+        service = self._services.get(name)
+        if service is None:
+            service = self._services[name] = self.service_factory(mailbox)
+        return self.pipeline(service, mailbox, self.max_messages_per_poll)
+
+    def run(self, max_cycles: Optional[int] = None):
+        """Poll until stopped, or until ``max_cycles`` polls have finished"""
+        self._stop_event.clear()
+        sequence = itertools.count()
+        due = [(time.monotonic(), next(sequence), name) for name in self.mailboxes]
+        heapq.heapify(due)
+        in_flight = {}
+        finished = 0
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="mailbox") as pool:
+            while not self._stop_event.is_set() and (due or in_flight):
+                # Hand out due mailboxes, oldest deadline first, while workers are free
+                now = time.monotonic()
+                while due and due[0][0] <= now and len(in_flight) < self.workers:
+                    _, _, name = heapq.heappop(due)
+                    in_flight[pool.submit(self._poll, name)] = name
+
+                timeout = max(0.0, due[0][0] - now) if due and len(in_flight) < self.workers else None
+                if not in_flight:
+                    self._stop_event.wait(timeout or 0)
+                    continue
+
+                done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = in_flight.pop(future)
+                    scheduler = self.schedulers[name]
+                    stats = self.stats[name]
+                    stats["polls"] += 1
+                    try:
+                        handled = future.result()
+                        stats["handled"] += handled
+                        scheduler.record_tick(handled)
+                        if handled:
+                            print(f"✅ [{name}] Processed {handled} emails")
+                    except Exception as e:
+                        stats["errors"] += 1
+                        scheduler.record_error(e)
+                        # Rebuild the service next time in case the credentials went stale
+                        self._services.pop(name, None)
+                        print(f"❌ [{name}] Poll failed: {e}")
+
+                    heapq.heappush(due, (time.monotonic() + scheduler.next_delay(), next(sequence), name))
+                    finished += 1
+
+                if max_cycles is not None and finished >= max_cycles:
+                    break
+
+    def stop(self):
+        """Stop after the polls currently in flight"""
+        self._stop_event.set()
+
+    def get_stats(self) -> Dict[str, Dict]:
+        return {name: dict(stats, interval=self.schedulers[name].interval)
+                for name, stats in self.stats.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Monitor many Gmail mailboxes from one process")
+    parser.add_argument("--mailboxes", default=os.environ.get("MAILBOXES_FILE", "mailboxes.json"),
+                        help="JSON file listing {name, token_file, address} per mailbox")
+    parser.add_argument("--pipeline", choices=sorted(PIPELINES), default=os.environ.get("MONITOR_PIPELINE", "ai"))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("MONITOR_WORKERS", 4)))
+    parser.add_argument("--max-messages-per-poll", type=int, default=int(os.environ.get("MONITOR_MAX_MESSAGES_PER_POLL", 20)))
+    parser.add_argument("--shard-index", type=int, default=int(os.environ.get("MONITOR_SHARD_INDEX", 0)))
+    parser.add_argument("--shard-count", type=int, default=int(os.environ.get("MONITOR_SHARD_COUNT", 1)))
+    args = parser.parse_args()
+
+    mailboxes = select_shard(load_mailboxes(args.mailboxes), args.shard_index, args.shard_count)
+    print("🤖 Starting Multi-Mailbox Monitor...")
+    print(f"   - Shard {args.shard_index + 1}/{args.shard_count}: {len(mailboxes)} mailboxes")
+    print(f"   - Pipeline: {args.pipeline}, {args.workers} workers")
+    print("   - Press Ctrl+C to stop")
+    print("=" * 60)
+
+    if not mailboxes:
+        print("⚠️  No mailboxes assigned to this shard")
+        return
+
+    if args.pipeline == "ai":
+        from email_assistant import ensure_gemini
+        ensure_gemini()
+
+    from email_assistant import get_gmail_service
+    from send_queue import send_queue
+    from forward_digest import forward_digest
+    for mailbox in mailboxes:
+        send_queue.register_mailbox(mailbox.name, lambda token_file=mailbox.token_file: get_gmail_service(token_file))
+    send_queue.compact()
+    send_queue.start()
+    forward_digest.start()
+
+    monitor = MailboxMonitor(mailboxes, PIPELINES[args.pipeline], workers=args.workers,
+                             max_messages_per_poll=args.max_messages_per_poll)
+
+    # SIGTERM/SIGINT: no new polls, in-flight polls stop after their current
+    # email, then digests, the send queue and the ledger are flushed
+    shutdown.install_signal_handlers()
+    shutdown.on_request(monitor.stop)
+    install_pipeline_hooks()
+    try:
+        monitor.run()
+    except KeyboardInterrupt:
+        print("\n🛑 Forced stop, skipping drain")
+        return
+
+    print("\n🛑 Stopping Multi-Mailbox Monitor...")
+    shutdown.finish()
+
+    for name, stats in monitor.get_stats().items():
+        print(f"   {name}: {stats['handled']} handled in {stats['polls']} polls ({stats['errors']} errors)")
+
+if __name__ == "__main__":
+    main()
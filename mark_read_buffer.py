@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Batched Mark-as-Read for processed messages
+Collects the ids of messages whose processing is done and removes their
+UNREAD label with users().messages().batchModify, up to 1000 ids per call,
+instead of one messages().modify round trip per message
+"""
+
+import os
+import time
+from typing import Optional
+from message_ledger import message_ledger, STEP_MARKED_READ, STEP_READ_QUEUED
+
+# Gmail's limit on ids per batchModify call
+MAX_BATCH_SIZE = 1000
+
+class MarkReadBuffer:
+    """Buffers mark-read requests for one mailbox.
+
+    Flushes when ``max_batch`` ids are waiting, when the oldest has waited
+    ``max_delay`` seconds, and whenever ``flush()`` is called (pipelines do so
+    at the end of every poll and on shutdown). A queued message is recorded
+    in the ledger as STEP_READ_QUEUED and only completed once the flush
+    succeeds; after a failed flush or a crash, ``recover()`` queues it again.
+    """
+
+    def __init__(self, service, ledger=message_ledger, mailbox: str = "me",
+                 max_batch: Optional[int] = None, max_delay: Optional[float] = None):
+        self.service = service
+        self.ledger = ledger
+        self.mailbox = mailbox
+        self.max_batch = min(MAX_BATCH_SIZE, max_batch or int(os.environ.get("MARK_READ_BATCH_SIZE", MAX_BATCH_SIZE)))
+        self.max_delay = max_delay if max_delay is not None else float(os.environ.get("MARK_READ_MAX_DELAY", 5))
+        self._pending = {}
+        self._oldest = None
+        self.flushed = 0
+        self.api_calls = 0
+        self.failures = 0
+        self.last_error = None
+
+    def __contains__(self, msg_id: str) -> bool:
+        return msg_id in self._pending
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, msg_id: str):
+        """Queue a fully processed message to be marked read"""
+        if msg_id in self._pending:
+            return
+
+        self.ledger.record(msg_id, STEP_READ_QUEUED, self.mailbox)
+        self._pending[msg_id] = None
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+
+        if len(self._pending) >= self.max_batch or self.is_due():
+            self.flush()
+
+    def recover(self) -> int:
+        """Queue messages a previous flush or run left unmarked"""
+        recovered = 0
+        for msg_id in self.ledger.waiting(STEP_READ_QUEUED, self.mailbox):
+            if msg_id not in self._pending:
+                self._pending[msg_id] = None
+                recovered += 1
+        if recovered and self._oldest is None:
+            self._oldest = time.monotonic()
+        return recovered
+
+    def is_due(self) -> bool:
+        return self._oldest is not None and time.monotonic() - self._oldest >= self.max_delay
+
+    def flush(self) -> int:
+        """Mark every queued message read; returns how many were flushed.
+
+        On a Gmail error the ids stay queued for the next flush and the error
+        is kept in ``last_error`` rather than raised.
+        """
+        flushed = 0
+        while self._pending:
+            batch = list(self._pending)[:self.max_batch]
+            try:
+                self.service.users().messages().batchModify(
+                    userId='me',
+                    body={'ids': batch, 'removeLabelIds': ['UNREAD']}
+                ).execute()
+            except Exception as e:
+                self.failures += 1
+                self.last_error = e
+                print(f"⚠️  Mark-read flush failed, {len(self._pending)} messages kept for retry: {e}")
+                break
+
+            self.api_calls += 1
+            self.ledger.complete_many(batch, STEP_MARKED_READ, self.mailbox)
+            for msg_id in batch:
+                del self._pending[msg_id]
+            flushed += len(batch)
+
+        self.flushed += flushed
+        self._oldest = time.monotonic() if self._pending else None
+        return flushed
+
+    def get_stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "flushed": self.flushed,
+            "api_calls": self.api_calls,
+            "failures": self.failures
+        }
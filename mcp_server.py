@@ -7,6 +7,7 @@ Exposes email processing capabilities as MCP tools while preserving core functio
 import os
 import sys
 import json
+import base64
 import asyncio
 from typing import Any, Dict, List, Optional
 from pathlib import Path
@@ -14,11 +15,17 @@ from pathlib import Path
 # Add current directory to path for imports
 sys.path.append(str(Path(__file__).parent))
 
-from mcp.server.fastmcp import FastMCP
-from email_assistant import get_gmail_service, process_emails, CONTACTS
+from mcp.server.fastmcp import FastMCP, Context
+from email_assistant import get_gmail_service, process_emails, update_contacts, CONTACTS
 from ai_assistant import ai_assistant
 from knowledge_base import knowledge_base, tool_system
 from private_knowledge_base import private_kb
+from serialization import dumps
+from mime_utils import extract_body_details
+from message_fetch import fetch_message, fetch_headers, load_attachment
+
+# Tool results are compact JSON unless pretty output is requested
+MCP_PRETTY_JSON = os.environ.get("MCP_PRETTY_JSON", "False").lower() == "true"
 
 # Initialize MCP server
 mcp = FastMCP("email-assistant")
@@ -37,7 +44,7 @@ def _ensure_gmail_service():
 
 def _format_response(data: Any) -> str:
     """Format response data as JSON."""
-    return json.dumps(data, indent=2, sort_keys=True)
+    return dumps(data, pretty=MCP_PRETTY_JSON)
 
 # ===== Email Processing Tools =====
 
@@ -91,17 +98,25 @@ async def analyze_email_intent(sender: str, subject: str, body: str) -> str:
         })
 
 @mcp.tool()
-async def generate_email_reply(sender: str, subject: str, body: str) -> str:
+async def generate_email_reply(sender: str, subject: str, body: str, ctx: Context = None) -> str:
     """
     Generate an intelligent reply for an email.
     
+    The reply text is also sent as log notifications while it is generated,
+    so clients can show a draft before the result arrives.
+    
     Args:
         sender: Email sender
         subject: Email subject
         body: Email body content
     """
     try:
-        reply = ai_assistant.generate_intelligent_reply(sender, subject, body)
+        parts = []
+        async for chunk in ai_assistant.stream_intelligent_reply_async(sender, subject, body):
+            parts.append(chunk)
+            if ctx is not None:
+                await ctx.info(chunk)
+        reply = "".join(parts)
         
         return _format_response({
             "status": "success",
@@ -139,7 +154,7 @@ async def get_unread_emails(limit: int = 10) -> str:
         
         for message_stub in messages:
             msg_id = message_stub['id']
-            full_message = gmail_service.users().messages().get(userId='me', id=msg_id).execute()
+            full_message = fetch_headers(gmail_service, msg_id, ['Subject', 'From', 'Date'])
             
             headers = full_message['payload']['headers']
             subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
@@ -175,20 +190,15 @@ async def get_email_content(message_id: str) -> str:
     try:
         _ensure_gmail_service()
         
-        full_message = gmail_service.users().messages().get(userId='me', id=message_id).execute()
+        full_message = fetch_message(gmail_service, message_id)
         
         headers = full_message['payload']['headers']
         subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
         sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown Sender')
         date = next((h['value'] for h in headers if h['name'] == 'Date'), 'Unknown Date')
         
-        # Extract body (simplified)
-        body = ""
-        if 'parts' in full_message['payload']:
-            for part in full_message['payload']['parts']:
-                if part['mimeType'] == 'text/plain':
-                    body = part['body']['data']
-                    break
+        # Decoded body text (text/plain, or stripped text/html)
+        body = extract_body_details(full_message)
         
         return _format_response({
             "status": "success",
@@ -196,7 +206,10 @@ async def get_email_content(message_id: str) -> str:
             "subject": subject,
             "sender": sender,
             "date": date,
-            "body": body
+            "body": body["text"],
+            "body_type": body["mime_type"],
+            "truncated": body["truncated"],
+            "attachments": full_message["attachments"]
         })
     except Exception as e:
         return _format_response({
@@ -204,6 +217,42 @@ async def get_email_content(message_id: str) -> str:
             "message": f"Failed to get email content: {str(e)}"
         })
 
+@mcp.tool()
+async def get_email_attachment(message_id: str, part_id: str, max_bytes: int = 5 * 1024 * 1024) -> str:
+    """
+    Download one attachment of an email, as listed by get_email_content.
+    
+    Args:
+        message_id: Gmail message ID
+        part_id: part_id of the attachment
+        max_bytes: Maximum number of bytes to return (default: 5 MB)
+    """
+    try:
+        _ensure_gmail_service()
+        
+        full_message = fetch_message(gmail_service, message_id)
+        attachment = next((a for a in full_message["attachments"] if a["part_id"] == part_id), None)
+        if attachment is None:
+            return _format_response({
+                "status": "error",
+                "message": f"No attachment with part_id {part_id} in message {message_id}"
+            })
+        
+        data = load_attachment(gmail_service, message_id, attachment, max_bytes=max_bytes + 1)
+        
+        return _format_response({
+            "status": "success",
+            "message_id": message_id,
+            "attachment": attachment,
+            "data_base64": base64.b64encode(data[:max_bytes]).decode(),
+            "truncated": len(data) > max_bytes
+        })
+    except Exception as e:
+        return _format_response({
+            "status": "error",
+            "message": f"Failed to get email attachment: {str(e)}"
+        })
+
 # ===== Knowledge Base Tools =====
 
 @mcp.tool()
@@ -486,7 +535,7 @@ async def update_contacts_config(contacts: str) -> str:
     try:
         new_contacts = json.loads(contacts)
         # Update global CONTACTS
-        CONTACTS.update(new_contacts)
+        update_contacts(new_contacts)
         
         return _format_response({
             "status": "success",
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Attachment-aware Gmail message fetching
+Requests only the message fields the pipelines read, drops any attachment
+payload Gmail returns inline as soon as the response arrives, and keeps
+attachment metadata instead. Attachment bytes are downloaded with
+attachments().get only when a caller asks for a specific attachment
+"""
+
+import os
+from typing import Dict, List, Optional
+from mime_utils import decode_base64url, find_body_part, is_attachment, iter_parts
+
+# Levels of nested multipart spelled out in the fields mask; anything deeper
+# is returned whole by the innermost ``parts``
+MASK_DEPTH = int(os.environ.get("MESSAGE_MASK_DEPTH", 4))
+
+PART_FIELDS = "partId,mimeType,filename,headers,body"
+
+def _parts_mask(depth: int) -> str:
+    mask = "parts"
+    for _ in range(depth):
+        mask = f"parts({PART_FIELDS},{mask})"
+    return mask
+
+# Leaves out historyId, internalDate and other response fields nothing reads
+MESSAGE_FIELDS = f"id,threadId,labelIds,snippet,sizeEstimate,payload({PART_FIELDS},{_parts_mask(MASK_DEPTH)})"
+
+def attachment_info(part: Dict) -> Dict:
+    """Metadata of an attachment part: filename, mime type, size and where to get it"""
+    body = part.get("body") or {}
+    return {
+        "part_id": part.get("partId"),
+        "filename": part.get("filename") or "",
+        "mime_type": part.get("mimeType") or "application/octet-stream",
+        "size": body.get("size", 0),
+        "attachment_id": body.get("attachmentId")
+    }
+
+def strip_attachments(message: Dict) -> List[Dict]:
+    """Drop inline attachment data from a fetched message, keeping metadata.
+
+    The metadata list is also stored as ``message['attachments']``.
+    """
+    attachments = []
+    for part in iter_parts(message.get("payload") or {}):
+        if part is message.get("payload") or not is_attachment(part):
+            continue
+        attachments.append(attachment_info(part))
+        (part.get("body") or {}).pop("data", None)
+    message["attachments"] = attachments
+    return attachments
+
+def _body_stored_separately(payload: Dict) -> Optional[Dict]:
+    """A text part Gmail moved out of the response because it is large"""
+    html_part = None
+    for part in iter_parts(payload):
+        mime_type = (part.get("mimeType") or "").lower()
+        body = part.get("body") or {}
+        if mime_type not in ("text/plain", "text/html") or is_attachment(part):
+            continue
+        if body.get("data") or not body.get("attachmentId"):
+            continue
+        if mime_type == "text/plain":
+            return part
+        if html_part is None:
+            html_part = part
+    return html_part
+
+def fetch_message(service, msg_id: str, user_id: str = 'me') -> Dict:
+    """Fetch a message for processing, without attachment bytes.
+
+    Headers, labels and the body part are returned as Gmail sends them;
+    attachments are described in ``message['attachments']``. A body that
+    Gmail stores as a separate attachment is fetched, since the pipelines
+    need it.
+    """
+    message = service.users().messages().get(userId=user_id, id=msg_id, format='full',
+                                             fields=MESSAGE_FIELDS).execute()
+    strip_attachments(message)
+
+    payload = message.get("payload") or {}
+    if find_body_part(payload)[0] is None:
+        part = _body_stored_separately(payload)
+        if part is not None:
+            attachment = service.users().messages().attachments().get(
+                userId=user_id, messageId=msg_id, id=part["body"]["attachmentId"]
+            ).execute()
+            part["body"]["data"] = attachment.get("data", "")
+
+    return message
+
+def fetch_headers(service, msg_id: str, headers: List[str], user_id: str = 'me') -> Dict:
+    """Fetch only labels and the named headers, never any body or attachment"""
+    return service.users().messages().get(
+        userId=user_id, id=msg_id, format='metadata', metadataHeaders=headers,
+        fields="id,threadId,labelIds,snippet,sizeEstimate,payload/headers"
+    ).execute()
+
+def load_attachment(service, msg_id: str, attachment: Dict, user_id: str = 'me',
+                    max_bytes: Optional[int] = None) -> bytes:
+    """Download one attachment described by attachment_info().
+
+    Attachments Gmail stores separately come from attachments().get; small
+    ones it inlined (and strip_attachments dropped) are read from a fresh
+    fetch of the message.
+    """
+    if attachment.get("attachment_id"):
+        data = service.users().messages().attachments().get(
+            userId=user_id, messageId=msg_id, id=attachment["attachment_id"]
+        ).execute().get("data", "")
+    else:
+        message = service.users().messages().get(userId=user_id, id=msg_id, format='full',
+                                                 fields=MESSAGE_FIELDS).execute()
+        part = next((part for part in iter_parts(message.get("payload") or {})
+                     if part.get("partId") == attachment.get("part_id")), None)
+        if part is None:
+            raise KeyError(f"Attachment part {attachment.get('part_id')} not found in message {msg_id}")
+        data = (part.get("body") or {}).get("data", "")
+
+    return decode_base64url(data, max_bytes)[0]
+
+def describe_attachments(attachments: List[Dict]) -> str:
+    """One line listing attachments, e.g. 'report.pdf (application/pdf, 1.2 MB)'"""
+    def size_text(size: int) -> str:
+        for unit in ("bytes", "KB", "MB"):
+            if size < 1024 or unit == "MB":
+                return f"{size:.0f} {unit}" if unit == "bytes" else f"{size:.1f} {unit}"
+            size /= 1024
+
+    return ", ".join(f"{a['filename'] or '(unnamed)'} ({a['mime_type']}, {size_text(a['size'])})"
+                     for a in attachments)
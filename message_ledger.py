@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Processed-Message Ledger for the email pipeline
+Durable record of which messages have been replied to, forwarded and marked
+read, so a restart resumes where it stopped without sending anything twice
+"""
+
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional
+from container import container
+
+# Pipeline steps, stored as a bitmask per message
+STEP_REPLIED = 1
+STEP_FORWARDED = 2
+STEP_MARKED_READ = 4
+# All work done, waiting for a batched mark-read (see mark_read_buffer.py)
+STEP_READ_QUEUED = 8
+
+STEP_NAMES = {
+    STEP_REPLIED: "replied",
+    STEP_FORWARDED: "forwarded",
+    STEP_MARKED_READ: "marked_read",
+    STEP_READ_QUEUED: "read_queued",
+}
+
+class BloomFilter:
+    """Fixed-size Bloom filter for fast "definitely not seen" checks"""
+
+    def __init__(self, capacity: int = 100000, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        """Derive bit positions with double hashing over one digest"""
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    @property
+    def saturated(self) -> bool:
+        """True once more items were added than the filter was sized for"""
+        return self.count > self.capacity
+
+class MessageLedger:
+    """SQLite ledger of per-message pipeline state.
+
+    Completed message ids are mirrored in a Bloom filter so that the common
+    case, a message never seen before, is answered without touching SQLite.
+    """
+
+    def __init__(self, db_path: str = "message_ledger.db", retention_days: float = 30.0,
+                 bloom_capacity: int = 100000):
+        self.db_path = db_path
+        self.retention_days = retention_days
+        self.bloom_capacity = bloom_capacity
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                mailbox TEXT NOT NULL,
+                msg_id TEXT NOT NULL,
+                steps INTEGER NOT NULL DEFAULT 0,
+                completed INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (mailbox, msg_id)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS messages_by_age ON messages (completed, updated)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS history_cursors (
+                mailbox TEXT PRIMARY KEY,
+                history_id INTEGER NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+        self._rebuild_bloom()
+
+    @staticmethod
+    def _bloom_key(mailbox: str, msg_id: str) -> str:
+        return f"{mailbox}/{msg_id}"
+
+    def _rebuild_bloom(self):
+        """Load every completed message id into a fresh Bloom filter"""
+        with self._lock:
+            rows = self._conn.execute("SELECT mailbox, msg_id FROM messages WHERE completed = 1").fetchall()
+            bloom = BloomFilter(max(self.bloom_capacity, len(rows) * 2))
+            for mailbox, msg_id in rows:
+                bloom.add(self._bloom_key(mailbox, msg_id))
+            self._bloom = bloom
+
+    def get_steps(self, msg_id: str, mailbox: str = "me") -> int:
+        """Get the bitmask of steps already done for a message"""
+        with self._lock:
+            row = self._conn.execute("SELECT steps FROM messages WHERE mailbox = ? AND msg_id = ?",
+                                     (mailbox, msg_id)).fetchone()
+        return row[0] if row else 0
+
+    def has_step(self, msg_id: str, step: int, mailbox: str = "me") -> bool:
+        """Check whether a step was already done for a message"""
+        return bool(self.get_steps(msg_id, mailbox) & step)
+
+    def is_processed(self, msg_id: str, mailbox: str = "me") -> bool:
+        """Check whether a message went through the whole pipeline"""
+        if self._bloom_key(mailbox, msg_id) not in self._bloom:
+            return False
+
+        with self._lock:
+            row = self._conn.execute("SELECT completed FROM messages WHERE mailbox = ? AND msg_id = ?",
+                                     (mailbox, msg_id)).fetchone()
+        return bool(row and row[0])
+
+    def record(self, msg_id: str, step: int, mailbox: str = "me"):
+        """Durably record that a step was done for a message"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO messages (mailbox, msg_id, steps, created, updated) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (mailbox, msg_id) DO UPDATE SET steps = steps | excluded.steps, updated = excluded.updated
+            """, (mailbox, msg_id, step, now, now))
+
+    def complete(self, msg_id: str, mailbox: str = "me"):
+        """Mark a message as fully processed"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO messages (mailbox, msg_id, completed, created, updated) VALUES (?, ?, 1, ?, ?)
+                ON CONFLICT (mailbox, msg_id) DO UPDATE SET completed = 1, updated = excluded.updated
+            """, (mailbox, msg_id, now, now))
+            self._bloom.add(self._bloom_key(mailbox, msg_id))
+
+        if self._bloom.saturated:
+            self._rebuild_bloom()
+
+    def complete_many(self, msg_ids: Iterable[str], step: int = 0, mailbox: str = "me"):
+        """Record a step and mark many messages as fully processed at once"""
+        now = time.time()
+        rows = [(mailbox, msg_id, step, now, now) for msg_id in msg_ids]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("""
+                    INSERT INTO messages (mailbox, msg_id, steps, completed, created, updated) VALUES (?, ?, ?, 1, ?, ?)
+                    ON CONFLICT (mailbox, msg_id) DO UPDATE SET
+                        steps = steps | excluded.steps, completed = 1, updated = excluded.updated
+                """, rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            for _, msg_id, _, _, _ in rows:
+                self._bloom.add(self._bloom_key(mailbox, msg_id))
+
+        if self._bloom.saturated:
+            self._rebuild_bloom()
+
+    def pending(self, step: int, mailbox: Optional[str] = None) -> Iterable[str]:
+        """Message ids that are not completed and still miss a step"""
+        query = "SELECT msg_id FROM messages WHERE completed = 0 AND (steps & ?) = 0"
+        params = [step]
+        if mailbox is not None:
+            query += " AND mailbox = ?"
+            params.append(mailbox)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(query, params).fetchall()]
+
+    def waiting(self, step: int, mailbox: Optional[str] = None) -> Iterable[str]:
+        """Message ids that are not completed but already have a step"""
+        query = "SELECT msg_id FROM messages WHERE completed = 0 AND (steps & ?) != 0"
+        params = [step]
+        if mailbox is not None:
+            query += " AND mailbox = ?"
+            params.append(mailbox)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(query, params).fetchall()]
+
+    def count(self, mailbox: Optional[str] = None) -> int:
+        """Number of completed messages in the ledger"""
+        query = "SELECT COUNT(*) FROM messages WHERE completed = 1"
+        params = []
+        if mailbox is not None:
+            query += " AND mailbox = ?"
+            params.append(mailbox)
+        with self._lock:
+            return self._conn.execute(query, params).fetchone()[0]
+
+    def compact(self, retention_days: Optional[float] = None) -> int:
+        """Drop completed entries older than the retention window.
+
+        Gmail no longer lists these messages as unread, so they cannot come
+        back through the pipeline. Returns the number of entries removed.
+        """
+        days = self.retention_days if retention_days is None else retention_days
+        cutoff = time.time() - days * 86400
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM messages WHERE completed = 1 AND updated < ?",
+                                         (cutoff,)).rowcount
+        if removed:
+            self._rebuild_bloom()
+        return removed
+
+    def checkpoint(self):
+        """Fold the write-ahead log into the database file (e.g. before exit)"""
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def get_history_id(self, mailbox: str = "me") -> Optional[int]:
+        """Last Gmail historyId fully processed for a mailbox"""
+        with self._lock:
+            row = self._conn.execute("SELECT history_id FROM history_cursors WHERE mailbox = ?",
+                                     (mailbox,)).fetchone()
+        return row[0] if row else None
+
+    def set_history_id(self, history_id: int, mailbox: str = "me"):
+        """Advance the history cursor of a mailbox (never moves backwards)"""
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO history_cursors (mailbox, history_id, updated) VALUES (?, ?, ?)
+                ON CONFLICT (mailbox) DO UPDATE SET
+                    history_id = MAX(history_id, excluded.history_id), updated = excluded.updated
+            """, (mailbox, int(history_id), time.time()))
+
+    def describe(self, msg_id: str, mailbox: str = "me") -> dict:
+        """Human-readable state of a message"""
+        steps = self.get_steps(msg_id, mailbox)
+        return {
+            "msg_id": msg_id,
+            "mailbox": mailbox,
+            "steps": [name for bit, name in STEP_NAMES.items() if steps & bit],
+            "completed": self.is_processed(msg_id, mailbox)
+        }
+
+# Shared ledger; holds an open database handle, so it is built per process
+message_ledger = container.register(
+    "message_ledger",
+    lambda: MessageLedger(
+        os.environ.get("MESSAGE_LEDGER_DB", "message_ledger.db"),
+        retention_days=float(os.environ.get("MESSAGE_LEDGER_RETENTION_DAYS", 30))
+    ),
+    fork_safe=False
+)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+MIME Body Extraction for Gmail API messages
+Walks nested multipart payloads, prefers text/plain over stripped text/html,
+decodes base64url incrementally so oversized bodies are cut off before they
+are fully decoded, and honors each part's charset
+"""
+
+import binascii
+import codecs
+import os
+import re
+from html.parser import HTMLParser
+from typing import Dict, Iterator, Optional, Tuple
+
+# Bodies are cut to this many decoded bytes before classification and prompts
+DEFAULT_MAX_BODY_BYTES = int(os.environ.get("MAX_BODY_BYTES", 64 * 1024))
+
+# Base64 characters decoded per step; a multiple of 4 so steps align to quanta
+_CHUNK_CHARS = 16 * 1024
+_URLSAFE_TO_STD = bytes.maketrans(b"-_", b"+/")
+_CHARSET_RE = re.compile(r'charset\s*=\s*"?([^";\s]+)', re.IGNORECASE)
+
+def iter_parts(payload: Dict) -> Iterator[Dict]:
+    """Yield every part of a Gmail payload depth-first, in document order"""
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        yield part
+        stack.extend(reversed(part.get("parts") or []))
+
+def is_attachment(part: Dict) -> bool:
+    """Parts with a filename or Content-Disposition: attachment are not bodies"""
+    if part.get("filename"):
+        return True
+    for header in part.get("headers") or []:
+        if header.get("name", "").lower() == "content-disposition":
+            return header.get("value", "").lower().startswith("attachment")
+    return False
+
+def part_charset(part: Dict, default: str = "utf-8") -> str:
+    """Charset from the part's Content-Type header, if it names a known codec"""
+    for header in part.get("headers") or []:
+        if header.get("name", "").lower() == "content-type":
+            match = _CHARSET_RE.search(header.get("value", ""))
+            if match:
+                try:
+                    return codecs.lookup(match.group(1)).name
+                except LookupError:
+                    break
+    return default
+
+def decode_base64url(data: str, max_bytes: Optional[int] = None) -> Tuple[bytes, bool]:
+    """Decode Gmail's base64url data, stopping once ``max_bytes`` are decoded.
+
+    Works through the encoded text in fixed-size chunks, so a capped decode of
+    a huge body only touches the beginning of it. Returns (bytes, truncated).
+    """
+    out = bytearray()
+    length = len(data)
+    position = 0
+
+    while position < length:
+        if max_bytes is not None and len(out) >= max_bytes:
+            break
+        chunk = data[position:position + _CHUNK_CHARS].encode("ascii").translate(_URLSAFE_TO_STD)
+        position += _CHUNK_CHARS
+        if position >= length:
+            # Gmail strips padding from the final quantum
+            chunk += b"=" * (-len(chunk) % 4)
+        out += binascii.a2b_base64(chunk)
+
+    if max_bytes is not None and len(out) > max_bytes:
+        return bytes(out[:max_bytes]), True
+    return bytes(out), position < length
+
+def decode_text(raw: bytes, charset: str = "utf-8", truncated: bool = False) -> str:
+    """Decode bytes in a charset, dropping a multi-byte character cut in half"""
+    try:
+        decoder = codecs.getincrementaldecoder(charset)(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    return decoder.decode(raw, final=not truncated)
+
+class _HTMLTextExtractor(HTMLParser):
+    """Collects visible text, with line breaks at block elements"""
+
+    BLOCK_TAGS = {"br", "p", "div", "li", "tr", "table", "h1", "h2", "h3", "h4", "h5", "h6",
+                  "blockquote", "pre", "hr", "section", "article", "header", "footer"}
+    SKIP_TAGS = {"script", "style", "head", "title"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.pieces = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self.pieces.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self.BLOCK_TAGS:
+            self.pieces.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.pieces.append(data)
+
+def html_to_text(html: str) -> str:
+    """Strip tags, scripts and styles from HTML, keeping paragraph breaks"""
+    parser = _HTMLTextExtractor()
+    parser.feed(html)
+    parser.close()
+    lines = (" ".join(line.split()) for line in "".join(parser.pieces).splitlines())
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+def find_body_part(payload: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+    """Pick the part holding the message body: text/plain, else text/html"""
+    html_part = None
+    for part in iter_parts(payload):
+        mime_type = (part.get("mimeType") or "").lower()
+        if mime_type not in ("text/plain", "text/html") or is_attachment(part):
+            continue
+        if not (part.get("body") or {}).get("data"):
+            continue
+        if mime_type == "text/plain":
+            return part, mime_type
+        if html_part is None:
+            html_part = part
+    return (html_part, "text/html") if html_part is not None else (None, None)
+
+def extract_body_details(message: Dict, max_bytes: Optional[int] = DEFAULT_MAX_BODY_BYTES) -> Dict:
+    """Body text of a Gmail message plus how it was obtained.
+
+    Returns a dict with text, mime_type, charset and truncated.
+    """
+    part, mime_type = find_body_part(message.get("payload") or {})
+    if part is None:
+        return {"text": "", "mime_type": None, "charset": None, "truncated": False}
+
+    charset = part_charset(part)
+    raw, truncated = decode_base64url(part["body"]["data"], max_bytes)
+    text = decode_text(raw, charset, truncated)
+    if mime_type == "text/html":
+        text = html_to_text(text)
+
+    return {"text": text, "mime_type": mime_type, "charset": charset, "truncated": truncated}
+
+def extract_body(message: Dict, max_bytes: Optional[int] = DEFAULT_MAX_BODY_BYTES) -> str:
+    """Body text of a Gmail message, capped at ``max_bytes`` decoded bytes"""
+    return extract_body_details(message, max_bytes)["text"]
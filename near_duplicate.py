@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Near-Duplicate Reply Reuse
+Recognizes an email that is a near-duplicate of one answered recently (mass
+mailings, reply-all storms) so its reply can be reused with the new sender's
+name instead of generating another one. Bodies are normalized (greetings,
+quotes and signatures removed), reduced to 64-bit SimHash signatures and
+looked up through an LSH band index in a bounded, time-windowed store
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from body_trim import strip_quoted_history, strip_signature
+
+SIGNATURE_BITS = 64
+
+_GREETING_RE = re.compile(r"^\s*(hi|hello|hey|dear|good (morning|afternoon|evening))\b[^\n]{0,60}\n", re.IGNORECASE)
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+def normalize_body(body: str) -> List[str]:
+    """Words of the body without greeting, quoted text and signature"""
+    text = strip_signature(strip_quoted_history((body or "").replace("\r\n", "\n")))
+    text = _GREETING_RE.sub("", text, count=1)
+    return _WORD_RE.findall(text.lower())
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+def simhash(words: List[str], shingle: int = 3) -> int:
+    """64-bit SimHash over word shingles"""
+    if len(words) < shingle:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + shingle]) for i in range(len(words) - shingle + 1)]
+
+    counts = [0] * SIGNATURE_BITS
+    for value in shingles:
+        h = _hash64(value)
+        for bit in range(SIGNATURE_BITS):
+            counts[bit] += 1 if h >> bit & 1 else -1
+
+    signature = 0
+    for bit, count in enumerate(counts):
+        if count > 0:
+            signature |= 1 << bit
+    return signature
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+class _Entry:
+    __slots__ = ("key", "signature", "scope", "reply", "sender_name", "created")
+
+    def __init__(self, key: int, signature: int, scope: str, reply: str, sender_name: str, created: float):
+        self.key = key
+        self.signature = signature
+        self.scope = scope
+        self.reply = reply
+        self.sender_name = sender_name
+        self.created = created
+
+class NearDuplicateIndex:
+    """Recently answered emails, searchable by SimHash distance.
+
+    The signature is split into ``bands`` equal bands; two signatures within
+    ``max_distance`` bits always agree on at least one band as long as
+    ``max_distance < bands``, so candidates come from the band buckets and are
+    confirmed by their exact distance. Entries older than ``window`` seconds,
+    or beyond ``max_entries``, are dropped oldest first. ``scope`` (e.g. the
+    disclosure level) must match for a reply to be reused.
+    """
+
+    def __init__(self, window: float = 86400.0, max_entries: int = 5000, max_distance: int = 3,
+                 bands: int = 4, min_words: int = 8):
+        if SIGNATURE_BITS % bands or max_distance >= bands:
+            raise ValueError("bands must divide 64 and exceed max_distance")
+        self.window = window
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.bands = bands
+        self.band_bits = SIGNATURE_BITS // bands
+        # Very short bodies ("Thanks!") are too generic to match on
+        self.min_words = min_words
+
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: Dict[tuple, set] = {}
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+
+    @classmethod
+    def from_env(cls) -> "NearDuplicateIndex":
+        """Build an index from NEAR_DUP_* environment variables"""
+        return cls(
+            window=float(os.environ.get("NEAR_DUP_WINDOW", 86400)),
+            max_entries=int(os.environ.get("NEAR_DUP_MAX_ENTRIES", 5000)),
+            max_distance=int(os.environ.get("NEAR_DUP_MAX_DISTANCE", 3))
+        )
+
+    def _band_keys(self, signature: int):
+        mask = (1 << self.band_bits) - 1
+        return [(band, signature >> (band * self.band_bits) & mask) for band in range(self.bands)]
+
+    def _remove(self, entry: _Entry):
+        for band_key in self._band_keys(entry.signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(entry.key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def _expire(self, now: float):
+        while self._entries:
+            oldest = next(iter(self._entries.values()))
+            if len(self._entries) <= self.max_entries and now - oldest.created <= self.window:
+                break
+            self._entries.popitem(last=False)
+            self._remove(oldest)
+
+    def signature(self, body: str) -> Optional[int]:
+        """SimHash of a body, or None when it is too short to match on"""
+        words = normalize_body(body)
+        return simhash(words) if len(words) >= self.min_words else None
+
+    def lookup(self, body: str, scope: str = "") -> Optional[_Entry]:
+        """The closest recent entry within ``max_distance``, if any"""
+        signature = self.signature(body)
+        with self._lock:
+            self.lookups += 1
+            if signature is None:
+                return None
+            self._expire(time.time())
+
+            best, best_distance = None, self.max_distance + 1
+            for band_key in self._band_keys(signature):
+                for key in self._buckets.get(band_key, ()):
+                    entry = self._entries[key]
+                    if entry.scope != scope:
+                        continue
+                    distance = hamming(signature, entry.signature)
+                    if distance < best_distance:
+                        best, best_distance = entry, distance
+
+            if best is not None:
+                self.hits += 1
+            return best
+
+    def add(self, body: str, reply: str, sender_name: str = "", scope: str = "") -> bool:
+        """Remember the reply to an email; returns False if the body is too short"""
+        signature = self.signature(body)
+        if signature is None:
+            return False
+
+        now = time.time()
+        with self._lock:
+            entry = _Entry(self._next_key, signature, scope, reply, sender_name, now)
+            self._next_key += 1
+            self._entries[entry.key] = entry
+            for band_key in self._band_keys(signature):
+                self._buckets.setdefault(band_key, set()).add(entry.key)
+            self._expire(now)
+        return True
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "lookups": self.lookups, "hits": self.hits}
+
+def personalize_reply(reply: str, old_name: str, new_name: str) -> str:
+    """Swap the earlier sender's name for the new one in the reply's opening lines"""
+    if not old_name or not new_name or old_name == new_name:
+        return reply
+    head, sep, rest = reply.partition("\n\n")
+    # Greetings often use just the first name
+    for old, new in ((old_name, new_name), (old_name.split()[0], new_name.split()[0])):
+        if old in head:
+            return head.replace(old, new) + sep + rest
+    return reply
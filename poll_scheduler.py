@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Adaptive Polling Scheduler for the email monitor
+Polls quickly while mail is arriving, backs off exponentially (with jitter)
+when the inbox is idle or the Gmail API is failing, honors Retry-After from
+quota errors, and can be woken immediately by a signal or a Unix socket
+"""
+
+import json
+import os
+import random
+import signal
+import socket
+import sys
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional, Set
+
+DEFAULT_SOCKET_PATH = "/tmp/email_monitor.sock"
+
+# 403 reasons that mean throttling; any other 403 (insufficientPermissions,
+# domain policy, ...) is permanent
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+def error_reasons(error: Exception) -> Set[str]:
+    """Reason codes from the body of a Google API HttpError"""
+    reasons = {detail.get("reason") for detail in getattr(error, "error_details", None) or []
+               if isinstance(detail, dict)}
+    try:
+        body = json.loads(getattr(error, "content", None) or b"{}")
+        reasons.update(item.get("reason") for item in body.get("error", {}).get("errors", [])
+                       if isinstance(item, dict))
+    except (AttributeError, TypeError, ValueError):
+        pass
+    reasons.discard(None)
+    return reasons
+
+def is_rate_limited(error: Exception) -> bool:
+    """429, or a 403 whose reason says a rate limit was hit"""
+    status = getattr(getattr(error, "resp", None), "status", None)
+    try:
+        status = int(status)
+    except (TypeError, ValueError):
+        return False
+    return status == 429 or (status == 403 and bool(error_reasons(error) & RATE_LIMIT_REASONS))
+
+def retry_after_from_error(error: Exception) -> Optional[float]:
+    """Extract a Retry-After delay (seconds) from a Gmail HttpError, if any.
+
+    Permanent 403s get no delay, even with a Retry-After header.
+    """
+    resp = getattr(error, "resp", None)
+    if resp is None:
+        return None
+    if str(getattr(resp, "status", "")) == "403" and not is_rate_limited(error):
+        return None
+
+    value = resp.get("retry-after") if hasattr(resp, "get") else None
+    if value is None:
+        # Rate limiting without an explicit hint still deserves a pause
+        return 60.0 if is_rate_limited(error) else None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+class AdaptivePollScheduler:
+    """Decides how long to wait between inbox polls"""
+
+    def __init__(self, min_interval: float = 2.0, base_interval: float = 30.0,
+                 max_idle_interval: float = 900.0, max_error_interval: float = 600.0,
+                 backoff_factor: float = 2.0, jitter: float = 0.2):
+        self.min_interval = min_interval
+        self.base_interval = base_interval
+        self.max_idle_interval = max_idle_interval
+        self.max_error_interval = max_error_interval
+        self.backoff_factor = backoff_factor
+        self.jitter = jitter
+
+        self.interval = base_interval
+        self.consecutive_errors = 0
+        self._retry_after: Optional[float] = None
+        self._wake_event = threading.Event()
+        self._socket_thread = None
+
+    @classmethod
+    def from_env(cls) -> "AdaptivePollScheduler":
+        """Build a scheduler from POLL_* environment variables"""
+        return cls(
+            min_interval=float(os.environ.get("POLL_MIN_INTERVAL", 2)),
+            base_interval=float(os.environ.get("POLL_BASE_INTERVAL", 30)),
+            max_idle_interval=float(os.environ.get("POLL_MAX_IDLE_INTERVAL", 900)),
+            max_error_interval=float(os.environ.get("POLL_MAX_ERROR_INTERVAL", 600)),
+        )
+
+    def record_tick(self, work_found: int):
+        """Adjust the interval after a successful poll"""
+        self.consecutive_errors = 0
+        self._retry_after = None
+
+        if work_found:
+            # Mail is arriving: poll again almost immediately
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_idle_interval,
+                                max(self.interval, self.min_interval) * self.backoff_factor)
+
+    def record_error(self, error: Exception):
+        """Back off after a failed poll, honoring quota hints"""
+        self.consecutive_errors += 1
+        self._retry_after = retry_after_from_error(error)
+        self.interval = min(self.max_error_interval,
+                            self.base_interval * self.backoff_factor ** (self.consecutive_errors - 1))
+
+    def next_delay(self) -> float:
+        """Delay before the next poll, with jitter applied"""
+        delay = self.interval * random.uniform(1.0 - self.jitter, 1.0 + self.jitter)
+        if self._retry_after is not None:
+            delay = max(delay, self._retry_after)
+        return delay
+
+    def wait(self, delay: Optional[float] = None) -> bool:
+        """Sleep until the next poll is due or a wake-up arrives.
+
+        Returns True when woken early by a trigger.
+        """
+        if delay is None:
+            delay = self.next_delay()
+
+        woken = self._wake_event.wait(delay)
+        self._wake_event.clear()
+        if woken:
+            # Someone expects new mail; poll at burst speed
+            self.interval = self.min_interval
+        return woken
+
+    def wake(self):
+        """Trigger an immediate poll"""
+        self._wake_event.set()
+
+    def install_signal_trigger(self, signum: int = signal.SIGUSR1):
+        """Wake on a signal, e.g. ``kill -USR1 <pid>``"""
+        signal.signal(signum, lambda *_: self.wake())
+
+    def start_socket_trigger(self, path: str = DEFAULT_SOCKET_PATH):
+        """Wake whenever a datagram arrives on a Unix socket"""
+        if os.path.exists(path):
+            os.unlink(path)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(path)
+
+        def listen():
+            while True:
+                try:
+                    sock.recv(64)
+                except OSError:
+                    return
+                self.wake()
+
+        self._socket_thread = threading.Thread(target=listen, name="poll-wake-socket", daemon=True)
+        self._socket_thread.start()
+        return sock
+
+def send_wake(path: str = DEFAULT_SOCKET_PATH):
+    """Ask a running monitor to poll now"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        sock.sendto(b"wake", path)
+
+if __name__ == "__main__":
+    # Usage: python poll_scheduler.py [socket_path]
+    send_wake(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SOCKET_PATH)
+    print("⏰ Wake-up sent")
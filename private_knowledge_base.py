@@ -8,6 +8,7 @@ import json
 import os
 from typing import Dict, List, Any, Optional
 from pathlib import Path
+from container import container
 
 class PrivateKnowledgeBase:
     """Manages private employee information with disclosure controls."""
@@ -228,4 +229,4 @@ class PrivateKnowledgeBase:
         return "public"
 
 # Global instance
-private_kb = PrivateKnowledgeBase()
+private_kb = container.register("private_kb", PrivateKnowledgeBase)
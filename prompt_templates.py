@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Compiled Prompt Templates for replies and classification
+Templates are parsed once into literal text and fields. The reply prompt is
+split into a static prefix (persona, instructions, response format) that is
+identical for every email, and variable sections rendered per request, so the
+prefix can be sent as a cached system instruction. Build times and token
+usage are tracked per request
+"""
+
+import json
+import string
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+class PromptTemplate:
+    """A ``str.format`` template parsed once into literals and fields"""
+
+    def __init__(self, template: str):
+        self.template = template
+        self._pieces: List[Tuple[str, Optional[str], str]] = [
+            (literal, field, spec or "")
+            for literal, field, spec, _ in string.Formatter().parse(template)
+        ]
+        self.fields = {field for _, field, _ in self._pieces if field}
+
+    def render(self, **values) -> str:
+        out = []
+        for literal, field, spec in self._pieces:
+            out.append(literal)
+            if field is not None:
+                out.append(format(values[field], spec))
+        return "".join(out)
+
+STATIC_PREFIX = PromptTemplate("""You are {assistant_name}, an {assistant_role} at {company_name}.
+
+Your role is to respond to emails in a professional, helpful, and human-like manner. You have access to company information and tools to provide accurate responses.
+
+INSTRUCTIONS:
+1. Respond in a warm, professional, and human-like tone
+2. Use the sender's name naturally in your response
+3. Provide relevant information based on the inquiry
+4. Respect disclosure levels - only share information appropriate for the level given with each email
+5. Include appropriate contact information when relevant
+6. Forward to appropriate team members when necessary
+7. Maintain conversation flow and context
+8. Be helpful but not overly verbose
+9. Sign your responses as "{assistant_name}"
+
+RESPONSE FORMAT:
+- Use proper email formatting
+- Include appropriate greeting and closing
+- Be conversational but professional
+- Provide clear next steps when applicable
+""")
+
+CONTEXT = PromptTemplate("""COMPANY INFORMATION:
+- Name: {name}
+- Website: {website}
+- Industry: {industry}
+- Mission: {mission}
+
+DISCLOSURE LEVEL: {disclosure_upper}
+Based on the inquiry context, you are authorized to share information at the {disclosure_level} level.
+
+AVAILABLE CONTACTS:
+{contacts}{services}
+POLICIES:
+- Response Time: {response_time}
+- Emergency Contact: {emergency}
+- Privacy: {privacy}
+""")
+
+CONTACT_LINE = PromptTemplate("- {name} ({title}): {email}\n")
+SERVICE_LINE = PromptTemplate("- {name}: {description}\n")
+PRICING_LINE = PromptTemplate("  Pricing: {pricing}\n")
+
+THREAD_SECTION = PromptTemplate("""EARLIER IN THIS THREAD:
+{summary}
+
+""")
+
+USER_PROMPT = PromptTemplate("""Please respond to this email:
+
+FROM: {sender_name}
+SUBJECT: {subject}
+BODY: {body}
+
+Context: This inquiry has been classified as {disclosure_level} disclosure level.
+
+Please provide a helpful, professional response that:
+1. Addresses their specific request
+2. Provides relevant information based on their inquiry
+3. Includes appropriate contact information if needed
+4. Maintains a warm, human-like tone
+5. Respects the disclosure level for this inquiry
+
+Respond as if you are {assistant_name}, the {assistant_role} at {company_name}.""")
+
+CLASSIFY_CATEGORIES = ("sales", "support", "technical", "executive", "hr", "other")
+CLASSIFY_URGENCIES = ("low", "normal", "high", "critical")
+
+CLASSIFY_INSTRUCTIONS = PromptTemplate("""You classify incoming business emails for {company_name}.
+
+For every email you are given, decide:
+- category: one of {categories}
+- urgency: one of {urgencies}
+- requires_reply: true if the sender asked something or expects an answer
+- requires_forwarding: true if a team member should handle the email
+
+Respond with only a JSON array containing one object per email, in the order given:
+[{{"index": 1, "category": "...", "urgency": "...", "requires_reply": true, "requires_forwarding": false}}]
+""")
+
+CLASSIFY_HEADER = PromptTemplate("Classify these {count} emails.\n")
+CLASSIFY_ITEM = PromptTemplate("""
+EMAIL {index}
+FROM: {sender}
+SUBJECT: {subject}
+BODY: {body}
+""")
+
+def classification_prompt(emails: List[Dict[str, str]], max_body_chars: int = 2000) -> str:
+    """Number the emails 1..K so the model's array can be matched back"""
+    items = [CLASSIFY_HEADER.render(count=len(emails))]
+    for index, email in enumerate(emails, 1):
+        items.append(CLASSIFY_ITEM.render(index=index, sender=email.get("sender", ""),
+                                          subject=email.get("subject", ""),
+                                          body=(email.get("body") or "")[:max_body_chars]))
+    return "".join(items)
+
+class ReplyPromptBuilder:
+    """Builds reply prompts from the compiled templates.
+
+    ``static_prefix`` is rendered once. The company/contacts/policies section
+    depends only on the response info, which repeats across emails with the
+    same disclosure level, so rendered sections are kept in a small LRU.
+    """
+
+    def __init__(self, assistant_name: str, assistant_role: str, company_name: str,
+                 max_contexts: int = 32):
+        self.assistant_name = assistant_name
+        self.assistant_role = assistant_role
+        self.company_name = company_name
+        self.max_contexts = max_contexts
+        self.static_prefix = STATIC_PREFIX.render(assistant_name=assistant_name,
+                                                  assistant_role=assistant_role,
+                                                  company_name=company_name)
+        self._contexts: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _render_context(self, response_info: Dict[str, Any]) -> str:
+        disclosure_level = response_info.get("disclosure_level", "standard")
+        company_info = response_info.get("company_info", {})
+        policies = response_info.get("policies", {})
+
+        contacts = "".join(CONTACT_LINE.render(**contact["info"]) for contact in response_info.get("contacts", []))
+
+        services = ""
+        if response_info.get("services"):
+            lines = ["\nAVAILABLE SERVICES:\n"]
+            for service in response_info["services"]:
+                lines.append(SERVICE_LINE.render(name=service["name"], description=service["description"]))
+                if disclosure_level == "high":
+                    lines.append(PRICING_LINE.render(pricing=service.get("pricing", "Contact for pricing")))
+            services = "".join(lines)
+
+        return CONTEXT.render(
+            name=company_info.get("name", self.company_name),
+            website=company_info.get("website", "https://techcorp.com"),
+            industry=company_info.get("industry", "Technology Solutions"),
+            mission=company_info.get("mission", "Empowering businesses with innovative technology solutions"),
+            disclosure_upper=disclosure_level.upper(),
+            disclosure_level=disclosure_level,
+            contacts=contacts,
+            services=services,
+            response_time=policies.get("response_time", "24 hours"),
+            emergency=policies.get("emergency", "Call +1 (555) 911-HELP"),
+            privacy=policies.get("privacy", "Strict confidentiality maintained")
+        )
+
+    def context(self, response_info: Dict[str, Any]) -> str:
+        """Company, disclosure, contacts, services and policies section"""
+        key = json.dumps(response_info, sort_keys=True, default=str)
+        with self._lock:
+            rendered = self._contexts.get(key)
+            if rendered is not None:
+                self._contexts.move_to_end(key)
+                return rendered
+
+        rendered = self._render_context(response_info)
+        with self._lock:
+            self._contexts[key] = rendered
+            while len(self._contexts) > self.max_contexts:
+                self._contexts.popitem(last=False)
+        return rendered
+
+    def variable_prompt(self, response_info: Dict[str, Any], sender_name: str, subject: str, body: str,
+                        thread_summary: str = "") -> str:
+        """Everything after the static prefix for one email, with earlier turns of its thread if known"""
+        user_prompt = USER_PROMPT.render(
+            sender_name=sender_name,
+            subject=subject,
+            body=body,
+            disclosure_level=response_info.get("disclosure_level", "standard"),
+            assistant_name=self.assistant_name,
+            assistant_role=self.assistant_role,
+            company_name=self.company_name
+        )
+        thread = THREAD_SECTION.render(summary=thread_summary) if thread_summary else ""
+        return f"{self.context(response_info)}\n{thread}{user_prompt}"
+
+    def full_prompt(self, response_info: Dict[str, Any], sender_name: str, subject: str, body: str,
+                    thread_summary: str = "") -> str:
+        """Static prefix and variable sections as one prompt"""
+        variable = self.variable_prompt(response_info, sender_name, subject, body, thread_summary)
+        return f"{self.static_prefix}\n{variable}"
+
+class PromptStats:
+    """Prompt build time and token usage, per request and in total"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.build_seconds = 0.0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self.last: Dict[str, Any] = {}
+
+    def record(self, build_seconds: float, response=None) -> Dict[str, Any]:
+        """Record one request; ``response`` is a Gemini response with usage_metadata"""
+        usage = getattr(response, "usage_metadata", None)
+        entry = {
+            "build_ms": round(build_seconds * 1000, 3),
+            "prompt_tokens": getattr(usage, "prompt_token_count", 0) or 0,
+            "cached_tokens": getattr(usage, "cached_content_token_count", 0) or 0,
+            "output_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+            "time": time.time()
+        }
+        with self._lock:
+            self.requests += 1
+            self.build_seconds += build_seconds
+            self.prompt_tokens += entry["prompt_tokens"]
+            self.cached_tokens += entry["cached_tokens"]
+            self.output_tokens += entry["output_tokens"]
+            self.last = entry
+        return entry
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = self.requests or 1
+            return {
+                "requests": self.requests,
+                "avg_build_ms": round(self.build_seconds * 1000 / requests, 3),
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "billed_input_tokens": self.prompt_tokens - self.cached_tokens,
+                "output_tokens": self.output_tokens,
+                "last": dict(self.last)
+            }
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Gmail Push Notification Receiver
+Lightweight HTTP endpoint for Cloud Pub/Sub push subscriptions. Accepts Gmail
+notifications (emailAddress and historyId), drops duplicates and hands them
+to the email monitor, which then fetches the mailbox history incrementally
+"""
+
+import base64
+import json
+import queue
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+# Pub/Sub push bodies are small; anything larger is not a Gmail notification
+MAX_BODY_BYTES = 64 * 1024
+
+class PushNotification:
+    """A decoded Gmail push notification"""
+
+    __slots__ = ("email_address", "history_id", "message_id")
+
+    def __init__(self, email_address: str, history_id: int, message_id: str = ""):
+        self.email_address = email_address
+        self.history_id = history_id
+        self.message_id = message_id
+
+    def __repr__(self) -> str:
+        return f"<PushNotification {self.email_address} history={self.history_id}>"
+
+def parse_push_envelope(envelope: Dict) -> PushNotification:
+    """Decode a Pub/Sub push envelope carrying a Gmail notification.
+
+    Raises ValueError when the envelope is malformed.
+    """
+    try:
+        message = envelope["message"]
+        data = json.loads(base64.b64decode(message["data"]).decode("utf-8"))
+        return PushNotification(
+            email_address=data["emailAddress"].lower(),
+            history_id=int(data["historyId"]),
+            message_id=str(message.get("messageId") or message.get("message_id") or "")
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid push envelope: {e}")
+
+class NotificationDeduplicator:
+    """Drops redelivered and superseded notifications.
+
+    Pub/Sub delivers at least once, so the same messageId can arrive more than
+    once; a notification whose historyId is not newer than one already accepted
+    for the mailbox adds nothing, since the history fetch covers it.
+    """
+
+    def __init__(self, max_message_ids: int = 10000):
+        self.max_message_ids = max_message_ids
+        self._message_ids: "OrderedDict[str, None]" = OrderedDict()
+        self._latest_history: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.duplicates = 0
+
+    def accept(self, notification: PushNotification) -> bool:
+        """Return True if the notification is new"""
+        with self._lock:
+            if notification.message_id:
+                if notification.message_id in self._message_ids:
+                    self.duplicates += 1
+                    return False
+                self._message_ids[notification.message_id] = None
+                while len(self._message_ids) > self.max_message_ids:
+                    self._message_ids.popitem(last=False)
+
+            latest = self._latest_history.get(notification.email_address, 0)
+            if notification.history_id <= latest:
+                self.duplicates += 1
+                return False
+
+            self._latest_history[notification.email_address] = notification.history_id
+            self.accepted += 1
+            return True
+
+class PushReceiver:
+    """HTTP server that queues deduplicated Gmail push notifications"""
+
+    def __init__(self, host: str = "0.0.0.0", port: int = 8085, path: str = "/gmail/push",
+                 verification_token: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.path = path
+        # Shared secret appended to the push endpoint URL as ?token=...
+        self.verification_token = verification_token
+        self.deduplicator = NotificationDeduplicator()
+        self.notifications: "queue.Queue[PushNotification]" = queue.Queue()
+        self._server = None
+        self._thread = None
+
+    def _make_handler(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                url = urlparse(self.path)
+                if url.path != receiver.path:
+                    self._reply(404)
+                    return
+
+                if receiver.verification_token:
+                    token = parse_qs(url.query).get("token", [""])[0]
+                    if token != receiver.verification_token:
+                        self._reply(403)
+                        return
+
+                length = int(self.headers.get("Content-Length") or 0)
+                if length <= 0 or length > MAX_BODY_BYTES:
+                    self._reply(400)
+                    return
+
+                try:
+                    notification = parse_push_envelope(json.loads(self.rfile.read(length)))
+                except ValueError:
+                    self._reply(400)
+                    return
+
+                if receiver.deduplicator.accept(notification):
+                    receiver.notifications.put(notification)
+
+                # Acknowledge duplicates too, otherwise Pub/Sub redelivers them
+                self._reply(204)
+
+            def do_GET(self):
+                if urlparse(self.path).path == "/health":
+                    self._reply(200, b'{"status": "healthy"}')
+                else:
+                    self._reply(404)
+
+            def _reply(self, status: int, body: bytes = b""):
+                self.send_response(status)
+                if body:
+                    self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "PushReceiver":
+        """Start serving in a background thread"""
+        self._server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="push-receiver", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def interrupt(self):
+        """Return from a blocking drain() immediately"""
+        self.notifications.put(None)
+
+    def drain(self, timeout: Optional[float] = None) -> Dict[str, int]:
+        """Wait for notifications and coalesce them per mailbox.
+
+        Returns a mapping of email address to the highest historyId received,
+        or an empty dict if nothing arrived within the timeout.
+        """
+        pending: Dict[str, int] = {}
+        try:
+            notification = self.notifications.get(timeout=timeout)
+        except queue.Empty:
+            return pending
+
+        while True:
+            if notification is None:
+                # interrupt() was called
+                return pending
+            address = notification.email_address
+            pending[address] = max(pending.get(address, 0), notification.history_id)
+            try:
+                notification = self.notifications.get_nowait()
+            except queue.Empty:
+                return pending
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Local Pub/Sub Stand-in for Gmail Push Notifications
+Posts synthetic Gmail notifications to a push receiver, including redelivered
+duplicates, so push mode can be exercised without Google Cloud
+"""
+
+import argparse
+import base64
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+def build_envelope(email_address: str, history_id: int, message_id: str = None) -> dict:
+    """Build a Pub/Sub push envelope the way Cloud Pub/Sub sends it"""
+    data = json.dumps({"emailAddress": email_address, "historyId": history_id}).encode("utf-8")
+    return {
+        "message": {
+            "data": base64.b64encode(data).decode("ascii"),
+            "messageId": message_id or uuid.uuid4().hex,
+            "publishTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        },
+        "subscription": "projects/local/subscriptions/email-processor"
+    }
+
+def post_envelope(url: str, envelope: dict) -> int:
+    """POST an envelope and return the HTTP status"""
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(envelope).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def main():
+    parser = argparse.ArgumentParser(description="Send synthetic Gmail push notifications")
+    parser.add_argument("--url", default="http://localhost:8085/gmail/push")
+    parser.add_argument("--email", default="johnweakagent@gmail.com")
+    parser.add_argument("--start-history-id", type=int, default=1000)
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--interval", type=float, default=0.5, help="Seconds between notifications")
+    parser.add_argument("--duplicate-rate", type=float, default=0.2, help="Fraction of notifications redelivered")
+    args = parser.parse_args()
+
+    print(f"📨 Sending {args.count} notifications to {args.url}")
+    history_id = args.start_history_id
+    statuses = {}
+
+    for _ in range(args.count):
+        history_id += random.randint(1, 5)
+        envelope = build_envelope(args.email, history_id)
+        status = post_envelope(args.url, envelope)
+        statuses[status] = statuses.get(status, 0) + 1
+        print(f"   historyId={history_id} -> {status}")
+
+        if random.random() < args.duplicate_rate:
+            # At-least-once delivery: resend the same Pub/Sub message
+            status = post_envelope(args.url, envelope)
+            statuses[status] = statuses.get(status, 0) + 1
+            print(f"   historyId={history_id} (redelivery) -> {status}")
+
+        time.sleep(args.interval)
+
+    print(f"✅ Done: {statuses}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Per-API-Key Rate Limiting for the Email Assistant API
+Token buckets and concurrency caps per API key and route class, stored in
+SQLite so that every gunicorn worker on the host shares the same limits
+"""
+
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+from container import container
+
+class RouteLimit:
+    """Limits applied to one route class"""
+
+    def __init__(self, rate: float, burst: int, max_concurrency: int):
+        self.rate = rate                        # tokens refilled per second
+        self.burst = burst                      # bucket capacity
+        self.max_concurrency = max_concurrency  # in-flight requests per key
+
+    @classmethod
+    def from_env(cls, route_class: str, rate: float, burst: int, max_concurrency: int) -> "RouteLimit":
+        """Build limits, allowing RATE_LIMIT_<CLASS>_{RATE,BURST,CONCURRENCY} overrides"""
+        prefix = f"RATE_LIMIT_{route_class.upper()}_"
+        return cls(
+            rate=float(os.environ.get(prefix + "RATE", rate)),
+            burst=int(os.environ.get(prefix + "BURST", burst)),
+            max_concurrency=int(os.environ.get(prefix + "CONCURRENCY", max_concurrency))
+        )
+
+# Route classes: cheap reads, LLM-backed calls and Gmail actions
+DEFAULT_LIMITS = {
+    "read": RouteLimit.from_env("read", rate=20.0, burst=40, max_concurrency=20),
+    "llm": RouteLimit.from_env("llm", rate=1.0, burst=5, max_concurrency=4),
+    "action": RouteLimit.from_env("action", rate=0.5, burst=5, max_concurrency=2),
+}
+
+class RateLimitExceeded(Exception):
+    """Raised when a request exceeds its rate or concurrency limit"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        """Retry-After value in whole seconds"""
+        return str(max(1, math.ceil(self.retry_after)))
+
+class RateLimiter:
+    """SQLite-backed token buckets and concurrency leases.
+
+    Every check runs in an IMMEDIATE transaction, so concurrent workers
+    serialize on the database lock and never double-spend a token.
+    """
+
+    def __init__(self, db_path: str = "rate_limits.db", limits: Dict[str, RouteLimit] = None,
+                 lease_ttl: float = 300.0):
+        self.db_path = db_path
+        self.limits = limits or DEFAULT_LIMITS
+        # Leases expire so a crashed worker cannot hold a slot forever
+        self.lease_ttl = lease_ttl
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get this thread's connection to the shared database"""
+        if self._pid != os.getpid():
+            # SQLite connections must not cross a fork; start fresh in the child
+            self._local = threading.local()
+            self._pid = os.getpid()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        """Create the bucket and lease tables"""
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT NOT NULL,
+                route_class TEXT NOT NULL,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (key, route_class)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS leases (
+                lease_id TEXT PRIMARY KEY,
+                key TEXT NOT NULL,
+                route_class TEXT NOT NULL,
+                expires REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS leases_by_key ON leases (key, route_class)")
+
+    @staticmethod
+    def _key_id(api_key: str) -> str:
+        """Identify an API key without storing it in plain text"""
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:24]
+
+    def acquire(self, api_key: str, route_class: str) -> Optional[str]:
+        """Take a token and a concurrency slot for a request.
+
+        Returns a lease id to pass to release(), or None when the route class
+        is not limited. Raises RateLimitExceeded when the request must wait.
+        """
+        limit = self.limits.get(route_class)
+        if limit is None:
+            return None
+
+        key = self._key_id(api_key)
+        now = time.time()
+        conn = self._connect()
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM leases WHERE key = ? AND route_class = ? AND expires < ?",
+                         (key, route_class, now))
+            in_flight = conn.execute("SELECT COUNT(*) FROM leases WHERE key = ? AND route_class = ?",
+                                     (key, route_class)).fetchone()[0]
+            if in_flight >= limit.max_concurrency:
+                raise RateLimitExceeded("Too many concurrent requests", 1.0)
+
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ? AND route_class = ?",
+                               (key, route_class)).fetchone()
+            if row is None:
+                tokens = float(limit.burst)
+            else:
+                tokens = min(float(limit.burst), row[0] + (now - row[1]) * limit.rate)
+
+            if tokens < 1.0:
+                raise RateLimitExceeded("Rate limit exceeded", (1.0 - tokens) / limit.rate)
+
+            conn.execute("INSERT OR REPLACE INTO buckets (key, route_class, tokens, updated) VALUES (?, ?, ?, ?)",
+                         (key, route_class, tokens - 1.0, now))
+
+            lease_id = uuid.uuid4().hex
+            conn.execute("INSERT INTO leases (lease_id, key, route_class, expires) VALUES (?, ?, ?, ?)",
+                         (lease_id, key, route_class, now + self.lease_ttl))
+            conn.execute("COMMIT")
+            return lease_id
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def release(self, lease_id: Optional[str]):
+        """Free the concurrency slot held by a lease"""
+        if lease_id is None:
+            return
+        self._connect().execute("DELETE FROM leases WHERE lease_id = ?", (lease_id,))
+
+# Shared limiter; the database path is shared by all workers on the host.
+# Each worker opens its own connections, so it is not built before forking.
+rate_limiter = container.register(
+    "rate_limiter",
+    lambda: RateLimiter(os.environ.get("RATE_LIMIT_DB", "rate_limits.db")),
+    fork_safe=False
+)
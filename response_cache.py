@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Response Cache for read-only API endpoints
+Caches serialized responses keyed by route, arguments and data versions,
+and provides strong ETags for conditional GET handling
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+class CachedResponse:
+    """A serialized response body together with its strong ETag."""
+
+    __slots__ = ("body", "etag", "status")
+
+    def __init__(self, body: bytes, status: int = 200):
+        self.body = body
+        self.status = status
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """Check an If-None-Match header value against this response's ETag."""
+        if not if_none_match:
+            return False
+
+        for candidate in if_none_match.split(","):
+            candidate = candidate.strip()
+            if candidate == "*" or candidate == self.etag:
+                return True
+        return False
+
+class ResponseCache:
+    """Bounded LRU cache of serialized responses.
+
+    Entries are keyed by route, request arguments and the current data version
+    counters, so a mutation of the underlying data produces a new key and stale
+    entries simply age out of the LRU.
+    """
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(route: str, args: Dict[str, Any], versions: Tuple) -> Tuple:
+        """Build a cache key from a route, its arguments and data versions."""
+        normalized_args = json.dumps(args, sort_keys=True, default=str)
+        return (route, normalized_args, versions)
+
+    def lookup(self, key: Tuple) -> Optional[CachedResponse]:
+        """Return the cached response for key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return entry
+
+    def store(self, key: Tuple, body: bytes, status: int = 200) -> CachedResponse:
+        """Wrap a response body and cache it if it is a 200 response."""
+        entry = CachedResponse(body, status)
+
+        if status == 200:
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        return entry
+
+    def get_or_build(self, key: Tuple, build: Callable[[], Tuple[bytes, int]]) -> CachedResponse:
+        """Return the cached response for key, building it on a miss.
+
+        ``build`` returns ``(body, status)``; only 200 responses are cached.
+        """
+        entry = self.lookup(key)
+        if entry is not None:
+            return entry
+
+        body, status = build()
+        return self.store(key, body, status)
+
+    def clear(self):
+        """Drop all cached responses."""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get cache statistics."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Outbound Send Queue for replies and forwards
+Persists outgoing messages in SQLite and sends them from a small worker pool,
+so a slow or throttled send no longer stalls classification. Sends respect
+per-mailbox rate and daily limits, retry 429/5xx with backoff, and survive a
+restart without being lost or sent twice
+"""
+
+import base64
+import email
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Optional
+from container import container
+from poll_scheduler import is_rate_limited, retry_after_from_error
+from rate_limiter import RateLimiter, RateLimitExceeded, RouteLimit
+
+# Row states
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+# Gmail's per-user sending quota is about 100 quota units per send against
+# 250 units per second, and 500 (consumer) to 2000 (Workspace) messages a day
+SEND_LIMITS = {
+    "send": RouteLimit.from_env("send", rate=2.0, burst=10, max_concurrency=2),
+}
+
+def is_retryable(error: Exception) -> bool:
+    """Network errors, throttling and server errors are worth retrying; other 4xx fail at once"""
+    status = getattr(getattr(error, "resp", None), "status", None)
+    if status is None:
+        return True
+    return int(status) >= 500 or is_rate_limited(error)
+
+class SendQueue:
+    """Durable outbox drained by a pool of sender threads.
+
+    Every message gets an idempotency key (mailbox, source message, kind) so
+    enqueueing the same reply twice is a no-op, and a deterministic
+    Message-ID header. If the process dies while a message is being sent,
+    the next attempt first searches the Sent folder for that Message-ID and
+    only sends when Gmail has no copy.
+    """
+
+    def __init__(self, db_path: str = "send_queue.db", workers: int = 2, max_attempts: int = 8,
+                 daily_limit: int = 2000, limiter: Optional[RateLimiter] = None,
+                 base_backoff: float = 5.0, max_backoff: float = 900.0, claim_ttl: float = 120.0,
+                 retention_days: float = 30.0):
+        self.db_path = db_path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.daily_limit = daily_limit
+        self.limiter = limiter or RateLimiter(os.environ.get("RATE_LIMIT_DB", "rate_limits.db"), SEND_LIMITS)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        # A row claimed longer ago than this belongs to a worker that died
+        self.claim_ttl = claim_ttl
+        self.retention_days = retention_days
+        self._factories: Dict[str, Callable] = {}
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get this thread's connection to the queue database"""
+        if self._pid != os.getpid():
+            self._local = threading.local()
+            self._pid = os.getpid()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbound (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                mailbox TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                message_id TEXT NOT NULL,
+                raw TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                last_error TEXT,
+                gmail_id TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS outbound_due ON outbound (status, next_attempt)")
+        conn.execute("CREATE INDEX IF NOT EXISTS outbound_sent ON outbound (mailbox, status, updated)")
+
+    def register_mailbox(self, mailbox: str, service_factory: Callable):
+        """Let this process send for a mailbox.
+
+        ``service_factory()`` must return a new Gmail service; each sender
+        thread builds its own because service objects are not thread-safe.
+        """
+        self._factories[mailbox] = service_factory
+
+    def _service(self, mailbox: str):
+        services = getattr(self._local, "services", None)
+        if services is None:
+            services = self._local.services = {}
+        if mailbox not in services:
+            services[mailbox] = self._factories[mailbox]()
+        return services[mailbox]
+
+    @staticmethod
+    def _with_message_id(message: Dict, idempotency_key: str):
+        """Stamp a deterministic Message-ID on a {'raw': ...} message"""
+        mime = email.message_from_bytes(base64.urlsafe_b64decode(message["raw"]))
+        message_id = mime.get("Message-ID")
+        if not message_id:
+            digest = hashlib.sha256(idempotency_key.encode("utf-8")).hexdigest()[:32]
+            message_id = f"<{digest}@email-assistant.local>"
+            mime["Message-ID"] = message_id
+        return message_id, base64.urlsafe_b64encode(mime.as_bytes()).decode()
+
+    def enqueue(self, mailbox: str, source_id: str, kind: str, message: Dict) -> bool:
+        """Durably queue a message built by create_message.
+
+        Returns False if the same (mailbox, source_id, kind) was queued before.
+        """
+        key = f"{mailbox}/{source_id}/{kind}"
+        message_id, raw = self._with_message_id(message, key)
+        now = time.time()
+        cursor = self._connect().execute("""
+            INSERT OR IGNORE INTO outbound
+                (idempotency_key, mailbox, kind, message_id, raw, status, next_attempt, created, updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (key, mailbox, kind, message_id, raw, PENDING, now, now, now))
+        self._wakeup.set()
+        return cursor.rowcount == 1
+
+    def _claim(self):
+        """Take the next due row for a registered mailbox, or None"""
+        mailboxes = list(self._factories)
+        if not mailboxes:
+            return None
+
+        now = time.time()
+        placeholders = ",".join("?" * len(mailboxes))
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(f"""
+                SELECT id, mailbox, message_id, raw, status, attempts FROM outbound
+                WHERE mailbox IN ({placeholders}) AND (
+                    (status = ? AND next_attempt <= ?) OR (status = ? AND updated < ?)
+                )
+                ORDER BY next_attempt LIMIT 1
+            """, (*mailboxes, PENDING, now, SENDING, now - self.claim_ttl)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE outbound SET status = ?, updated = ? WHERE id = ?", (SENDING, now, row[0]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row
+
+    def _sent_today(self, mailbox: str) -> int:
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM outbound WHERE mailbox = ? AND status = ? AND updated > ?",
+            (mailbox, SENT, time.time() - 86400)
+        ).fetchone()[0]
+
+    def _reschedule(self, row_id: int, delay: float, error: Optional[str] = None, attempt: bool = False):
+        self._connect().execute("""
+            UPDATE outbound SET status = ?, next_attempt = ?, last_error = COALESCE(?, last_error),
+                attempts = attempts + ?, updated = ? WHERE id = ?
+        """, (PENDING, time.time() + delay, error, 1 if attempt else 0, time.time(), row_id))
+
+    def _finish(self, row_id: int, status: str, gmail_id: Optional[str] = None, error: Optional[str] = None):
+        self._connect().execute(
+            "UPDATE outbound SET status = ?, gmail_id = ?, last_error = COALESCE(?, last_error), updated = ? WHERE id = ?",
+            (status, gmail_id, error, time.time(), row_id)
+        )
+
+    def _already_sent(self, service, message_id: str) -> Optional[str]:
+        """Gmail id of a sent copy with this Message-ID, if one exists"""
+        result = service.users().messages().list(userId='me', q=f"rfc822msgid:{message_id}", includeSpamTrash=True).execute()
+        messages = result.get('messages', [])
+        return messages[0]['id'] if messages else None
+
+    def _process(self, row):
+        row_id, mailbox, message_id, raw, previous_status, attempts = row
+
+        if self._sent_today(mailbox) >= self.daily_limit:
+            print(f"⚠️  Daily send limit reached for {mailbox}, deferring")
+            self._reschedule(row_id, 3600)
+            return
+
+        try:
+            lease = self.limiter.acquire(mailbox, "send")
+        except RateLimitExceeded as e:
+            self._reschedule(row_id, e.retry_after)
+            return
+
+        try:
+            service = self._service(mailbox)
+            if previous_status == SENDING or attempts:
+                # The last attempt may have reached Gmail before failing or crashing
+                gmail_id = self._already_sent(service, message_id)
+                if gmail_id:
+                    self._finish(row_id, SENT, gmail_id)
+                    return
+
+            sent = service.users().messages().send(userId='me', body={'raw': raw}).execute()
+            self._finish(row_id, SENT, sent.get('id'))
+        except Exception as e:
+            if not is_retryable(e) or attempts + 1 >= self.max_attempts:
+                print(f"❌ Giving up on outbound message {row_id} ({mailbox}): {e}")
+                self._finish(row_id, FAILED, error=str(e))
+                return
+
+            delay = retry_after_from_error(e)
+            if delay is None:
+                delay = min(self.max_backoff, self.base_backoff * 2 ** attempts) * random.uniform(0.5, 1.5)
+            print(f"⚠️  Send failed for outbound message {row_id}, retrying in {delay:.0f}s: {e}")
+            self._reschedule(row_id, delay, str(e), attempt=True)
+        finally:
+            self.limiter.release(lease)
+
+    def _worker(self):
+        while not self._stopping.is_set():
+            try:
+                row = self._claim()
+            except sqlite3.OperationalError as e:
+                print(f"⚠️  Send queue busy: {e}")
+                row = None
+
+            if row is None:
+                self._wakeup.wait(1.0)
+                self._wakeup.clear()
+                continue
+
+            self._process(row)
+
+    def start(self) -> "SendQueue":
+        """Start the sender threads (idempotent)"""
+        self._threads = [t for t in self._threads if t.is_alive()]
+        self._stopping.clear()
+        for i in range(len(self._threads), self.workers):
+            thread = threading.Thread(target=self._worker, name=f"send-queue-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout: float = 30.0):
+        """Stop the sender threads after their current message"""
+        self._stopping.set()
+        self._wakeup.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self._threads = [t for t in self._threads if t.is_alive()]
+
+    def pending_count(self, due_only: bool = False) -> int:
+        """Messages still waiting to be sent"""
+        query = "SELECT COUNT(*) FROM outbound WHERE status IN (?, ?)"
+        params = [PENDING, SENDING]
+        if due_only:
+            query += " AND next_attempt <= ?"
+            params.append(time.time())
+        return self._connect().execute(query, params).fetchone()[0]
+
+    def drain(self, timeout: float = 60.0) -> bool:
+        """Wait until nothing is due; returns False on timeout.
+
+        Messages backing off past the deadline stay queued for the next run.
+        """
+        deadline = time.monotonic() + timeout
+        while self.pending_count(due_only=True):
+            if time.monotonic() >= deadline:
+                return False
+            self._wakeup.set()
+            time.sleep(0.2)
+        return True
+
+    def compact(self, retention_days: Optional[float] = None) -> int:
+        """Drop sent and failed rows older than the retention window.
+
+        By default the message ledger keeps answered emails just as long, so
+        a dropped row's reply is not queued again. Returns the number of rows
+        removed.
+        """
+        days = self.retention_days if retention_days is None else retention_days
+        # Today's sent rows count against the daily limit
+        cutoff = time.time() - max(days, 1.0) * 86400
+        return self._connect().execute("DELETE FROM outbound WHERE status IN (?, ?) AND updated < ?",
+                                       (SENT, FAILED, cutoff)).rowcount
+
+    def get_stats(self) -> Dict[str, int]:
+        rows = self._connect().execute("SELECT status, COUNT(*) FROM outbound GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+# Shared outbox; opens a database and starts threads, so it is built per process
+send_queue = container.register(
+    "send_queue",
+    lambda: SendQueue(
+        os.environ.get("SEND_QUEUE_DB", "send_queue.db"),
+        workers=int(os.environ.get("SEND_QUEUE_WORKERS", 2)),
+        max_attempts=int(os.environ.get("SEND_QUEUE_MAX_ATTEMPTS", 8)),
+        daily_limit=int(os.environ.get("SEND_DAILY_LIMIT", 2000)),
+        retention_days=float(os.environ.get("SEND_QUEUE_RETENTION_DAYS", 30))
+    ),
+    fork_safe=False
+)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+JSON Serialization Layer for API and MCP responses
+Uses orjson when it is installed and falls back to the standard library.
+Output is compact by default; pretty-printing is opt-in.
+"""
+
+import json
+import os
+from datetime import date, datetime
+from enum import Enum
+from typing import Any
+from uuid import UUID
+
+try:
+    import orjson
+except ImportError:  # orjson is optional
+    orjson = None
+
+# Name of the active encoder, useful for diagnostics and benchmarks
+ENCODER = "orjson" if orjson is not None else "json"
+
+# Pretty-print responses only when explicitly requested
+PRETTY_DEFAULT = os.environ.get("JSON_PRETTY", "False").lower() == "true"
+
+def _default(obj: Any) -> Any:
+    """Convert values the standard json module cannot encode."""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def _orjson_default(obj: Any) -> Any:
+    """Fallback conversions for types orjson does not handle natively."""
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps_bytes(obj: Any, pretty: bool = None) -> bytes:
+    """Serialize obj to UTF-8 encoded JSON bytes.
+
+    Compact output is produced unless pretty is True, in which case the
+    output is indented by two spaces with sorted keys.
+    """
+    if pretty is None:
+        pretty = PRETTY_DEFAULT
+
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=_orjson_default, option=option)
+        except TypeError:
+            # e.g. integers beyond 64 bits; the stdlib encoder handles these
+            pass
+
+    if pretty:
+        text = json.dumps(obj, indent=2, sort_keys=True, ensure_ascii=False, default=_default)
+    else:
+        text = json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=_default)
+    return text.encode("utf-8")
+
+def dumps(obj: Any, pretty: bool = None) -> str:
+    """Serialize obj to a JSON string."""
+    return dumps_bytes(obj, pretty).decode("utf-8")
+
+def loads(data: Any) -> Any:
+    """Deserialize JSON from str or bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+try:
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:  # Flask is only needed for the web servers
+    DefaultJSONProvider = None
+
+if DefaultJSONProvider is not None:
+    class FastJSONProvider(DefaultJSONProvider):
+        """Flask JSON provider backed by the fast serializer.
+
+        Install with ``app.json = FastJSONProvider(app)`` so that every
+        jsonify call uses compact, unsorted output.
+        """
+
+        sort_keys = False
+
+        def dumps(self, obj: Any, **kwargs: Any) -> str:
+            pretty = True if kwargs.get("indent") else None
+            return dumps(obj, pretty=pretty)
+
+        def loads(self, s: Any, **kwargs: Any) -> Any:
+            return loads(s)
+
+        def response(self, *args: Any, **kwargs: Any):
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Graceful Shutdown Coordination
+On SIGTERM or SIGINT the pipeline stops taking new work, lets in-flight work
+finish within a deadline, then runs the registered hooks in order to flush
+buffers and checkpoint state, so a rolling deploy does not cause reprocessing
+"""
+
+import os
+import signal
+import threading
+import time
+from typing import Callable, List, Tuple
+
+class ShutdownCoordinator:
+    """Process-wide shutdown state.
+
+    Loops check ``requested`` between units of work; sleeping loops register
+    an ``on_request`` listener to be woken; background work started with
+    ``start_thread`` is joined by ``finish`` before the hooks run.
+    """
+
+    def __init__(self, deadline: float = 30.0):
+        self.deadline = deadline
+        self._requested = threading.Event()
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[], None]] = []
+        self._hooks: List[Tuple[str, Callable[[float], None]]] = []
+        self._threads: List[threading.Thread] = []
+        self._signals = 0
+
+    @property
+    def requested(self) -> bool:
+        return self._requested.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Sleep until shutdown is requested; returns True if it was"""
+        return self._requested.wait(timeout)
+
+    def on_request(self, callback: Callable[[], None]):
+        """Call ``callback`` once shutdown is requested (e.g. to wake a sleeper)"""
+        with self._lock:
+            self._listeners.append(callback)
+        if self.requested:
+            callback()
+
+    def add_hook(self, name: str, callback: Callable[[float], None]):
+        """Run ``callback(seconds_left)`` during finish(), in registration order"""
+        with self._lock:
+            self._hooks.append((name, callback))
+
+    def request(self, reason: str = ""):
+        """Stop intake; safe to call more than once and from any thread"""
+        if self._requested.is_set():
+            return
+        self._requested.set()
+        if reason:
+            print(f"🛑 Shutdown requested ({reason}), draining...")
+
+        with self._lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️  Shutdown listener failed: {e}")
+
+    def install_signal_handlers(self, signums=(signal.SIGTERM, signal.SIGINT)):
+        """First signal requests a graceful stop; a second one forces it"""
+        def handler(signum, frame):
+            self._signals += 1
+            if self._signals > 1:
+                raise KeyboardInterrupt
+            self.request(signal.Signals(signum).name)
+
+        for signum in signums:
+            signal.signal(signum, handler)
+
+    def start_thread(self, target: Callable, name: str = None, args=()) -> threading.Thread:
+        """Start non-daemon background work that finish() waits for"""
+        thread = threading.Thread(target=target, name=name, args=args)
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            self._threads.append(thread)
+        thread.start()
+        return thread
+
+    def finish(self, deadline: float = None) -> bool:
+        """Drain in-flight work and run the hooks within ``deadline`` seconds.
+
+        Returns False if something was still running when time ran out.
+        """
+        self.request()
+        end = time.monotonic() + (self.deadline if deadline is None else deadline)
+        clean = True
+
+        with self._lock:
+            threads = [t for t in self._threads if t.is_alive() and t is not threading.current_thread()]
+        for thread in threads:
+            thread.join(max(0.0, end - time.monotonic()))
+            if thread.is_alive():
+                print(f"⚠️  {thread.name} still running at the shutdown deadline")
+                clean = False
+
+        with self._lock:
+            hooks = list(self._hooks)
+            self._hooks = []
+        for name, callback in hooks:
+            # Every hook gets at least a moment, even past the deadline
+            try:
+                callback(max(1.0, end - time.monotonic()))
+            except Exception as e:
+                print(f"⚠️  Shutdown step '{name}' failed: {e}")
+                clean = False
+
+        return clean
+
+def install_pipeline_hooks(coordinator: "ShutdownCoordinator" = None):
+    """Flush forward digests, drain the send queue and checkpoint the ledger"""
+    coordinator = coordinator or shutdown
+    from forward_digest import forward_digest
+    from send_queue import send_queue
+    from message_ledger import message_ledger
+
+    def drain_send_queue(seconds_left: float):
+        if not send_queue.drain(seconds_left):
+            print(f"📤 {send_queue.pending_count()} outbound messages left queued for the next start")
+        send_queue.stop(seconds_left)
+
+    coordinator.add_hook("forward digests", lambda seconds_left: forward_digest.stop(flush=True))
+    coordinator.add_hook("send queue", drain_send_queue)
+    coordinator.add_hook("ledger checkpoint", lambda seconds_left: message_ledger.checkpoint())
+
+# Shared coordinator for the whole process
+shutdown = ShutdownCoordinator(float(os.environ.get("SHUTDOWN_DEADLINE", 30)))
@@ -0,0 +1,20 @@
+"""Regression tests for body trimming before prompting"""
+
+from body_trim import BodyTrimmer, strip_signature
+
+def test_closing_inside_message_keeps_request():
+    body = ("Hi John,\n\nThank you!\n\nCan you send me the report by Friday? "
+            "We need the numbers for order 123.\n\nBest,\nAlice")
+    assert BodyTrimmer(1000).trim(body) == ("Hi John,\n\nThank you!\n\nCan you send me the report by Friday? "
+                                            "We need the numbers for order 123.")
+
+def test_closing_followed_by_prose_is_not_a_signature():
+    body = "Hello,\n\nThanks\nI need pricing for 50 seats"
+    assert strip_signature(body) == body
+
+def test_trailing_signature_block_is_removed():
+    body = "Hi,\n\nPlease send the invoice.\n\nKind regards,\nAlice Smith\nVP Ops | Acme\n+1 555 0100"
+    assert strip_signature(body).strip() == "Hi,\n\nPlease send the invoice."
+
+def test_never_trims_to_greeting_only():
+    assert strip_signature("Hi John,\n\nThanks,\nAlice") == "Hi John,\n\nThanks,\nAlice"
@@ -0,0 +1,39 @@
+"""Regression tests for hedged requests"""
+
+import asyncio
+import threading
+import time
+
+from hedging import HedgedCaller
+
+def test_queue_wait_does_not_trigger_hedges():
+    caller = HedgedCaller("test", hedge_after=0.05, workers=2, max_hedge_rate=1.0)
+    busy = [threading.Thread(target=caller.call, args=(lambda timeout: time.sleep(0.3),)) for _ in range(2)]
+    for thread in busy:
+        thread.start()
+    time.sleep(0.02)
+
+    # Queued behind the busy workers for longer than the hedge delay, but quick once running
+    assert caller.call(lambda timeout: time.sleep(0.02) or "done") == "done"
+    for thread in busy:
+        thread.join()
+    assert caller.get_stats()["hedges"] == 0
+
+def test_hedges_are_capped_to_the_max_rate():
+    caller = HedgedCaller("test", hedge_after=0.005, max_hedge_rate=0.05)
+    for _ in range(60):
+        caller.call(lambda timeout: time.sleep(0.01))
+    assert caller.get_stats()["hedges"] <= 1 + 60 * 0.05
+
+def test_async_hedges_are_capped_to_the_max_rate():
+    caller = HedgedCaller("test", hedge_after=0.005, max_hedge_rate=0.05)
+
+    async def attempt(timeout):
+        await asyncio.sleep(0.01)
+
+    async def run():
+        for _ in range(60):
+            await caller.call_async(attempt)
+
+    asyncio.run(run())
+    assert caller.get_stats()["hedges"] <= 1 + 60 * 0.05
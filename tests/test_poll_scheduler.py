@@ -0,0 +1,38 @@
+"""Regression tests for telling Gmail throttling from permanent errors"""
+
+import json
+
+from poll_scheduler import is_rate_limited, retry_after_from_error
+from send_queue import is_retryable
+
+class FakeResponse(dict):
+    def __init__(self, status, headers=None):
+        super().__init__(headers or {})
+        self.status = status
+
+class FakeHttpError(Exception):
+    def __init__(self, status, reason=None, headers=None):
+        super().__init__(f"HTTP {status}")
+        self.resp = FakeResponse(status, headers)
+        errors = [{"reason": reason}] if reason else []
+        self.content = json.dumps({"error": {"code": status, "errors": errors}}).encode()
+
+def test_permanent_403_is_not_throttling():
+    for reason in ("insufficientPermissions", "domainPolicy", None):
+        error = FakeHttpError(403, reason)
+        assert not is_rate_limited(error)
+        assert retry_after_from_error(error) is None
+        assert not is_retryable(error)
+
+def test_rate_limited_403_is_retried():
+    for reason in ("rateLimitExceeded", "userRateLimitExceeded"):
+        error = FakeHttpError(403, reason)
+        assert retry_after_from_error(error) == 60.0
+        assert is_retryable(error)
+
+def test_429_and_retry_after_header():
+    assert retry_after_from_error(FakeHttpError(429)) == 60.0
+    assert retry_after_from_error(FakeHttpError(429, headers={"retry-after": "7"})) == 7.0
+    assert retry_after_from_error(FakeHttpError(403, "insufficientPermissions", {"retry-after": "7"})) is None
+    assert is_retryable(FakeHttpError(503))
+    assert not is_retryable(FakeHttpError(400))
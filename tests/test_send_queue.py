@@ -0,0 +1,21 @@
+"""Regression tests for the outbound send queue"""
+
+import time
+
+from rate_limiter import RateLimiter
+from send_queue import FAILED, PENDING, SEND_LIMITS, SENT, SendQueue
+
+def test_compact_drops_only_old_finished_rows(tmp_path):
+    queue = SendQueue(str(tmp_path / "send_queue.db"), retention_days=30,
+                      limiter=RateLimiter(str(tmp_path / "rate_limits.db"), SEND_LIMITS))
+    old = time.time() - 31 * 86400
+    conn = queue._connect()
+    for key, status, updated in [("old-sent", SENT, old), ("old-failed", FAILED, old),
+                                 ("old-pending", PENDING, old), ("new-sent", SENT, time.time())]:
+        conn.execute("INSERT INTO outbound (idempotency_key, mailbox, kind, message_id, raw, status, "
+                     "next_attempt, created, updated) VALUES (?, 'me', 'reply', '<id>', '', ?, 0, ?, ?)",
+                     (key, status, updated, updated))
+
+    assert queue.compact() == 2
+    remaining = {row[0] for row in conn.execute("SELECT idempotency_key FROM outbound")}
+    assert remaining == {"old-pending", "new-sent"}
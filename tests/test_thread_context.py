@@ -0,0 +1,29 @@
+"""Regression tests for the per-thread context cache"""
+
+from thread_context import ThreadContextCache
+
+HIGH = {"disclosure_level": "high", "contacts": ["partner desk"]}
+STANDARD = {"disclosure_level": "standard", "contacts": ["support"]}
+INTENT = {"category": "sales", "urgency": "low", "requires_reply": True, "requires_forwarding": False}
+
+def test_other_disclosure_level_is_not_reused():
+    cache = ThreadContextCache()
+    cache.remember_intent("me", "t1", INTENT, HIGH)
+    cache.remember_turn("me", "t1", "Pat", "Pricing for the partner deal?", "Here are the partner rates.", HIGH)
+
+    assert cache.get("me", "t1", "high").response_info is HIGH
+    assert cache.get("me", "t1", "standard") is None
+
+    # An outside follow-up rebuilds the entry without what was kept for the partner
+    cache.remember_intent("me", "t1", INTENT, STANDARD)
+    context = cache.get("me", "t1", "standard")
+    assert context.response_info is STANDARD
+    assert context.turns == []
+    assert cache.get("me", "t1", "high") is None
+
+def test_thread_ids_are_scoped_to_their_mailbox():
+    cache = ThreadContextCache()
+    cache.remember_intent("sales@example.com", "t1", INTENT, STANDARD)
+
+    assert cache.get("sales@example.com", "t1", "standard") is not None
+    assert cache.get("support@example.com", "t1", "standard") is None
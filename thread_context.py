@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Thread Context Cache for follow-up emails
+Keeps, per mailbox and Gmail thread, the classification of its first email,
+the response info (disclosure level, selected contacts) used to answer it and
+a compact summary of the turns so far. Follow-ups in the same thread reuse
+them instead of classifying and looking everything up again, but only when
+their sender resolves to the same disclosure level. Entries are
+evicted least recently used first, after a TTL, and when the estimated
+memory use passes a bound
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from body_trim import strip_quoted_history, strip_signature
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def summarize_turn(text: str, max_chars: int = 200) -> str:
+    """One line for a message: its own text, without quotes or signature, clipped"""
+    text = strip_signature(strip_quoted_history((text or "").replace("\r\n", "\n")))
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    return text if len(text) <= max_chars else text[:max_chars].rsplit(" ", 1)[0] + " ..."
+
+class ThreadContext:
+    """What is known about one thread"""
+
+    __slots__ = ("key", "disclosure_level", "intent", "response_info", "turns", "updated", "size")
+
+    def __init__(self, key: Tuple[str, str]):
+        self.key = key
+        # Level the cached intent, response info and turns were produced for
+        self.disclosure_level: Optional[str] = None
+        self.intent: Optional[Dict[str, Any]] = None
+        self.response_info: Optional[Dict[str, Any]] = None
+        self.turns: List[str] = []
+        self.updated = time.time()
+        self.size = 0
+
+    def reusable(self, disclosure_level: str) -> bool:
+        """Whether a sender at ``disclosure_level`` may be given what is cached.
+
+        A different level (e.g. an outside sender replying on a thread a
+        partner started) must not see contacts, pricing or earlier replies
+        chosen for another level.
+        """
+        return self.disclosure_level == disclosure_level
+
+    def _set_level(self, response_info: Dict[str, Any]):
+        level = response_info.get("disclosure_level", "standard")
+        if level != self.disclosure_level:
+            # Everything cached so far was produced for the old level
+            self.disclosure_level = level
+            self.intent = None
+            self.turns = []
+        self.response_info = response_info
+
+    def summary(self) -> str:
+        return "\n".join(self.turns)
+
+    def estimate_size(self) -> int:
+        """Approximate bytes held, from the JSON size of the cached values"""
+        payload = [self.key, self.disclosure_level, self.intent, self.response_info, self.turns]
+        return len(json.dumps(payload, default=str)) + 200
+
+class ThreadContextCache:
+    """LRU of ThreadContext keyed by (mailbox, Gmail threadId).
+
+    Contexts older than ``ttl`` seconds since their last update are dropped
+    on access; least recently used ones go first once there are more than
+    ``max_entries`` or they hold more than ``max_bytes`` together. Only the
+    last ``max_turns`` turns are summarized.
+    """
+
+    def __init__(self, max_entries: int = 2000, ttl: float = 86400.0, max_bytes: int = 16 * 1024 * 1024,
+                 max_turns: int = 6):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_turns = max_turns
+
+        self._contexts: "OrderedDict[Tuple[str, str], ThreadContext]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "level_mismatches": 0, "evictions": 0, "expired": 0}
+
+    @classmethod
+    def from_env(cls) -> "ThreadContextCache":
+        """Build a cache from THREAD_CACHE_* environment variables"""
+        return cls(
+            max_entries=int(os.environ.get("THREAD_CACHE_MAX_ENTRIES", 2000)),
+            ttl=float(os.environ.get("THREAD_CACHE_TTL", 86400)),
+            max_bytes=int(os.environ.get("THREAD_CACHE_MAX_MB", 16)) * 1024 * 1024
+        )
+
+    def _drop(self, key: Tuple[str, str]):
+        context = self._contexts.pop(key)
+        self._bytes -= context.size
+
+    def _evict(self):
+        while self._contexts and (len(self._contexts) > self.max_entries or self._bytes > self.max_bytes):
+            self._drop(next(iter(self._contexts)))
+            self.stats["evictions"] += 1
+
+    def get(self, mailbox: str, thread_id: str, disclosure_level: str) -> Optional[ThreadContext]:
+        """The live context of a thread, or None if there is none or it was built for another level"""
+        if not thread_id:
+            return None
+        key = (mailbox, thread_id)
+        with self._lock:
+            context = self._contexts.get(key)
+            if context is not None and time.time() - context.updated > self.ttl:
+                self._drop(key)
+                self.stats["expired"] += 1
+                context = None
+            if context is None:
+                self.stats["misses"] += 1
+                return None
+            self._contexts.move_to_end(key)
+            if not context.reusable(disclosure_level):
+                self.stats["level_mismatches"] += 1
+                return None
+            self.stats["hits"] += 1
+            return context
+
+    def _update(self, mailbox: str, thread_id: str, change):
+        if not thread_id:
+            return
+        key = (mailbox, thread_id)
+        with self._lock:
+            context = self._contexts.get(key)
+            if context is None:
+                context = self._contexts[key] = ThreadContext(key)
+            self._contexts.move_to_end(key)
+            change(context)
+            context.updated = time.time()
+            self._bytes -= context.size
+            context.size = context.estimate_size()
+            self._bytes += context.size
+            self._evict()
+
+    def remember_intent(self, mailbox: str, thread_id: str, intent: Dict[str, Any], response_info: Dict[str, Any]):
+        """Keep the thread's classification and response info, unless it has them for this level"""
+        def change(context):
+            context._set_level(response_info)
+            if context.intent is None:
+                context.intent = dict(intent)
+        self._update(mailbox, thread_id, change)
+
+    def remember_turn(self, mailbox: str, thread_id: str, sender_name: str, body: str, reply: str,
+                      response_info: Dict[str, Any]):
+        """Add an answered email and its reply to the thread's summary"""
+        def change(context):
+            context._set_level(response_info)
+            context.turns.append(f"- {sender_name or 'Sender'}: {summarize_turn(body)}")
+            if reply:
+                context.turns.append(f"- We replied: {summarize_turn(reply)}")
+            del context.turns[:-2 * self.max_turns]
+        self._update(mailbox, thread_id, change)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, entries=len(self._contexts), bytes=self._bytes)
@@ -4,16 +4,16 @@ Web API for Email Assistant
 This creates a REST API that Gemini can interact with
 """
 
-from flask import Flask, request, jsonify
-import os
+from flask import Flask, request, jsonify, stream_with_context
 import json
 from email_assistant import process_emails, get_gmail_service
 from ai_assistant import ai_assistant
+from serialization import FastJSONProvider
+from api_handlers import sse_event, SSE_HEADERS
+from shutdown import shutdown
 
 app = Flask(__name__)
-
-# Initialize AI assistant
-ai_assistant.initialize_gemini(os.environ.get("GEMINI_API_KEY"))
+app.json = FastJSONProvider(app)
 
 @app.route('/api/process-emails', methods=['POST'])
 def process_emails_endpoint():
@@ -52,6 +52,26 @@ def generate_reply_endpoint():
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/generate-reply/stream', methods=['POST'])
+def generate_reply_stream_endpoint():
+    """Stream a reply for an email as Server-Sent Events"""
+    try:
+        data = request.get_json()
+        sender = data.get('sender', '')
+        subject = data.get('subject', '')
+        body = data.get('body', '')
+        
+        def events():
+            parts = []
+            for chunk in ai_assistant.stream_intelligent_reply(sender, subject, body):
+                parts.append(chunk)
+                yield sse_event('token', {"text": chunk})
+            yield sse_event('done', {"status": "success", "reply": "".join(parts)})
+        
+        return app.response_class(stream_with_context(events()), mimetype='text/event-stream', headers=SSE_HEADERS)
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -70,6 +90,7 @@ def get_capabilities():
             "POST /api/process-emails",
             "POST /api/analyze-email",
             "POST /api/generate-reply",
+            "POST /api/generate-reply/stream",
             "GET /api/health",
             "GET /api/capabilities"
         ]
@@ -82,7 +103,12 @@ if __name__ == '__main__':
     print("   POST /api/process-emails")
     print("   POST /api/analyze-email")
     print("   POST /api/generate-reply")
+    print("   POST /api/generate-reply/stream")
     print("   GET /api/health")
     print("   GET /api/capabilities")
     
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    try:
+        app.run(host='0.0.0.0', port=5001, debug=True)
+    finally:
+        # Drain and stop the send queue process_emails left running
+        shutdown.finish()